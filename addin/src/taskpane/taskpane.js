@@ -13,6 +13,8 @@ let selectedStudentClassId = null;
 let availableQuestions = [];
 let selectedQuestion = null;
 let myAnswers = [];
+let myAnswersCursor = null; // Delta cursor for the student's answer list
+let myAnswersClassId = null;
 let reviewClasses = [];
 let selectedReviewClassId = null;
 let reviewQuestions = [];
@@ -27,6 +29,11 @@ let isAutoRefreshEnabled = false;
 let autoRefreshInterval = null;
 let currentSlideInfo = {};
 let studentAutoRefreshInterval = null; // Auto-refresh for student answers
+let liveAnswers = [];
+let liveAnswersCursor = null; // Delta cursor for the live answers list
+let liveAnswersQuestionId = null;
+let liveAnswersEventSource = null; // Server-Sent Events stream for live answers
+let studentEventSource = null; // Server-Sent Events stream for the student's own answers
 const API_BASE = 'http://localhost:8000/api';
 
 // JWT token decoder
@@ -44,6 +51,26 @@ function decodeJWT(token) {
     }
 }
 
+// Pick a resized derivative (thumb, slide, ...) of an image, falling back to the original.
+// Media URLs come signed by the server, as <img> requests cannot send the Authorization header.
+function imageUrlForSize(item, size) {
+    return (item.image_urls && item.image_urls[size]) || item.image_url;
+}
+
+// A short-lived URL signed for the current user, for requests that cannot
+// send the Authorization header (EventSource, downloads)
+async function signedUrl(url) {
+    const response = await fetchWithAuth(`${API_BASE}/signed-urls/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ url })
+    });
+    if (!response.ok) {
+        throw new Error('Could not sign URL');
+    }
+    return (await response.json()).url;
+}
+
 // Determine user type based on username
 function determineUserType(username) {
     // Simple rule: if username starts with 'student', it's a student
@@ -155,6 +182,12 @@ function initializeEventListeners() {
         questionForm.addEventListener('submit', handleQuestionSubmit);
     }
     
+    // Slide deck import
+    const importDeckForm = document.getElementById('form-import-deck');
+    if (importDeckForm) {
+        importDeckForm.addEventListener('submit', handleImportDeck);
+    }
+    
     // Class selector
     const classSelect = document.getElementById('select-class');
     if (classSelect) {
@@ -213,6 +246,11 @@ function initializeEventListeners() {
         reviewClassSelect.addEventListener('change', handleReviewClassChange);
     }
     
+    const exportAnswersBtn = document.getElementById('btn-export-answers');
+    if (exportAnswersBtn) {
+        exportAnswersBtn.addEventListener('click', handleExportAnswers);
+    }
+    
     // PowerPoint functionality
     const powerpointClassSelect = document.getElementById('powerpoint-class-select');
     if (powerpointClassSelect) {
@@ -541,7 +579,7 @@ function displayQuestions(questions) {
     container.innerHTML = questions.map(question => `
         <div class="question-item">
             <div class="question-text">${question.question_text}</div>
-            ${question.image_url ? `<div class="question-image"><img src="${question.image_url}" alt="Question image" class="question-thumbnail"></div>` : ''}
+            ${question.image_url ? `<div class="question-image"><img src="${imageUrlForSize(question, 'thumb')}" alt="Question image" class="question-thumbnail"></div>` : ''}
             <div class="question-meta">
                 <span class="question-date">${new Date(question.created_at).toLocaleString()}</span>
             </div>
@@ -641,6 +679,64 @@ async function handleQuestionSubmit(event) {
     }
 }
 
+async function handleImportDeck(event) {
+    event.preventDefault();
+    
+    if (!checkAuth()) return;
+    
+    if (!selectedClassId) {
+        showStatus('Please select a class.', 'error');
+        return;
+    }
+    
+    const files = Array.from(document.getElementById('deck-files').files);
+    if (files.length === 0) {
+        showStatus('Please choose slide images or a ZIP file.', 'error');
+        return;
+    }
+    
+    // A single ZIP is sent as the archive; otherwise every image is a slide, ordered by filename
+    const formData = new FormData();
+    formData.append('class_id', selectedClassId);
+    const archive = files.find(file => file.name.toLowerCase().endsWith('.zip'));
+    if (archive) {
+        formData.append('archive', archive);
+    } else {
+        files
+            .sort((a, b) => a.name.localeCompare(b.name, undefined, { numeric: true }))
+            .forEach(file => formData.append('images', file));
+    }
+    
+    const importBtn = document.getElementById('btn-import-deck');
+    const originalText = importBtn.textContent;
+    importBtn.textContent = 'Importing...';
+    importBtn.disabled = true;
+    
+    try {
+        const response = await fetchWithAuth(`${API_BASE}/questions/import/`, {
+            method: 'POST',
+            body: formData
+        });
+        const result = await response.json();
+        
+        if (!response.ok) {
+            const details = (result.slides || []).map(slide => `${slide.filename}: ${slide.error}`).join('; ');
+            throw new Error(details ? `${result.error} (${details})` : (result.error || 'Failed to import slides'));
+        }
+        
+        showStatus(`Imported ${result.ids.length} slide(s) as questions.`, 'success');
+        document.getElementById('form-import-deck').reset();
+        lastDisplayedQuestions = null;
+        loadQuestions(selectedClassId);
+    } catch (error) {
+        console.error('Error importing slides:', error);
+        showStatus('Error importing slides: ' + error.message, 'error');
+    } finally {
+        importBtn.textContent = originalText;
+        importBtn.disabled = false;
+    }
+}
+
 function setActiveTab(tabName) {
     console.log(`Switching to ${tabName} tab`);
     
@@ -841,7 +937,7 @@ function displayAvailableQuestions(questions) {
     container.innerHTML = questions.map(question => `
         <div class="question-item clickable" data-question-id="${question.id}">
             <div class="question-text">${question.question_text}</div>
-            ${question.image_url ? `<div class="question-image"><img src="${question.image_url}" alt="Question image" class="question-thumbnail"></div>` : ''}
+            ${question.image_url ? `<div class="question-image"><img src="${imageUrlForSize(question, 'thumb')}" alt="Question image" class="question-thumbnail"></div>` : ''}
             <div class="question-meta">
                 <span class="question-date">${new Date(question.created_at).toLocaleString()}</span>
                 <button class="btn-answer" data-question-id="${question.id}">Answer This Question</button>
@@ -867,7 +963,7 @@ function selectQuestion(questionId) {
         
         const imageDisplay = document.getElementById('selected-question-image');
         if (selectedQuestion.image_url) {
-            imageDisplay.innerHTML = `<img src="${selectedQuestion.image_url}" alt="Question image" class="question-display-image">`;
+            imageDisplay.innerHTML = `<img src="${imageUrlForSize(selectedQuestion, 'slide')}" alt="Question image" class="question-display-image">`;
         } else {
             imageDisplay.innerHTML = '';
         }
@@ -926,7 +1022,6 @@ async function handleAnswerSubmit(event) {
         return;
     }
     
-    const formData = new FormData();
     const imageFile = document.getElementById('answer-image').files[0];
     
     if (!imageFile) {
@@ -934,9 +1029,6 @@ async function handleAnswerSubmit(event) {
         return;
     }
     
-    formData.append('question_id', selectedQuestion.id);
-    formData.append('image', imageFile);
-    
     const submitBtn = document.getElementById('btn-submit-answer');
     const originalText = submitBtn.textContent;
     
@@ -945,9 +1037,14 @@ async function handleAnswerSubmit(event) {
     submitBtn.disabled = true;
     
     try {
-        const response = await fetchWithAuth(`${API_BASE}/student/submit-answer/`, {
+        // Upload in resumable chunks, then attach the file to a new answer
+        const sessionId = await uploadInChunks(imageFile, (sent) => {
+            submitBtn.textContent = `Uploading... ${Math.round(100 * sent / imageFile.size)}%`;
+        });
+        const response = await fetchWithAuth(`${API_BASE}/uploads/${sessionId}/finalize/`, {
             method: 'POST',
-            body: formData
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ target: 'answer', question_id: selectedQuestion.id })
         });
         
         if (response.ok) {
@@ -964,7 +1061,7 @@ async function handleAnswerSubmit(event) {
             loadMyAnswers(selectedStudentClassId);
         } else {
             const errorData = await response.json();
-            throw new Error(errorData.detail || 'Failed to submit answer');
+            throw new Error(errorData.error || errorData.detail || 'Failed to submit answer');
         }
     } catch (error) {
         console.error('Error submitting answer:', error);
@@ -975,23 +1072,101 @@ async function handleAnswerSubmit(event) {
     }
 }
 
+// Apply a delta response ({results, deleted, cursor, reset}) to a local answer
+// list by id; a reset delta (sent for an expired cursor) replaces the list
+function mergeAnswerDelta(answers, delta) {
+    const removed = new Set(delta.deleted);
+    delta.results.forEach(answer => removed.add(answer.id));
+    
+    return (delta.reset ? [] : answers)
+        .filter(answer => !removed.has(answer.id))
+        .concat(delta.results)
+        .sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
+}
+
+// Whether a delta changes a local answer list. Each poll repeats the last
+// few seconds of changes (see answer_delta_response), which are skipped here.
+function answerDeltaChanges(answers, delta) {
+    if (delta.reset) return true;
+    const known = new Map(answers.map(answer => [answer.id, answer]));
+    return delta.deleted.some(id => known.has(id))
+        || delta.results.some(answer => {
+            const current = known.get(answer.id);
+            return !current || current.liked !== answer.liked || current.status !== answer.status;
+        });
+}
+
+// Upload a file through the chunked upload API, resuming from the server's
+// offset after a failed chunk. Returns the upload session id to finalize.
+const UPLOAD_CHUNK_SIZE = 256 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
+
+async function uploadInChunks(file, onProgress) {
+    const response = await fetchWithAuth(`${API_BASE}/uploads/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || Object.values(errorData).flat().join(' ') || 'Failed to start upload');
+    }
+    const session = await response.json();
+    
+    let offset = session.offset;
+    let retries = 0;
+    while (offset < file.size) {
+        try {
+            const chunkResponse = await fetchWithAuth(`${API_BASE}/uploads/${session.id}/?offset=${offset}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+            });
+            const result = await chunkResponse.json();
+            if (!chunkResponse.ok && chunkResponse.status !== 409) {
+                throw new Error(result.error || 'Failed to upload chunk');
+            }
+            // On success or an offset mismatch, continue from where the server is
+            offset = result.offset;
+            retries = 0;
+            if (onProgress) onProgress(offset);
+        } catch (error) {
+            if (++retries > UPLOAD_MAX_RETRIES) throw error;
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            // Ask the server how much it has before resuming
+            const statusResponse = await fetchWithAuth(`${API_BASE}/uploads/${session.id}/`);
+            if (statusResponse.ok) {
+                offset = (await statusResponse.json()).offset;
+            }
+        }
+    }
+    
+    return session.id;
+}
+
 async function loadMyAnswers(classId) {
     console.log('loadMyAnswers called with classId:', classId);
     try {
-        const response = await fetchWithAuth(`${API_BASE}/student/answers/?class_id=${classId}`);
+        // Start over when switching classes
+        if (myAnswersClassId !== classId) {
+            myAnswersClassId = classId;
+            myAnswersCursor = null;
+            myAnswers = [];
+        }
+        
+        const response = await fetchWithAuth(`${API_BASE}/student/answers/?class_id=${classId}&since=${myAnswersCursor || ''}`);
         
         if (response.ok) {
-            const newAnswers = await response.json();
-            console.log('My answers loaded:', newAnswers);
+            const delta = await response.json();
+            const isFirstLoad = myAnswersCursor === null;
+            myAnswersCursor = delta.cursor;
             
-            // Check if any answers have changed (for debugging)
-            const hasChanges = JSON.stringify(newAnswers) !== JSON.stringify(myAnswers);
-            if (hasChanges) {
+            // Only redraw when something changed since the last poll
+            if (isFirstLoad || answerDeltaChanges(myAnswers, delta)) {
                 console.log('Answers have changed, updating display');
+                myAnswers = mergeAnswerDelta(myAnswers, delta);
+                displayMyAnswers(myAnswers);
             }
-            
-            myAnswers = newAnswers;
-            displayMyAnswers(myAnswers);
         } else {
             const errorData = await response.json();
             throw new Error(errorData.error || 'Failed to load answers');
@@ -1018,7 +1193,7 @@ function displayMyAnswers(answers) {
                     ${answer.liked ? '❤️ Liked by instructor' : '⏳ Pending review'}
                 </span>
             </div>
-            ${answer.image_url ? `<div class="answer-image"><img src="${answer.image_url}" alt="Answer image" class="answer-thumbnail"></div>` : ''}
+            ${answer.image_url ? `<div class="answer-image"><img src="${imageUrlForSize(answer, 'thumb')}" alt="Answer image" class="answer-thumbnail"></div>` : ''}
         </div>
     `).join('');
 }
@@ -1035,10 +1210,109 @@ function showStudentStatus(message, type) {
     }, 5000);
 }
 
+// Open a Server-Sent Events stream of answer events. onDelta receives each
+// event as a {results, deleted} delta; onOpen runs on every (re)connect so
+// the caller can catch up on anything missed; onFallback runs if streaming
+// is unavailable so the caller can go back to polling: when the server
+// refuses the stream (e.g. 501 from a WSGI server) or it has not opened
+// within EVENT_STREAM_OPEN_TIMEOUT. Returns a handle to close() the stream.
+const EVENT_STREAM_OPEN_TIMEOUT = 10000;
+
+function openAnswerEventStream(url, handlers) {
+    if (typeof EventSource === 'undefined') {
+        handlers.onFallback();
+        return null;
+    }
+    
+    const stream = {
+        source: null,
+        closed: false,
+        close() {
+            this.closed = true;
+            if (this.source) this.source.close();
+        }
+    };
+    connectAnswerEventStream(stream, url, handlers);
+    return stream;
+}
+
+async function connectAnswerEventStream(stream, url, { onDelta, onOpen, onFallback }) {
+    let streamUrl;
+    try {
+        streamUrl = await signedUrl(url);
+    } catch (error) {
+        if (!stream.closed) onFallback();
+        return;
+    }
+    // Closed by the caller while the URL was being signed
+    if (stream.closed) return;
+    
+    const source = new EventSource(streamUrl);
+    stream.source = source;
+    
+    ['answer.created', 'answer.updated', 'answer.deleted'].forEach(type => {
+        source.addEventListener(type, (event) => {
+            const answer = JSON.parse(event.data);
+            onDelta(type === 'answer.deleted'
+                ? { results: [], deleted: [answer.id] }
+                : { results: [answer], deleted: [] });
+        });
+    });
+    
+    let opened = false;
+    const openTimer = setTimeout(() => {
+        // Unless it opened or the caller closed it meanwhile
+        if (opened || source.readyState === EventSource.CLOSED) return;
+        console.log('Answer event stream did not open, falling back to polling');
+        source.close();
+        onFallback();
+    }, EVENT_STREAM_OPEN_TIMEOUT);
+    
+    source.onopen = (event) => {
+        opened = true;
+        clearTimeout(openTimer);
+        onOpen(event);
+    };
+    source.onerror = () => {
+        // The browser retries on its own unless the server refused the stream
+        if (source.readyState !== EventSource.CLOSED || stream.closed) return;
+        clearTimeout(openTimer);
+        if (opened) {
+            // A retry after the signed URL expired: sign it again
+            console.log('Answer event stream closed, reconnecting');
+            connectAnswerEventStream(stream, url, { onDelta, onOpen, onFallback });
+        } else {
+            console.log('Answer event stream closed, falling back to polling');
+            onFallback();
+        }
+    };
+}
+
 // Auto-refresh functionality for students
 function startStudentAutoRefresh() {
     console.log('Starting student auto-refresh');
-    // Clear any existing interval
+    // Clear any existing interval or stream
+    stopStudentAutoRefresh();
+    
+    // Prefer a live stream: refetch changes whenever one of our answers changes
+    studentEventSource = openAnswerEventStream(`${API_BASE}/student/events/`, {
+        onDelta: () => refreshStudentAnswers(),
+        onOpen: () => refreshStudentAnswers(),
+        onFallback: startStudentPolling
+    });
+}
+
+function refreshStudentAnswers() {
+    if (userType === 'student' && selectedStudentClassId) {
+        loadMyAnswers(selectedStudentClassId);
+    }
+}
+
+function startStudentPolling() {
+    if (studentEventSource) {
+        studentEventSource.close();
+        studentEventSource = null;
+    }
     if (studentAutoRefreshInterval) {
         clearInterval(studentAutoRefreshInterval);
     }
@@ -1054,6 +1328,10 @@ function startStudentAutoRefresh() {
 
 function stopStudentAutoRefresh() {
     console.log('Stopping student auto-refresh');
+    if (studentEventSource) {
+        studentEventSource.close();
+        studentEventSource = null;
+    }
     if (studentAutoRefreshInterval) {
         clearInterval(studentAutoRefreshInterval);
         studentAutoRefreshInterval = null;
@@ -1110,6 +1388,7 @@ function populateReviewClassSelector() {
 
 function handleReviewClassChange(event) {
     selectedReviewClassId = parseInt(event.target.value);
+    document.getElementById('btn-export-answers').classList.toggle('hidden', !selectedReviewClassId);
     if (selectedReviewClassId) {
         loadReviewQuestions(selectedReviewClassId);
         loadAnalytics(selectedReviewClassId);
@@ -1120,6 +1399,30 @@ function handleReviewClassChange(event) {
     }
 }
 
+async function handleExportAnswers() {
+    if (!selectedReviewClassId) return;
+    
+    const exportBtn = document.getElementById('btn-export-answers');
+    exportBtn.disabled = true;
+    showReviewStatus('Exporting answers...', 'info');
+    
+    try {
+        // The browser downloads the ZIP straight to disk from a signed URL,
+        // instead of it being held in memory here
+        const url = await signedUrl(`${API_BASE}/instructor/export-answers/?class_id=${selectedReviewClassId}`);
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = `class-${selectedReviewClassId}-answers.zip`;
+        link.click();
+        showReviewStatus('Answer export started', 'success');
+    } catch (error) {
+        console.error('Error exporting answers:', error);
+        showReviewStatus('Error exporting answers: ' + error.message, 'error');
+    } finally {
+        exportBtn.disabled = false;
+    }
+}
+
 async function loadReviewQuestions(classId) {
     console.log('loadReviewQuestions called with classId:', classId);
     try {
@@ -1151,7 +1454,7 @@ function displayReviewQuestions(questions) {
     container.innerHTML = questions.map(question => `
         <div class="question-item clickable" data-question-id="${question.id}">
             <div class="question-text">${question.question_text}</div>
-            ${question.image_url ? `<div class="question-image"><img src="${question.image_url}" alt="Question image" class="question-thumbnail"></div>` : ''}
+            ${question.image_url ? `<div class="question-image"><img src="${imageUrlForSize(question, 'thumb')}" alt="Question image" class="question-thumbnail"></div>` : ''}
             <div class="question-meta">
                 <span class="question-date">${new Date(question.created_at).toLocaleString()}</span>
                 <button class="btn-review" data-question-id="${question.id}">Review Answers</button>
@@ -1233,7 +1536,7 @@ function displayReviewAnswers(answers) {
             </div>
             ${answer.image_url ? `
                 <div class="answer-image-container">
-                    <img src="${answer.image_url}" alt="Student answer" class="answer-review-image" data-image-url="${answer.image_url}">
+                    <img src="${imageUrlForSize(answer, 'thumb')}" alt="Student answer" class="answer-review-image" data-image-url="${imageUrlForSize(answer, 'original')}">
                 </div>
             ` : ''}
         </div>
@@ -1471,6 +1774,11 @@ function populatePowerPointQuestionSelector() {
 
 function handlePowerPointQuestionChange(event) {
     selectedPowerPointQuestionId = parseInt(event.target.value);
+    
+    // Re-subscribe the live stream to the newly selected question
+    if (liveAnswersEventSource) {
+        startAnswerPolling();
+    }
 }
 
 async function handleInsertQuestion() {
@@ -1600,6 +1908,31 @@ function handleEnableLiveAnswers() {
 }
 
 function startAnswerPolling() {
+    stopAnswerPolling();
+    
+    // Prefer a live stream for the selected question, falling back to polling
+    const questionId = selectedPowerPointQuestionId;
+    if (questionId) {
+        liveAnswersEventSource = openAnswerEventStream(`${API_BASE}/events/answers/?question_id=${questionId}`, {
+            onDelta: async (delta) => {
+                if (liveAnswersQuestionId !== questionId) return;
+                liveAnswers = mergeAnswerDelta(liveAnswers, delta);
+                await updateSlideWithAnswers(liveAnswers);
+            },
+            onOpen: () => loadLiveAnswers(questionId),
+            onFallback: startAnswerIntervalPolling
+        });
+        return;
+    }
+    
+    startAnswerIntervalPolling();
+}
+
+function startAnswerIntervalPolling() {
+    if (liveAnswersEventSource) {
+        liveAnswersEventSource.close();
+        liveAnswersEventSource = null;
+    }
     if (autoRefreshInterval) {
         clearInterval(autoRefreshInterval);
     }
@@ -1612,6 +1945,10 @@ function startAnswerPolling() {
 }
 
 function stopAnswerPolling() {
+    if (liveAnswersEventSource) {
+        liveAnswersEventSource.close();
+        liveAnswersEventSource = null;
+    }
     if (autoRefreshInterval) {
         clearInterval(autoRefreshInterval);
         autoRefreshInterval = null;
@@ -1620,12 +1957,25 @@ function stopAnswerPolling() {
 
 async function loadLiveAnswers(questionId) {
     try {
-        const response = await fetchWithAuth(`${API_BASE}/answers/?question_id=${questionId}`);
+        // Start over when the presented question changes
+        if (liveAnswersQuestionId !== questionId) {
+            liveAnswersQuestionId = questionId;
+            liveAnswersCursor = null;
+            liveAnswers = [];
+        }
+        
+        const response = await fetchWithAuth(`${API_BASE}/answers/?question_id=${questionId}&since=${liveAnswersCursor || ''}`);
         
         if (response.ok) {
-            const answers = await response.json();
-            // Update slide with new answers
-            await updateSlideWithAnswers(answers);
+            const delta = await response.json();
+            const isFirstLoad = liveAnswersCursor === null;
+            liveAnswersCursor = delta.cursor;
+            
+            // Update slide only when answers were added, re-liked or deleted
+            if (isFirstLoad || answerDeltaChanges(liveAnswers, delta)) {
+                liveAnswers = mergeAnswerDelta(liveAnswers, delta);
+                await updateSlideWithAnswers(liveAnswers);
+            }
         }
     } catch (error) {
         console.error('Error loading live answers:', error);
@@ -1633,6 +1983,46 @@ async function loadLiveAnswers(questionId) {
 }
 
 async function updateSlideWithAnswers(answers) {
+    // Show the answers as one server-composed image when there are any
+    if (liveAnswersQuestionId && answers.length > 0) {
+        try {
+            await insertAnswerMosaic(liveAnswersQuestionId);
+            return;
+        } catch (error) {
+            console.error('Falling back to a text list of answers:', error);
+        }
+    }
+    return insertAnswerText(answers);
+}
+
+async function insertAnswerMosaic(questionId) {
+    const response = await fetchWithAuth(`${API_BASE}/questions/${questionId}/mosaic/`);
+    if (!response.ok) {
+        throw new Error('Failed to load answer mosaic');
+    }
+    
+    const blob = await response.blob();
+    const base64 = await new Promise((resolve, reject) => {
+        const reader = new FileReader();
+        reader.onload = () => resolve(reader.result.split(',')[1]);
+        reader.onerror = () => reject(reader.error);
+        reader.readAsDataURL(blob);
+    });
+    
+    return new Promise((resolve, reject) => {
+        Office.context.document.setSelectedDataAsync(base64, {
+            coercionType: Office.CoercionType.Image
+        }, (result) => {
+            if (result.status === Office.AsyncResultStatus.Succeeded) {
+                resolve();
+            } else {
+                reject(new Error('Failed to insert answer mosaic'));
+            }
+        });
+    });
+}
+
+function insertAnswerText(answers) {
     return new Promise((resolve, reject) => {
         let content = `LIVE ANSWERS (${answers.length} total):\n\n`;
         
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Instructor, Class, Student, Question, Answer
+from .models import Instructor, Class, Student, Question, Answer, ImageJob
 
 
 @admin.register(Instructor)
@@ -31,9 +31,10 @@ class ClassAdmin(admin.ModelAdmin):
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     """Admin configuration for Student model."""
-    list_display = ['name', 'phone', 'class_enrolled', 'created_at']
+    list_display = ['name', 'roster_id', 'phone', 'class_enrolled', 'user', 'created_at']
     list_filter = ['class_enrolled', 'created_at']
-    search_fields = ['name', 'phone', 'class_enrolled__class_name']
+    search_fields = ['name', 'roster_id', 'phone', 'class_enrolled__class_name']
+    raw_id_fields = ['user']
 
 
 @admin.register(Question)
@@ -66,3 +67,11 @@ class AnswerAdmin(admin.ModelAdmin):
         """Return truncated question text for display."""
         return obj.question.question_text[:30] + '...' if len(obj.question.question_text) > 30 else obj.question.question_text
     question_short.short_description = 'Question'
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    """Admin configuration for ImageJob model."""
+    list_display = ['id', 'answer', 'question', 'status', 'attempts', 'created_at', 'updated_at']
+    list_filter = ['status', 'created_at']
+    raw_id_fields = ['answer', 'question']
@@ -0,0 +1,242 @@
+"""
+Async versions of the student API views, served instead of the DRF views
+in ``views.py`` when ASYNC_STUDENT_VIEWS is on (``config/asgi.py`` turns it
+on for ASGI servers).
+
+A class submitting at the end of a question is hundreds of requests at
+once, each of which mostly waits: on the database, on the cache and on
+writing the image. Under ASGI these views await that work instead of
+holding a worker thread each, using Django's async ORM for their queries.
+Image validation and writing run on a thread pool of their own, so slow
+disks do not hold up the database work of other requests. Responses match
+the sync views, which remain the implementation under WSGI.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+
+from .caching import acached_response, class_version, fields_variant, request_variant, student_dependencies
+from .events import publish_answer_event
+from .models import Answer, AnswerTombstone, Class, ImageStatus, Question, Student
+from .projections import AnswerProjection, ClassProjection, QuestionProjection
+from .serializers import AnswerSerializer
+from .views import answer_delta_response, authenticate_async_request, paginated_answer_response, student_ids_for
+
+
+def unauthorized():
+    return JsonResponse({"error": "Authentication credentials were not provided or are invalid"}, status=401)
+
+
+def json_response(response):
+    """A JsonResponse of a DRF Response built by one of the shared helpers in views.py."""
+    headers = {key: value for key, value in response.items() if key.lower() != 'content-type'}
+    return JsonResponse(response.data, status=response.status_code, safe=False, headers=headers)
+
+
+async def authenticated(request):
+    """
+    A DRF Request wrapping `request` and authenticated by its JWT, or None.
+    The wrapper gives the helpers shared with the sync views query_params
+    and parsed request data.
+    """
+    user = await authenticate_async_request(request)
+    if user is None:
+        return None
+    
+    drf_request = Request(request, parsers=[MultiPartParser(), FormParser(), JSONParser()])
+    drf_request.user = user
+    drf_request.auth = request.auth
+    return drf_request
+
+
+@sync_to_async
+def project(projection, queryset):
+    """Serialize a listing in a worker thread: images without derivatives are backfilled in the database."""
+    return projection.data(queryset)
+
+
+async def enrolled_student(request, class_id):
+    """Async version of views.enrolled_student."""
+    return await Student.objects.select_related('class_enrolled').filter(class_enrolled_id=class_id, user=request.user).afirst()
+
+
+async def student_for_class_param(request):
+    """
+    The current student's record in the class of ?class_id=, as
+    (student, None); or (None, error response).
+    """
+    class_id = request.query_params.get('class_id')
+    if not class_id:
+        return None, JsonResponse({"error": "class_id parameter is required"}, status=400)
+    
+    student = await enrolled_student(request, class_id)
+    if student is None:
+        return None, JsonResponse({"error": "Class not found or you are not enrolled in this class"}, status=404)
+    return student, None
+
+
+@require_GET
+async def student_classes(request):
+    """
+    Get classes that the current student is enrolled in.
+    """
+    request = await authenticated(request)
+    if request is None:
+        return unauthorized()
+    
+    try:
+        await sync_to_async(student_ids_for)(request)
+        projection = ClassProjection(request)
+        
+        async def build():
+            return await project(projection, Class.objects.filter(students__user=request.user).distinct())
+        
+        return await acached_response(
+            'student_classes', f'{request.user.id}:{fields_variant(request)}', student_dependencies(request.user), build
+        )
+    except ValidationError as e:
+        return JsonResponse({"error": str(e.detail[0])}, status=400)
+    except Student.DoesNotExist:
+        return JsonResponse({"error": "Student record not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@require_GET
+async def student_questions(request):
+    """
+    Get questions for classes that the current student is enrolled in.
+    """
+    request = await authenticated(request)
+    if request is None:
+        return unauthorized()
+    
+    try:
+        await sync_to_async(student_ids_for)(request)
+        student, error = await student_for_class_param(request)
+        if error is not None:
+            return error
+        class_obj = student.class_enrolled
+        
+        # Questions are the same for every student in the class, so share one cache entry
+        projection = QuestionProjection(request)
+        
+        async def build():
+            return await project(projection, Question.objects.filter(class_related=class_obj))
+        
+        return await acached_response(
+            'class_questions', f'{class_obj.id}:{request_variant(request)}', [class_version(class_obj.id)], build
+        )
+    except ValidationError as e:
+        return JsonResponse({"error": str(e.detail[0])}, status=400)
+    except Student.DoesNotExist:
+        return JsonResponse({"error": "Student record not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@require_GET
+async def student_answers(request):
+    """
+    Get answers submitted by the current student for a specific class.
+    """
+    request = await authenticated(request)
+    if request is None:
+        return unauthorized()
+    
+    try:
+        await sync_to_async(student_ids_for)(request)
+        student, error = await student_for_class_param(request)
+        if error is not None:
+            return error
+        class_obj = student.class_enrolled
+        
+        answers = Answer.objects.filter(
+            student=student,
+            question__class_related=class_obj
+        ).select_related('student', 'question')
+        
+        # Delta and paged listings reuse the sync helpers, in a worker thread
+        if 'since' in request.query_params:
+            tombstones = AnswerTombstone.objects.filter(student_id=student.id, class_id=class_obj.id)
+            return json_response(await sync_to_async(answer_delta_response)(request, answers, tombstones))
+        if 'page_size' in request.query_params:
+            return json_response(await sync_to_async(paginated_answer_response)(request, answers))
+        
+        return JsonResponse(await project(AnswerProjection(request), answers), safe=False)
+    except ValidationError as e:
+        return JsonResponse({"error": str(e.detail[0])}, status=400)
+    except Student.DoesNotExist:
+        return JsonResponse({"error": "Student record not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+async def store_image(image):
+    """Write an uploaded answer image to storage, off the event loop; returns its stored name."""
+    field = Answer._meta.get_field('image')
+    name = field.generate_filename(None, image.name)
+    return await sync_to_async(field.storage.save, thread_sensitive=False)(name, image, max_length=field.max_length)
+
+
+async def submit_answer(request):
+    """
+    Async version of views.submit_answer. The image is validated and
+    written on a separate thread pool; the answer is then created with the
+    stored name, so the serializer does not write the file again.
+    """
+    # Make sure the current user has student records
+    await sync_to_async(student_ids_for)(request)
+    
+    # Parsing reads the body the server has already received
+    data = await sync_to_async(lambda: request.data)()
+    question_id = data.get('question_id')
+    if not question_id:
+        return JsonResponse({"error": "question_id is required"}, status=400)
+    
+    # Verify the question exists and the student is enrolled in the class
+    try:
+        question = await Question.objects.select_related('class_related').aget(id=question_id)
+    except Question.DoesNotExist:
+        return JsonResponse({"error": "Question not found"}, status=404)
+    
+    student = await enrolled_student(request, question.class_related_id)
+    if student is None:
+        return JsonResponse({"error": "You are not enrolled in this class"}, status=403)
+    
+    serializer = AnswerSerializer(data=data, context={'request': request})
+    if not await sync_to_async(serializer.is_valid, thread_sensitive=False)():
+        return JsonResponse(serializer.errors, status=400)
+    image = await store_image(serializer.validated_data['image'])
+    
+    def create():
+        serializer.save(student=student, question=question, image=image)
+        publish_answer_event('answer.created', serializer.instance, serializer.data)
+        return serializer.data
+    
+    payload = await sync_to_async(create)()
+    # 202 while the image is still being processed in the background
+    status_code = 202 if serializer.instance.status == ImageStatus.PROCESSING else 201
+    return JsonResponse(payload, status=status_code)
+
+
+@csrf_exempt
+@require_POST
+async def student_submit_answer(request):
+    """
+    Submit an answer for a question by a student.
+    """
+    request = await authenticated(request)
+    if request is None:
+        return unauthorized()
+    
+    try:
+        return await submit_answer(request)
+    except Student.DoesNotExist:
+        return JsonResponse({"error": "Student record not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
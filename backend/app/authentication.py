@@ -0,0 +1,136 @@
+"""
+JWT authentication without a user query per request.
+
+Access tokens already carry the user's id, username and name (see
+CustomTokenObtainPairSerializer), so request.user is built from the
+verified claims: an Instructor whose other fields are deferred and only
+loaded if a view reads them. What a token cannot vouch for is whether the
+account is still active. That is kept per process in a small LRU cache
+whose entries expire after AUTH_USER_STATE_TTL seconds, so a deactivated
+or deleted account is refused within that time everywhere (and at once by
+the process that saved the change), while steady traffic needs no auth
+query at all.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .models import Instructor
+from .signed_urls import signed_request_user_id
+
+# Claims a token needs for request.user to be built without a query
+USER_CLAIMS = ('username', 'name')
+
+
+class UserStateCache:
+    """Thread-safe LRU map of user id to whether the account is active, with expiring entries."""
+    
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, user_id):
+        """The cached state of a user, or None when it is unknown or expired."""
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            active, expires = entry
+            if expires < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return active
+    
+    def set(self, user_id, active):
+        expires = time.monotonic() + getattr(settings, 'AUTH_USER_STATE_TTL', 60)
+        with self.lock:
+            self.entries[user_id] = (active, expires)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > getattr(settings, 'AUTH_USER_STATE_CACHE_SIZE', 10000):
+                self.entries.popitem(last=False)
+    
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_states = UserStateCache()
+
+
+def remember_user(user):
+    """Cache the state of a user loaded anyway (e.g. at login), so their first request needs no query."""
+    user_states.set(user.pk, user.is_active)
+
+
+def is_user_active(user_id):
+    """Whether a user exists and is active, read through the state cache."""
+    active = user_states.get(user_id)
+    if active is None:
+        active = bool(Instructor.objects.filter(pk=user_id).values_list('is_active', flat=True).first())
+        user_states.set(user_id, active)
+    return active
+
+
+def user_from_claims(validated_token):
+    """
+    An Instructor built from a token's claims, without a query. Fields not
+    in the token (is_active included) are deferred, so reading one loads it.
+    """
+    # Values in the order of the model's fields, as from_db expects
+    return Instructor.from_db(
+        'default',
+        ['id', 'username', 'name'],
+        [validated_token[jwt_settings.USER_ID_CLAIM], validated_token['username'], validated_token['name']],
+    )
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that builds request.user from the token's claims and
+    checks the account against the user state cache instead of loading it.
+    Tokens without the user claims fall back to loading the user.
+    """
+    
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            user = super().get_user(validated_token)
+            remember_user(user)
+            return user
+        
+        if not is_user_active(user_id):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user_from_claims(validated_token)
+
+
+class SignedURLAuthentication(BaseAuthentication):
+    """
+    Authenticates a request by its ?signature= (see signed_urls.py), for
+    views that clients open without an Authorization header, such as
+    downloads started by navigating the browser.
+    """
+    
+    def authenticate(self, request):
+        user_id = signed_request_user_id(request)
+        if user_id is None:
+            return None
+        user = Instructor.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user, None
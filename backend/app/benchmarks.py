@@ -0,0 +1,330 @@
+"""
+Latency, query and memory benchmarks of every API route.
+
+Each route in ``app/urls.py`` has one or more Endpoints below, driven
+through the test client against a dataset from ``generate_dataset``.
+Timed calls give p50/p95/p99 latency; one extra call per endpoint is run
+under tracemalloc to count its queries and its peak allocated memory.
+``python manage.py benchmark`` writes the results to JSON and
+``python manage.py compare_benchmarks`` checks them against a baseline.
+"""
+import itertools
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from io import BytesIO
+
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .media import retain_blobs
+from .models import Instructor, Class, Student, Question, Answer
+from .signed_urls import sign_request_path
+from .stats import answer_change, move_counters
+from .views import CustomTokenObtainPairSerializer
+
+PERCENTILES = (50, 95, 99)
+BULK_DELETE_ANSWERS = 20
+ROSTER_ROWS = 50
+
+# Latency changes smaller than this are noise, whatever the tolerance
+MIN_LATENCY_REGRESSION_MS = 1.0
+
+
+def numbered_image(n):
+    """A small PNG upload whose pixels differ for every `n`."""
+    buffer = BytesIO()
+    Image.new('RGB', (64, 48), (n % 256, n // 256 % 256, n // 65536 % 256)).save(buffer, 'PNG')
+    return SimpleUploadedFile('answer.png', buffer.getvalue(), content_type='image/png')
+
+
+class BenchmarkError(Exception):
+    """Raised when an endpoint does not answer with its expected status."""
+
+
+class Endpoint:
+    """
+    A request to benchmark. `prepare`, if set, runs untimed before every
+    call and its result is passed to `request`.
+    """
+    
+    def __init__(self, name, route, method, request, status=200, prepare=None):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.request = request
+        self.status = status
+        self.prepare = prepare
+    
+    def call(self, context=None):
+        """Make the request (inside `context`, if given, but after prepare) and return its duration."""
+        argument = self.prepare() if self.prepare else None
+        with context or nullcontext():
+            start = time.perf_counter()
+            response = self.request(argument)
+            # Streamed bodies are produced while they are read
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        if response.status_code != self.status:
+            raise BenchmarkError(f"{self.name}: expected {self.status}, got {response.status_code}")
+        return elapsed
+
+
+class BenchmarkData:
+    """The rows of a generated dataset that the endpoints read and write."""
+    
+    def __init__(self, prefix):
+        self.instructor = Instructor.objects.get(username=f'{prefix}-instructor-0')
+        self.other_instructor = Instructor.objects.get(username=f'{prefix}-instructor-1')
+        self.class_obj = Class.objects.filter(instructor=self.instructor).order_by('id').first()
+        self.student = (
+            Student.objects.select_related('user')
+            .filter(class_enrolled=self.class_obj, user__isnull=False)
+            .order_by('id').first()
+        )
+        self.student_user = self.student.user
+        self.question = Question.objects.filter(class_related=self.class_obj).order_by('id').first()
+        self.foreign_question = Question.objects.filter(class_related__instructor=self.other_instructor).first()
+        self.answer = Answer.objects.filter(question=self.question).order_by('id').first()
+        self.tokens = {
+            user.pk: CustomTokenObtainPairSerializer.get_token(user)
+            for user in (self.instructor, self.student_user)
+        }
+        self.counter = itertools.count()
+    
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens[user.pk].access_token}')
+        return client
+    
+    def image(self):
+        """A PNG upload that differs from every earlier one, so uploads are not deduplicated."""
+        return numbered_image(next(self.counter))
+    
+    def new_answers(self, count):
+        """Answers to delete, sharing the image of an existing answer."""
+        with transaction.atomic():
+            answers = Answer.objects.bulk_create([
+                Answer(
+                    question=self.question, student=self.student,
+                    image=self.answer.image.name, image_derivatives=self.answer.image_derivatives,
+                )
+                for _ in range(count)
+            ])
+            retain_blobs(answer.image.name for answer in answers)
+            move_counters([answer_change(answer, 1, 0) for answer in answers])
+        return answers
+    
+    def upload_session(self, client, upload=False):
+        """Start a chunked upload session, optionally sending the whole file. Returns (id, content)."""
+        content = self.image().read()
+        session = client.post(reverse('upload_sessions'), {'filename': 'answer.png', 'size': len(content)}, format='json')
+        session_id = session.data['id']
+        if upload:
+            client.put(
+                f"{reverse('upload_session_detail', args=[session_id])}?offset=0",
+                content, content_type='application/octet-stream'
+            )
+        return session_id, content
+
+
+def build_endpoints(data):
+    """Every benchmarked request, in the order of app/urls.py."""
+    instructor = data.client_for(data.instructor)
+    student = data.client_for(data.student_user)
+    class_id = data.class_obj.id
+    question_id = data.question.id
+    roster = 'roster_id,name,phone\n' + ''.join(f'B{i},Student {i},555-{i:04d}\n' for i in range(ROSTER_ROWS))
+    
+    return [
+        Endpoint('health', 'health_check', 'GET', lambda _: APIClient().get(reverse('health_check'))),
+        Endpoint('login', 'token_obtain_pair', 'POST', lambda _: APIClient().post(
+            reverse('token_obtain_pair'), {'username': data.instructor.username, 'password': 'password123'}, format='json'
+        )),
+        Endpoint('token_refresh', 'token_refresh', 'POST', lambda _: APIClient().post(
+            reverse('token_refresh'), {'refresh': str(data.tokens[data.instructor.pk])}, format='json'
+        )),
+        Endpoint('student_classes', 'student_classes', 'GET', lambda _: student.get(reverse('student_classes'))),
+        Endpoint('student_questions', 'student_questions', 'GET', lambda _: student.get(
+            f"{reverse('student_questions')}?class_id={class_id}"
+        )),
+        Endpoint('student_answers', 'student_answers', 'GET', lambda _: student.get(
+            f"{reverse('student_answers')}?class_id={class_id}"
+        )),
+        Endpoint('student_answers_page', 'student_answers', 'GET', lambda _: student.get(
+            f"{reverse('student_answers')}?class_id={class_id}&page_size=50"
+        )),
+        Endpoint('student_submit_answer', 'student_submit_answer', 'POST', lambda image: student.post(
+            reverse('student_submit_answer'), {'question_id': question_id, 'image': image}, format='multipart'
+        ), status=202, prepare=data.image),
+        # Event streams never end, so only their rejections are measured, through the ASGI handler they need
+        Endpoint('student_events_anonymous', 'student_answer_events', 'GET', lambda _: async_to_sync(AsyncClient().get)(
+            reverse('student_answer_events')
+        ), status=401),
+        Endpoint('answer_events_foreign_question', 'answer_events', 'GET', lambda _: async_to_sync(AsyncClient().get)(
+            f"{reverse('answer_events')}?question_id={data.foreign_question.id}"
+            f"&signature={sign_request_path(data.instructor.pk, reverse('answer_events'))}"
+        ), status=404),
+        Endpoint('signed_url', 'signed_urls', 'POST', lambda _: instructor.post(
+            reverse('signed_urls'), {'url': f"{reverse('answer_events')}?question_id={question_id}"}, format='json'
+        )),
+        Endpoint('upload_start', 'upload_sessions', 'POST', lambda _: student.post(
+            reverse('upload_sessions'), {'filename': 'answer.png', 'size': 1024}, format='json'
+        ), status=201),
+        Endpoint('upload_chunk', 'upload_session_detail', 'PUT', lambda session: student.put(
+            f"{reverse('upload_session_detail', args=[session[0]])}?offset=0",
+            session[1], content_type='application/octet-stream'
+        ), prepare=lambda: data.upload_session(student)),
+        Endpoint('upload_status', 'upload_session_detail', 'GET', lambda session: student.get(
+            reverse('upload_session_detail', args=[session[0]])
+        ), prepare=lambda: data.upload_session(student)),
+        Endpoint('upload_finalize', 'finalize_upload_session', 'POST', lambda session: student.post(
+            reverse('finalize_upload_session', args=[session[0]]),
+            {'target': 'answer', 'question_id': question_id}, format='json'
+        ), status=202, prepare=lambda: data.upload_session(student, upload=True)),
+        Endpoint('instructor_class_answers', 'instructor_class_answers', 'GET', lambda _: instructor.get(
+            f"{reverse('instructor_class_answers')}?class_id={class_id}"
+        )),
+        Endpoint('instructor_class_answers_page', 'instructor_class_answers', 'GET', lambda _: instructor.get(
+            f"{reverse('instructor_class_answers')}?class_id={class_id}&page_size=50"
+        )),
+        Endpoint('instructor_class_answers_fields', 'instructor_class_answers', 'GET', lambda _: instructor.get(
+            f"{reverse('instructor_class_answers')}?class_id={class_id}&fields=id,student_name,image_url,liked"
+        )),
+        Endpoint('answer_export', 'export_answers', 'GET', lambda _: instructor.get(
+            f"{reverse('export_answers')}?class_id={class_id}"
+        )),
+        Endpoint('api_root', 'api-root', 'GET', lambda _: instructor.get(reverse('api-root'))),
+        Endpoint('class_list', 'class-list', 'GET', lambda _: instructor.get(reverse('class-list'))),
+        Endpoint('class_detail', 'class-detail', 'GET', lambda _: instructor.get(reverse('class-detail', args=[class_id]))),
+        Endpoint('class_create', 'class-list', 'POST', lambda _: instructor.post(
+            reverse('class-list'), {'class_name': 'Benchmark class'}, format='json'
+        ), status=201),
+        Endpoint('class_stats', 'class-stats', 'GET', lambda _: instructor.get(reverse('class-stats', args=[class_id]))),
+        Endpoint('class_roster_import', 'class-roster', 'POST', lambda _: instructor.post(
+            reverse('class-roster', args=[class_id]),
+            {'file': SimpleUploadedFile('roster.csv', roster.encode(), content_type='text/csv')},
+            format='multipart'
+        )),
+        Endpoint('student_list', 'student-list', 'GET', lambda _: instructor.get(
+            f"{reverse('student-list')}?class_id={class_id}"
+        )),
+        Endpoint('student_detail', 'student-detail', 'GET', lambda _: instructor.get(
+            reverse('student-detail', args=[data.student.id])
+        )),
+        Endpoint('question_list', 'question-list', 'GET', lambda _: instructor.get(
+            f"{reverse('question-list')}?class_id={class_id}"
+        )),
+        Endpoint('question_detail', 'question-detail', 'GET', lambda _: instructor.get(
+            reverse('question-detail', args=[question_id])
+        )),
+        Endpoint('question_mosaic', 'question-mosaic', 'GET', lambda _: instructor.get(
+            reverse('question-mosaic', args=[question_id])
+        )),
+        Endpoint('question_create', 'question-list', 'POST', lambda image: instructor.post(
+            reverse('question-list'), {'class_id': class_id, 'question_text': 'Benchmark', 'image': image},
+            format='multipart'
+        ), status=202, prepare=data.image),
+        Endpoint('question_import', 'question-import-deck', 'POST', lambda images: instructor.post(
+            reverse('question-import-deck'), {'class_id': class_id, 'images': images}, format='multipart'
+        ), status=202, prepare=lambda: [data.image(), data.image()]),
+        Endpoint('answer_list', 'answer-list', 'GET', lambda _: instructor.get(
+            f"{reverse('answer-list')}?question_id={question_id}"
+        )),
+        Endpoint('answer_detail', 'answer-detail', 'GET', lambda _: instructor.get(
+            reverse('answer-detail', args=[data.answer.id])
+        )),
+        Endpoint('answer_like', 'answer-detail', 'PATCH', lambda _: instructor.patch(
+            reverse('answer-detail', args=[data.answer.id]), {'liked': True}, format='json'
+        )),
+        Endpoint('answer_delete', 'answer-detail', 'DELETE', lambda answers: instructor.delete(
+            reverse('answer-detail', args=[answers[0].id])
+        ), status=204, prepare=lambda: data.new_answers(1)),
+        Endpoint('answer_bulk_like', 'answer-bulk', 'POST', lambda _: instructor.post(
+            reverse('answer-bulk'), {'action': 'like', 'question_id': question_id}, format='json'
+        )),
+        Endpoint('media', 'serve_media', 'GET', lambda _: instructor.get(
+            reverse('serve_media', args=[data.answer.image.name])
+        )),
+        # As <img> tags load it, from the signed URL in a listing
+        Endpoint('media_signed', 'serve_media', 'GET', lambda _: APIClient().get(data.answer.image.url)),
+        Endpoint('answer_bulk_delete', 'answer-bulk', 'POST', lambda answers: instructor.post(
+            reverse('answer-bulk'), {'action': 'delete', 'ids': [answer.id for answer in answers]}, format='json'
+        ), prepare=lambda: data.new_answers(BULK_DELETE_ANSWERS)),
+    ]
+
+
+@contextmanager
+def traced(result):
+    """Record the queries and peak allocated memory of the block into `result`."""
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            yield
+        result['queries'] = len(queries)
+        result['memory_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def measure(endpoint, iterations, warmup):
+    """Latency percentiles (ms) over `iterations` calls, plus queries and peak memory of one more."""
+    for _ in range(warmup):
+        endpoint.call()
+    timings = [endpoint.call() * 1000 for _ in range(iterations)]
+    
+    cuts = statistics.quantiles(timings, n=100, method='inclusive')
+    result = {'route': endpoint.route, 'method': endpoint.method, 'status': endpoint.status}
+    result.update({f'p{p}_ms': round(cuts[p - 1], 3) for p in PERCENTILES})
+    result['mean_ms'] = round(statistics.fmean(timings), 3)
+    endpoint.call(traced(result))
+    return result
+
+
+def run_benchmarks(data, iterations=30, warmup=3, only=None, progress=None):
+    """
+    Measure every endpoint (or those whose name contains one of `only`)
+    and return {name: result}. `progress` is called with each name first.
+    """
+    if iterations < 2:
+        raise ValueError("At least 2 iterations are needed for percentiles")
+    results = {}
+    for endpoint in build_endpoints(data):
+        if only and not any(part in endpoint.name for part in only):
+            continue
+        if progress:
+            progress(endpoint.name)
+        results[endpoint.name] = measure(endpoint, iterations, warmup)
+    return results
+
+
+def compare_results(baseline, current, tolerance=0.25, memory_tolerance=0.25):
+    """
+    Regressions of `current` against `baseline` (both {name: result}), as
+    messages: more queries than before, p95 latency or peak memory more
+    than the tolerance (a fraction) above the baseline, or a different
+    status. Endpoints missing from either side are not compared.
+    """
+    regressions = []
+    for name, old in baseline.items():
+        new = current.get(name)
+        if new is None:
+            continue
+        if new['status'] != old['status']:
+            regressions.append(f"{name}: status {old['status']} -> {new['status']}")
+        if new['queries'] > old['queries']:
+            regressions.append(f"{name}: queries {old['queries']} -> {new['queries']}")
+        if (new['p95_ms'] > old['p95_ms'] * (1 + tolerance)
+                and new['p95_ms'] - old['p95_ms'] >= MIN_LATENCY_REGRESSION_MS):
+            regressions.append(f"{name}: p95 {old['p95_ms']:.2f}ms -> {new['p95_ms']:.2f}ms")
+        if new['memory_kb'] > old['memory_kb'] * (1 + memory_tolerance):
+            regressions.append(f"{name}: memory {old['memory_kb']:.0f}KB -> {new['memory_kb']:.0f}KB")
+    return regressions
@@ -0,0 +1,210 @@
+"""
+Read-through cache for class, question and roster listings.
+
+Each cached payload records the version tokens of the rows it was built
+from: ``class:<id>`` (a class, its questions and its roster),
+``instructor:<id>`` (which classes an instructor owns) and ``user:<id>``
+(which student records, in which classes, a user account is linked to). Signals replace those tokens
+when the rows change, once the transaction commits, so stale entries are
+detected exactly on the next read instead of waiting out a TTL. Hits and
+misses are counted per listing; see ``python manage.py cache_stats``.
+"""
+import hashlib
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import JsonResponse
+from rest_framework.response import Response
+
+from .models import Class, Student
+from .signed_urls import media_url_lifetime
+
+KEY_PREFIX = 'reads'
+
+# Listings served through the cache, for reporting hit/miss counts
+CACHED_READS = ('classes', 'questions', 'students', 'student_classes', 'class_questions')
+
+
+def class_version(class_id):
+    return f'class:{class_id}'
+
+
+def instructor_version(instructor_id):
+    return f'instructor:{instructor_id}'
+
+
+def user_version(user_id):
+    return f'user:{user_id}'
+
+
+def version_key(name):
+    return f'{KEY_PREFIX}:version:{name}'
+
+
+def stats_key(name, outcome):
+    return f'{KEY_PREFIX}:stats:{name}:{outcome}'
+
+
+def invalidate(classes=(), instructors=(), users=()):
+    """
+    Invalidate cached listings built from the given rows once the current
+    transaction commits (so a concurrent read cannot re-cache old data).
+    """
+    names = {class_version(i) for i in classes if i is not None}
+    names |= {instructor_version(i) for i in instructors if i is not None}
+    names |= {user_version(i) for i in users if i is not None}
+    if names:
+        transaction.on_commit(lambda: cache.set_many(
+            {version_key(name): uuid.uuid4().hex for name in names}, timeout=None
+        ))
+
+
+def current_versions(names):
+    """Current version token of each name, creating tokens that are missing."""
+    keys = {version_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: token for key, token in found.items()}
+
+
+def record(name, outcome):
+    key = stats_key(name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_stats():
+    """Hit and miss counts of every cached listing."""
+    counts = cache.get_many([stats_key(name, outcome) for name in CACHED_READS for outcome in ('hits', 'misses')])
+    return {
+        name: {outcome: counts.get(stats_key(name, outcome), 0) for outcome in ('hits', 'misses')}
+        for name in CACHED_READS
+    }
+
+
+def reset_stats():
+    cache.delete_many([stats_key(name, outcome) for name in CACHED_READS for outcome in ('hits', 'misses')])
+
+
+def fields_variant(request):
+    """Part of the cache key for listings narrowed with ?fields=."""
+    return request.query_params.get('fields', '')
+
+
+def request_variant(request):
+    """
+    Part of the cache key for payloads holding absolute image URLs, which
+    depend on the host the request came in on and the ?size= asked for
+    (and, like every listing, on the ?fields= asked for).
+    """
+    variant = f"{request.build_absolute_uri('/')}|{request.query_params.get('size', '')}|{fields_variant(request)}"
+    return hashlib.md5(variant.encode()).hexdigest()
+
+
+def cached_entry(name, cache_key):
+    """The cache entry under `cache_key` if its versions are all current (a hit), else None."""
+    entry = cache.get(cache_key)
+    if entry is not None and current_versions(entry['versions']) == entry['versions']:
+        record(name, 'hits')
+        return entry
+    return None
+
+
+def dependency_versions(dependencies):
+    return current_versions(dependencies() if callable(dependencies) else dependencies)
+
+
+def store_entry(name, cache_key, versions, data):
+    # Not kept past the signed media URLs in it
+    timeout = min(getattr(settings, 'READ_CACHE_TIMEOUT', 3600), media_url_lifetime())
+    cache.set(cache_key, {'versions': versions, 'data': data}, timeout)
+    record(name, 'misses')
+
+
+def cached_response(name, key, dependencies, build):
+    """
+    Respond with build() read through the cache.
+    
+    `dependencies` lists the version names the payload is built from, or is
+    a callable returning them (called on a miss only). Versions are read
+    before building so a write committed mid-build invalidates the entry.
+    The X-Cache header reports HIT or MISS.
+    """
+    cache_key = f'{KEY_PREFIX}:{name}:{key}'
+    entry = cached_entry(name, cache_key)
+    if entry is not None:
+        return Response(entry['data'], headers={'X-Cache': 'HIT'})
+    
+    versions = dependency_versions(dependencies)
+    data = build()
+    store_entry(name, cache_key, versions, data)
+    return Response(data, headers={'X-Cache': 'MISS'})
+
+
+async def acached_response(name, key, dependencies, build):
+    """
+    cached_response() for async views: `build` is a coroutine function and
+    the result a JsonResponse. Cache reads and writes run in a worker thread.
+    """
+    cache_key = f'{KEY_PREFIX}:{name}:{key}'
+    entry = await sync_to_async(cached_entry)(name, cache_key)
+    if entry is not None:
+        return JsonResponse(entry['data'], safe=False, headers={'X-Cache': 'HIT'})
+    
+    versions = await sync_to_async(dependency_versions)(dependencies)
+    data = await build()
+    await sync_to_async(store_entry)(name, cache_key, versions, data)
+    return JsonResponse(data, safe=False, headers={'X-Cache': 'MISS'})
+
+
+def instructor_dependencies(user, class_id=None):
+    """Versions an instructor's listing depends on, optionally narrowed to one class."""
+    if class_id:
+        return [instructor_version(user.id), class_version(class_id)]
+    return lambda: [instructor_version(user.id)] + [
+        class_version(i) for i in Class.objects.filter(instructor=user).values_list('id', flat=True)
+    ]
+
+
+def student_dependencies(user):
+    """
+    Versions a student's listing depends on: the user's student records,
+    whichever token they hold, and the classes of those records.
+    """
+    return lambda: [user_version(user.id)] + [
+        class_version(i) for i in Student.objects.filter(user=user).values_list('class_enrolled_id', flat=True)
+    ]
+
+
+class CachedListMixin:
+    """
+    Serve a ViewSet's list action through the read cache. Set `cache_name`,
+    `cache_by_class` when the listing honours ?class_id=, and
+    `cache_per_request_variant` for payloads with image URLs.
+    """
+    cache_name = None
+    cache_by_class = False
+    cache_per_request_variant = False
+    
+    def list(self, request, *args, **kwargs):
+        class_id = request.query_params.get('class_id', '') if self.cache_by_class else ''
+        key = f'{request.user.id}:{class_id}'
+        if self.cache_per_request_variant:
+            key = f'{key}:{request_variant(request)}'
+        else:
+            key = f'{key}:{fields_variant(request)}'
+        return cached_response(
+            self.cache_name,
+            key,
+            instructor_dependencies(request.user, class_id),
+            lambda: super(CachedListMixin, self).list(request, *args, **kwargs).data,
+        )
@@ -0,0 +1,245 @@
+"""
+Throughput of the student API under a burst of simultaneous students,
+served by the sync views under WSGI and by the async views under ASGI.
+
+Every student (each with their own token) starts the same session at the
+same moment: list classes, list questions, submit an answer, list answers.
+Requests go through Django's real handlers, called in-process so that no
+sockets or server are involved: WSGIHandler on a pool of worker threads,
+as a threaded WSGI server runs it, and ASGIHandler on one event loop with
+every request in flight at once, as an ASGI server runs it. Latency is
+measured from when a student sends a request, so it includes the time a
+request waits for a free WSGI thread.
+``python manage.py benchmark_concurrency`` runs both and reports the results.
+"""
+import asyncio
+import itertools
+import statistics
+import time
+import types
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import override_settings
+from django.urls import include, path, reverse
+
+from . import async_views, views
+from .benchmarks import PERCENTILES, BenchmarkError, numbered_image
+from .models import Question, Student
+from .urls import student_urlpatterns
+from .views import CustomTokenObtainPairSerializer
+
+MODES = ('wsgi', 'asgi')
+DEFAULT_THREADS = 16
+
+
+def student_urlconf(student_views):
+    """A root URLconf serving the student API at /api/ with `student_views`."""
+    urlconf = types.ModuleType(f'{student_views.__name__}_urls')
+    urlconf.urlpatterns = [path('api/', include(student_urlpatterns(student_views)))]
+    return urlconf
+
+
+class StudentRequest:
+    """One request of a student's session, ready to be sent through either handler."""
+    
+    def __init__(self, name, method, token, query='', body=b'', content_type='', status=200):
+        self.name = name
+        self.method = method
+        self.path = reverse(name)
+        self.query = query
+        self.body = body
+        self.content_type = content_type
+        self.token = token
+        self.status = status
+    
+    def environ(self):
+        return {
+            'REQUEST_METHOD': self.method,
+            'PATH_INFO': self.path,
+            'QUERY_STRING': self.query,
+            'CONTENT_TYPE': self.content_type,
+            'CONTENT_LENGTH': str(len(self.body)),
+            'HTTP_AUTHORIZATION': f'Bearer {self.token}',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(self.body),
+            'wsgi.errors': BytesIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+    
+    def scope(self):
+        headers = [(b'host', b'testserver'), (b'authorization', f'Bearer {self.token}'.encode())]
+        if self.body:
+            headers += [(b'content-type', self.content_type.encode()), (b'content-length', str(len(self.body)).encode())]
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': self.method,
+            'scheme': 'http',
+            'path': self.path,
+            'raw_path': self.path.encode(),
+            'query_string': self.query.encode(),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+
+
+def student_session(token, class_id, question_id, image):
+    """The requests one student sends, in order; `image` is the upload for the submission."""
+    body = encode_multipart(BOUNDARY, {'question_id': question_id, 'image': image})
+    return [
+        StudentRequest('student_classes', 'GET', token),
+        StudentRequest('student_questions', 'GET', token, f'class_id={class_id}'),
+        StudentRequest('student_submit_answer', 'POST', token, body=body, content_type=MULTIPART_CONTENT, status=202),
+        StudentRequest('student_answers', 'GET', token, f'class_id={class_id}'),
+    ]
+
+
+def session_factory(prefix):
+    """
+    make_sessions() for run_concurrency: a session for every student login
+    of the class of a generate_dataset dataset, each submitting a new image
+    to its first question.
+    """
+    students = list(
+        Student.objects.select_related('user').filter(user__username__startswith=f'student-{prefix}-').order_by('id')
+    )
+    class_id = students[0].class_enrolled_id
+    question_id = Question.objects.filter(class_related_id=class_id).order_by('id').first().id
+    tokens = [str(CustomTokenObtainPairSerializer.get_token(student.user).access_token) for student in students]
+    counter = itertools.count()
+    
+    def make_sessions():
+        return [student_session(token, class_id, question_id, numbered_image(next(counter))) for token in tokens]
+    
+    return make_sessions
+
+
+def call_wsgi(handler, request):
+    """Send a request through a WSGI handler and return its status code."""
+    status = []
+    response = handler(request.environ(), lambda line, headers: status.append(int(line.split()[0])))
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return status[0]
+
+
+async def call_asgi(handler, request):
+    """Send a request through an ASGI handler and return its status code."""
+    status = []
+    body_sent = False
+    finished = asyncio.Event()
+    
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': request.body, 'more_body': False}
+        # The client stays connected until the whole response has arrived
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+    
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            finished.set()
+    
+    await handler(request.scope(), receive, send)
+    finished.set()
+    return status[0]
+
+
+async def run_burst(sessions, send):
+    """
+    Start every session at once; each sends its requests one after the
+    other with `send(request)`. Returns (wall time, [(name, latency, error)])
+    where error is the unexpected status code, or None.
+    """
+    samples = []
+    
+    async def run(session):
+        for request in session:
+            start = time.perf_counter()
+            status = await send(request)
+            samples.append((request.name, time.perf_counter() - start, None if status == request.status else status))
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(run(session) for session in sessions))
+    return time.perf_counter() - start, samples
+
+
+def latency_summary(latencies):
+    latencies = [latency * 1000 for latency in latencies]
+    # Percentiles need at least two samples
+    if len(latencies) < 2:
+        latencies = latencies * 2
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    summary = {f'p{p}_ms': round(cuts[p - 1], 3) for p in PERCENTILES}
+    summary['mean_ms'] = round(statistics.fmean(latencies), 3)
+    return summary
+
+
+def measure_mode(mode, make_sessions, threads=DEFAULT_THREADS):
+    """Run one burst of sessions in `mode` ('wsgi' or 'asgi') and summarise it."""
+    # Every mode starts from a cold read cache
+    cache.clear()
+    with override_settings(ROOT_URLCONF=student_urlconf(views if mode == 'wsgi' else async_views)):
+        sessions = make_sessions()
+        if mode == 'wsgi':
+            handler = WSGIHandler()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                async def send(request):
+                    return await asyncio.get_running_loop().run_in_executor(pool, call_wsgi, handler, request)
+                wall, samples = asyncio.run(run_burst(sessions, send))
+        else:
+            handler = ASGIHandler()
+            wall, samples = asyncio.run(run_burst(sessions, lambda request: call_asgi(handler, request)))
+    
+    errors = Counter(f'{name} {error}' for name, _, error in samples if error is not None)
+    result = {
+        'requests': len(samples),
+        'errors': dict(errors),
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(samples) / wall, 1),
+    }
+    result.update(latency_summary([latency for _, latency, _ in samples]))
+    result['endpoints'] = {
+        name: latency_summary([latency for sample_name, latency, _ in samples if sample_name == name])
+        for name in dict.fromkeys(name for name, _, _ in samples)
+    }
+    return result
+
+
+def run_concurrency(make_sessions, modes=MODES, threads=DEFAULT_THREADS, progress=None):
+    """
+    Measure a burst of the sessions from make_sessions() (called afresh for
+    each mode, so uploads differ) in every mode. Returns {mode: result};
+    raises BenchmarkError if any request got an unexpected status.
+    """
+    results = {}
+    for mode in modes:
+        if progress:
+            progress(mode)
+        results[mode] = measure_mode(mode, make_sessions, threads)
+        if results[mode]['errors']:
+            errors = ', '.join(f'{count} x {error}' for error, count in results[mode]['errors'].items())
+            raise BenchmarkError(f"{mode}: unexpected statuses: {errors}")
+    return results
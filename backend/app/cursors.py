@@ -0,0 +1,56 @@
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from rest_framework.exceptions import ValidationError
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(watermark):
+    """
+    Encode a datetime watermark as an opaque, URL-safe cursor string.
+    """
+    if watermark is None:
+        return ''
+    micros = (watermark - EPOCH) // timedelta(microseconds=1)
+    return base64.urlsafe_b64encode(str(micros).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor back into an aware datetime.
+    An empty cursor means "from the beginning" and decodes to None.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        micros = int(base64.urlsafe_b64decode(padded.encode()).decode())
+        return EPOCH + timedelta(microseconds=micros)
+    except (binascii.Error, ValueError, UnicodeDecodeError, OverflowError, OSError):
+        raise ValidationError("Invalid cursor")
+
+
+def encode_keyset_cursor(created_at, pk):
+    """
+    Encode the (created_at, id) position of the last row of a page as an
+    opaque cursor for keyset pagination.
+    """
+    micros = (created_at - EPOCH) // timedelta(microseconds=1)
+    return base64.urlsafe_b64encode(f'{micros}:{pk}'.encode()).decode().rstrip('=')
+
+
+def decode_keyset_cursor(cursor):
+    """
+    Decode a cursor produced by encode_keyset_cursor into (created_at, id).
+    An empty cursor means "first page" and decodes to None.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        micros, pk = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (binascii.Error, ValueError, UnicodeDecodeError, OverflowError, OSError):
+        raise ValidationError("Invalid cursor")
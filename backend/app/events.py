@@ -0,0 +1,167 @@
+"""
+Live answer events, fanned out to Server-Sent Events streams.
+
+Views publish events after their transaction commits; the SSE views in
+``views.py`` subscribe to a channel per question (instructors) or per
+student. By default fan-out happens in-process, which is enough for a
+single ASGI worker. Set ``ANSWER_EVENTS_REDIS_URL`` to relay events through
+Redis (or any Redis-compatible server) when running several workers.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'answers:'
+
+
+def question_channel(question_id):
+    return f'{CHANNEL_PREFIX}question:{question_id}'
+
+
+def student_channel(student_id):
+    return f'{CHANNEL_PREFIX}student:{student_id}'
+
+
+def _offer(queue, message):
+    """Put a message on a subscriber queue, dropping the oldest one if it is full."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class LocalBroker:
+    """In-process publish/subscribe broker for a single worker process."""
+    
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+    
+    def publish(self, channel, message):
+        """Deliver a message to every subscriber of a channel. Safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                pass  # Subscriber's event loop has already closed
+    
+    async def listen(self, channels, timeout):
+        """
+        Yield messages published to any of `channels`. Yields None whenever
+        `timeout` seconds pass without a message so callers can send heartbeats.
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), timeout)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                for channel in channels:
+                    self._subscribers[channel].discard(subscriber)
+                    if not self._subscribers[channel]:
+                        del self._subscribers[channel]
+
+
+class RedisBroker(LocalBroker):
+    """
+    Broker that publishes through Redis so every worker process sees every event.
+    Each process keeps one pattern subscription and fans messages out locally.
+    """
+    
+    def __init__(self, url, queue_size=100):
+        import redis
+        
+        super().__init__(queue_size=queue_size)
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+        self._relays = {}
+    
+    def publish(self, channel, message):
+        try:
+            self._client.publish(channel, json.dumps(message))
+        except Exception:
+            logger.exception("Failed to publish answer event to Redis")
+    
+    async def _relay(self):
+        import redis.asyncio
+        
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+        try:
+            async for message in pubsub.listen():
+                if message['type'] != 'pmessage':
+                    continue
+                channel = message['channel'].decode()
+                super().publish(channel, json.loads(message['data']))
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+    
+    async def listen(self, channels, timeout):
+        loop = asyncio.get_running_loop()
+        relay = self._relays.get(loop)
+        if relay is None or relay.done():
+            self._relays[loop] = loop.create_task(self._relay())
+        async for message in super().listen(channels, timeout):
+            yield message
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the process-wide broker configured by ANSWER_EVENTS_REDIS_URL."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            redis_url = getattr(settings, 'ANSWER_EVENTS_REDIS_URL', '')
+            _broker = RedisBroker(redis_url) if redis_url else LocalBroker()
+        return _broker
+
+
+def publish_answer_event(event_type, answer, payload):
+    """
+    Publish an answer event to the answer's question and student channels
+    once the current transaction commits.
+    """
+    message = {'type': event_type, 'answer': payload}
+    channels = [question_channel(answer.question_id), student_channel(answer.student_id)]
+    
+    def send():
+        broker = get_broker()
+        for channel in channels:
+            broker.publish(channel, message)
+    
+    transaction.on_commit(send)
+
+
+def format_sse(message):
+    """Encode a message as a Server-Sent Events frame (None becomes a heartbeat comment)."""
+    if message is None:
+        return ': keep-alive\n\n'
+    return f"event: {message['type']}\ndata: {json.dumps(message['answer'])}\n\n"
+
+
+async def event_stream(channels):
+    """Async iterator of SSE frames for a list of channels, with periodic heartbeats."""
+    heartbeat = getattr(settings, 'ANSWER_EVENTS_HEARTBEAT', 15)
+    yield 'retry: 3000\n\n'
+    async for message in get_broker().listen(channels, heartbeat):
+        yield format_sse(message)
@@ -0,0 +1,264 @@
+"""
+Streaming ZIP export of answer images.
+
+The archive is written on the fly, one chunk at a time, and never exists as
+a whole on disk or in memory. Images are stored uncompressed (they are
+already compressed) with their CRC in a data descriptor after the data, so
+every header has a fixed length: the total size and the offset of each
+byte are known before anything is read, which is what makes HTTP Range
+requests (resuming an interrupted download, see ``ranges.py``) possible. CRCs of the
+content-addressed images are cached, so resuming part-way through an
+archive does not re-read the files before the requested range.
+"""
+import csv
+import hashlib
+import io
+import os
+import struct
+import zlib
+from datetime import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Answer
+
+CHUNK_SIZE = 64 * 1024
+MANIFEST_NAME = 'manifest.csv'
+CRC_CACHE_PREFIX = 'exports:crc'
+# A week: long enough for any resumed download, and gone once the images are
+CRC_CACHE_TIMEOUT = 7 * 24 * 3600
+
+# General purpose flags: sizes and CRC follow the data, names are UTF-8
+ZIP_FLAGS = 0x08 | 0x800
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_COUNT_LIMIT = 0xFFFF
+EXTERNAL_ATTRIBUTES = 0o100644 << 16
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+ZIP64_OFFSET_EXTRA = struct.Struct('<HHQ')
+ZIP64_END = struct.Struct('<IQHHIIQQQQ')
+ZIP64_LOCATOR = struct.Struct('<IIQI')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+
+
+def dos_timestamp(moment):
+    """(time, date) of a datetime in the MS-DOS format used by ZIP headers."""
+    moment = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+    moment = max(moment.replace(tzinfo=None), datetime(1980, 1, 1))
+    return (
+        (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2),
+        ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day,
+    )
+
+
+class ZipMember:
+    """One file of the archive: its path inside the ZIP and where to read it from."""
+    
+    def __init__(self, arcname, modified, size=None, storage=None, name=None, content=None):
+        self.arcname = arcname.encode('utf-8')
+        self.size = len(content) if content is not None else size
+        self.time, self.date = dos_timestamp(modified)
+        self.storage = storage
+        self.name = name
+        self.content = content
+        self.offset = None
+        self._crc = zlib.crc32(content) if content is not None else None
+    
+    @property
+    def cache_key(self):
+        return f'{CRC_CACHE_PREFIX}:{hashlib.md5(self.name.encode()).hexdigest()}:{self.size}'
+    
+    def chunks(self, skip=0):
+        """The file's bytes from offset `skip`, computing its CRC on a full read."""
+        if self.content is not None:
+            yield self.content[skip:]
+            return
+        crc = 0
+        with self.storage.open(self.name, 'rb') as f:
+            f.seek(skip)
+            while chunk := f.read(CHUNK_SIZE):
+                if not skip:
+                    crc = zlib.crc32(chunk, crc)
+                yield chunk
+        if not skip:
+            self.remember_crc(crc)
+    
+    def remember_crc(self, crc):
+        self._crc = crc
+        # Stored names are content-addressed, so a name's CRC never changes
+        cache.set(self.cache_key, crc, timeout=CRC_CACHE_TIMEOUT)
+    
+    @property
+    def crc(self):
+        if self._crc is None:
+            crc = cache.get(self.cache_key)
+            if crc is None:
+                crc = 0
+                with self.storage.open(self.name, 'rb') as f:
+                    while chunk := f.read(CHUNK_SIZE):
+                        crc = zlib.crc32(chunk, crc)
+                self.remember_crc(crc)
+            self._crc = crc
+        return self._crc
+    
+    def local_header(self):
+        return LOCAL_HEADER.pack(
+            0x04034b50, ZIP_VERSION, ZIP_FLAGS, 0, self.time, self.date,
+            0, self.size, self.size, len(self.arcname), 0,
+        ) + self.arcname
+    
+    def data_descriptor(self):
+        return DATA_DESCRIPTOR.pack(0x08074b50, self.crc, self.size, self.size)
+    
+    def central_header_size(self):
+        extra = ZIP64_OFFSET_EXTRA.size if self.offset >= ZIP32_LIMIT else 0
+        return CENTRAL_HEADER.size + len(self.arcname) + extra
+    
+    def central_header(self):
+        zip64 = self.offset >= ZIP32_LIMIT
+        extra = ZIP64_OFFSET_EXTRA.pack(1, 8, self.offset) if zip64 else b''
+        return CENTRAL_HEADER.pack(
+            0x02014b50, ZIP64_VERSION, ZIP64_VERSION if zip64 else ZIP_VERSION, ZIP_FLAGS, 0,
+            self.time, self.date, self.crc, self.size, self.size,
+            len(self.arcname), len(extra), 0, 0, 0, EXTERNAL_ATTRIBUTES,
+            ZIP32_LIMIT if zip64 else self.offset,
+        ) + self.arcname + extra
+
+
+class ZipStream:
+    """
+    An uncompressed ZIP of `members`, laid out up front so that any byte
+    range of it can be streamed. Uses ZIP64 records only when the archive
+    outgrows the classic format.
+    """
+    
+    def __init__(self, members):
+        self.members = members
+        self.parts = []
+        offset = 0
+        for member in members:
+            if member.size >= ZIP32_LIMIT:
+                raise ValueError(f"{member.arcname.decode()} is too large for an export")
+            member.offset = offset
+            header_size = LOCAL_HEADER.size + len(member.arcname)
+            self.parts.append((offset, header_size, lambda skip, m=member: [m.local_header()[skip:]]))
+            offset += header_size
+            self.parts.append((offset, member.size, member.chunks))
+            offset += member.size
+            self.parts.append((offset, DATA_DESCRIPTOR.size, lambda skip, m=member: [m.data_descriptor()[skip:]]))
+            offset += DATA_DESCRIPTOR.size
+        
+        self.central_offset = offset
+        self.central_size = sum(member.central_header_size() for member in members)
+        self.zip64 = (
+            len(members) >= ZIP32_COUNT_LIMIT or self.central_offset >= ZIP32_LIMIT
+            or self.central_size >= ZIP32_LIMIT
+        )
+        end_size = END_OF_CENTRAL_DIRECTORY.size
+        if self.zip64:
+            end_size += ZIP64_END.size + ZIP64_LOCATOR.size
+        self.parts.append((offset, self.central_size + end_size, self.central_directory))
+        self.size = offset + self.central_size + end_size
+    
+    def central_records(self):
+        """The central directory headers and end records; needs every member's CRC."""
+        for member in self.members:
+            yield member.central_header()
+        count = len(self.members)
+        if self.zip64:
+            end_offset = self.central_offset + self.central_size
+            yield ZIP64_END.pack(
+                0x06064b50, ZIP64_END.size - 12, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                count, count, self.central_size, self.central_offset,
+            )
+            yield ZIP64_LOCATOR.pack(0x07064b50, 0, end_offset, 1)
+            yield END_OF_CENTRAL_DIRECTORY.pack(
+                0x06054b50, 0, 0, ZIP32_COUNT_LIMIT, ZIP32_COUNT_LIMIT, ZIP32_LIMIT, ZIP32_LIMIT, 0,
+            )
+        else:
+            yield END_OF_CENTRAL_DIRECTORY.pack(
+                0x06054b50, 0, 0, count, count, self.central_size, self.central_offset, 0,
+            )
+    
+    def central_directory(self, skip=0):
+        for record in self.central_records():
+            if skip >= len(record):
+                skip -= len(record)
+                continue
+            yield record[skip:]
+            skip = 0
+    
+    def iter_range(self, start=0, end=None):
+        """Yield the bytes from `start` to `end` inclusive (default: to the end)."""
+        end = self.size - 1 if end is None else end
+        for part_start, length, produce in self.parts:
+            part_end = part_start + length - 1
+            if part_end < start or length == 0:
+                continue
+            if part_start > end:
+                break
+            position = max(start, part_start)
+            for chunk in produce(position - part_start):
+                chunk = chunk[:end - position + 1]
+                if chunk:
+                    yield chunk
+                position += len(chunk)
+                if position > end:
+                    break
+    
+    @property
+    def etag(self):
+        """Changes whenever the archive's contents or layout would."""
+        digest = hashlib.sha256()
+        for member in self.members:
+            digest.update(member.arcname)
+            digest.update(f'|{member.name}|{member.size}|{member.time}|{member.date}\n'.encode())
+            if member.content is not None:
+                digest.update(member.content)
+        return f'"{digest.hexdigest()[:32]}"'
+
+
+def export_arcname(answer, extension):
+    """Path of an answer image in the archive: one folder per question, files named by student."""
+    question = slugify(answer.question.question_text)[:40] or 'question'
+    student = slugify(answer.student.name)[:40] or 'student'
+    return f'{answer.question_id}-{question}/{student}-{answer.student_id}-{answer.id}{extension}'
+
+
+def answer_export(answers):
+    """
+    A ZipStream of the images of `answers` (with question and student
+    loaded) and a manifest.csv describing each one. Images missing from
+    storage are listed in the manifest but left out of the archive.
+    """
+    storage = Answer._meta.get_field('image').storage
+    members = []
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow([
+        'file', 'question_id', 'question_text', 'student_id', 'student_name', 'answer_id', 'liked', 'created_at',
+    ])
+    latest = None
+    for answer in answers:
+        name = answer.image.name
+        arcname = export_arcname(answer, os.path.splitext(name)[1].lower())
+        try:
+            size = storage.size(name)
+        except OSError:
+            arcname = ''
+        else:
+            members.append(ZipMember(arcname, answer.created_at, size, storage=storage, name=name))
+        writer.writerow([
+            arcname, answer.question_id, answer.question.question_text, answer.student_id,
+            answer.student.name, answer.id, answer.liked, answer.created_at.isoformat(),
+        ])
+        latest = max(latest or answer.created_at, answer.created_at)
+    
+    members.append(ZipMember(MANIFEST_NAME, latest or timezone.now(), content=manifest.getvalue().encode('utf-8')))
+    return ZipStream(members)
@@ -0,0 +1,228 @@
+"""
+Resized derivatives (thumbnails, slide-size, WebP/JPEG) of uploaded images.
+
+Derivatives are rendered from the original upload at ingest, stored under a
+``derivatives/`` folder next to it, and recorded with their dimensions in the
+row's ``image_derivatives`` field. They are written through the image field's
+storage, like the image itself. Rows uploaded before derivatives existed get
+them the first time they are serialized: with IMAGE_JOBS_ASYNC on, as an
+ImageJob, their original being served until a worker has rendered them;
+with it off, where no worker runs, they are rendered on that request.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .caching import invalidate
+from .models import Answer, ImageJob, ImageStatus
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES = {
+    'slide': {'max_size': 1280, 'format': 'JPEG'},
+    'slide_webp': {'max_size': 1280, 'format': 'WEBP'},
+    'thumb': {'max_size': 200, 'format': 'JPEG'},
+    'thumb_webp': {'max_size': 200, 'format': 'WEBP'},
+}
+IMAGE_SIZES = ('original',) + tuple(DERIVATIVES)
+
+# Threads rendering a batch of images inline when IMAGE_JOBS_ASYNC is off
+INLINE_RENDER_THREADS = 4
+
+# Errors decoding an image, which rendering it again will not fix
+UNDECODABLE_IMAGE_ERRORS = (OSError, SyntaxError, ValueError, Image.DecompressionBombError)
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+def derivative_path(image_name, name):
+    """Storage path of a derivative, e.g. answers/derivatives/photo.png.thumb.jpg."""
+    directory, filename = os.path.split(image_name)
+    extension = EXTENSIONS[DERIVATIVES[name]['format']]
+    return os.path.join(directory, 'derivatives', f'{filename}.{name}.{extension}')
+
+
+def derivative_source(path):
+    """
+    The image a derivative path was rendered from (the inverse of
+    derivative_path), or None if `path` is not a derivative.
+    """
+    directory, filename = os.path.split(path)
+    parent, folder = os.path.split(directory)
+    parts = filename.rsplit('.', 2)
+    if folder != 'derivatives' or len(parts) != 3 or parts[1] not in DERIVATIVES:
+        return None
+    return os.path.join(parent, parts[0])
+
+
+def encode_image(image, image_format, **options):
+    """Encode a PIL image to bytes, flattening transparency for JPEG."""
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def render_derivative_images(data):
+    """
+    Verify and decode an image once and encode every derivative.
+    Works on raw bytes only, so it can run in a worker process.
+    Returns {name: (encoded_bytes, width, height)}.
+    """
+    Image.open(BytesIO(data)).verify()
+    source = Image.open(BytesIO(data))
+    source.load()
+    source = ImageOps.exif_transpose(source)
+    
+    rendered = {}
+    # Largest first, so smaller sizes are resampled from an already reduced image
+    for name, spec in sorted(DERIVATIVES.items(), key=lambda item: -item[1]['max_size']):
+        resized = source.copy()
+        resized.thumbnail((spec['max_size'], spec['max_size']), Image.LANCZOS)
+        source = resized
+        rendered[name] = (encode_image(resized, spec['format'], quality=82), resized.width, resized.height)
+    return rendered
+
+
+def save_derivatives(storage, image_name, rendered):
+    """
+    Write rendered derivatives of an image to its storage.
+    Returns {name: {'path', 'width', 'height'}}.
+    """
+    derivatives = {}
+    for name, (data, width, height) in rendered.items():
+        path = storage.save_as(derivative_path(image_name, name), ContentFile(data))
+        derivatives[name] = {'path': path, 'width': width, 'height': height}
+    return derivatives
+
+
+def read_image(image_field):
+    with image_field.open('rb') as f:
+        return f.read()
+
+
+def lacks_derivatives(image, derivatives, status):
+    """Whether a ready image is missing derivatives, as images uploaded before they existed are."""
+    return bool(image) and status == ImageStatus.READY and not all(name in (derivatives or {}) for name in DERIVATIVES)
+
+
+def queue_derivatives(model, ids):
+    """
+    Queue the rendering of missing derivatives for rows of `model`, one
+    ImageJob per row that has none pending: two queries for any number of
+    rows. A worker then renders them, or marks an undecodable image failed,
+    so the row is not queued again.
+    """
+    target = f'{model._meta.model_name}_id'
+    queued = set(ImageJob.objects.filter(
+        **{f'{target}__in': ids}, status__in=[ImageJob.Status.PENDING, ImageJob.Status.RUNNING]
+    ).values_list(target, flat=True))
+    ImageJob.objects.bulk_create([ImageJob(**{target: pk}) for pk in ids if pk not in queued])
+
+
+def render_stored_derivatives(storage, name):
+    """
+    Read and render the derivatives of a stored image for
+    render_missing_derivatives, on a thread of its pool. Returns
+    (rendered, undecodable); rendered is None when the image could not be
+    read or decoded.
+    """
+    try:
+        with storage.open(name, 'rb') as f:
+            data = f.read()
+    except OSError:
+        logger.warning("Could not read %s to render its derivatives", name, exc_info=True)
+        return None, False
+    try:
+        return render_derivative_images(data), False
+    except UNDECODABLE_IMAGE_ERRORS:
+        logger.warning("Could not decode %s to render its derivatives", name, exc_info=True)
+        return None, True
+
+
+def render_missing_derivatives(model, ids):
+    """
+    Render and store the derivatives of rows of `model` right away, on a
+    thread pool, for when no worker would run their jobs. An image that
+    cannot be decoded is marked failed so it is not tried again. Returns
+    {id: fields} of the fields changed on each row.
+    """
+    columns = ['id', 'image'] + (['class_related_id'] if model is not Answer else [])
+    rows = list(model.objects.filter(pk__in=ids, status=ImageStatus.READY).exclude(image='').values(*columns))
+    storage = model._meta.get_field('image').storage
+    with ThreadPoolExecutor(max_workers=INLINE_RENDER_THREADS) as pool:
+        results = list(pool.map(lambda row: render_stored_derivatives(storage, row['image']), rows))
+    
+    changed = {}
+    for row, (rendered, undecodable) in zip(rows, results):
+        if rendered is not None:
+            fields = {'image_derivatives': save_derivatives(storage, row['image'], rendered)}
+        elif undecodable:
+            fields = {'status': ImageStatus.FAILED}
+        else:
+            continue
+        if model is Answer:
+            # Like a job finishing, so delta listings pick up the new URLs
+            fields['updated_at'] = timezone.now()
+        # Only if the row still has the image the derivatives were rendered from
+        if model.objects.filter(pk=row['id'], image=row['image'], status=ImageStatus.READY).update(**fields):
+            changed[row['id']] = fields
+    invalidate(classes={row['class_related_id'] for row in rows if row['id'] in changed and 'class_related_id' in row})
+    return changed
+
+
+def backfill_derivatives(model, ids):
+    """
+    Give rows of `model` that lack derivatives their derivatives: queued
+    for the workers when IMAGE_JOBS_ASYNC is on (returning {}), rendered
+    right away otherwise (returning render_missing_derivatives' changes).
+    """
+    if getattr(settings, 'IMAGE_JOBS_ASYNC', False):
+        queue_derivatives(model, ids)
+        return {}
+    return render_missing_derivatives(model, ids)
+
+
+def ensure_derivatives(instance):
+    """
+    Return the derivatives of instance.image, giving it any that are
+    missing with backfill_derivatives (the original is served until then).
+    """
+    derivatives = instance.image_derivatives or {}
+    if lacks_derivatives(instance.image, derivatives, instance.status):
+        for name, value in backfill_derivatives(type(instance), [instance.pk]).get(instance.pk, {}).items():
+            setattr(instance, name, value)
+        derivatives = instance.image_derivatives or {}
+    return derivatives
+
+
+def build_image_urls(instance, request):
+    """Absolute URLs of the original image and every derivative."""
+    derivatives = ensure_derivatives(instance)
+    urls = {'original': request.build_absolute_uri(instance.image.url)}
+    for name in DERIVATIVES:
+        if name in derivatives:
+            urls[name] = request.build_absolute_uri(instance.image.storage.url(derivatives[name]['path']))
+    return urls
+
+
+def build_image_url(instance, request):
+    """
+    Absolute URL of the image at the size requested with ?size=, falling
+    back to the original when no size (or an unknown one) is requested.
+    """
+    size = request.GET.get('size')
+    if size in DERIVATIVES:
+        info = ensure_derivatives(instance).get(size)
+        if info:
+            return request.build_absolute_uri(instance.image.storage.url(info['path']))
+    return request.build_absolute_uri(instance.image.url)
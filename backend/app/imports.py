@@ -0,0 +1,325 @@
+"""
+Bulk imports: whole slide decks as questions, and CSV class rosters.
+
+Deck slides arrive as a ZIP archive or as several files in one multipart
+body, optionally with a manifest of question texts. Uploads are spooled to
+disk rather than held in memory, checked from their headers (see
+``ingest.py``), and the Question rows are created with one bulk insert.
+The slides are then normalized and their derivatives rendered by the image
+workers like any other upload (see ``jobs.py``).
+
+Rosters are read from CSV one row at a time and upserted in batches, keyed
+on the student's roster id within the class, so memory use does not grow
+with the file. An email column links each student to the account with
+that email.
+"""
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from django.core.validators import validate_email
+from django.db import DatabaseError, transaction
+from rest_framework.exceptions import ValidationError
+
+from .caching import invalidate
+from .ingest import check_image
+from .jobs import schedule_bulk_image_processing
+from .media import retain_blobs
+from .models import ImageStatus, Question, Student
+from .serializers import ALLOWED_IMAGE_EXTENSIONS, accounts_by_email, validate_image_extension, validate_image_size
+
+MAX_DECK_SLIDES = 200
+MANIFEST_NAME = 'manifest.json'
+MAX_MANIFEST_SIZE = 1024 * 1024
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class InvalidSlides(Exception):
+    """Raised when some slides of a deck fail validation; `slides` lists them."""
+    
+    def __init__(self, slides):
+        super().__init__(f"{len(slides)} slide(s) are not valid images")
+        self.slides = slides
+
+
+def natural_key(name):
+    """Sort key that puts slide2.png before slide10.png."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def parse_manifest(raw):
+    """
+    Question texts from a manifest: a JSON list in slide order, or a JSON
+    object mapping slide filenames to texts. Returns None when empty.
+    """
+    if not raw:
+        return None
+    try:
+        manifest = json.loads(raw)
+    except ValueError:
+        raise ValidationError("manifest is not valid JSON")
+
+    if isinstance(manifest, list) and all(isinstance(text, str) for text in manifest):
+        return manifest
+    if isinstance(manifest, dict) and all(isinstance(text, str) for text in manifest.values()):
+        return manifest
+    raise ValidationError("manifest must be a list of question texts or an object of filename: text")
+
+
+def archive_slides(archive):
+    """
+    Extract the images of a ZIP archive to temporary files one member at a
+    time, in natural filename order. Returns (slides, manifest text or None).
+    Other files in the archive are ignored.
+    """
+    try:
+        zip_file = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise ValidationError("archive is not a valid ZIP file")
+
+    with zip_file:
+        members = []
+        manifest = None
+        for info in zip_file.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            if name == MANIFEST_NAME:
+                if info.file_size > MAX_MANIFEST_SIZE:
+                    raise ValidationError(f"{MANIFEST_NAME} is too large")
+                manifest = zip_file.read(info).decode('utf-8', errors='replace')
+            elif os.path.splitext(name)[1].lower() in ALLOWED_IMAGE_EXTENSIONS:
+                members.append(info)
+
+        if len(members) > MAX_DECK_SLIDES:
+            raise ValidationError(f"A deck can have at most {MAX_DECK_SLIDES} slides")
+        members.sort(key=lambda info: natural_key(info.filename))
+
+        slides = []
+        try:
+            for info in members:
+                # Checked before extracting so an oversized member is never written out
+                validate_image_size(info.file_size)
+                spool = tempfile.TemporaryFile()
+                with zip_file.open(info) as source:
+                    shutil.copyfileobj(source, spool, COPY_CHUNK_SIZE)
+                spool.seek(0)
+                slides.append(File(spool, name=os.path.basename(info.filename)))
+        except Exception:
+            for slide in slides:
+                slide.close()
+            raise
+    return slides, manifest
+
+
+def slide_error(slide):
+    """Why a slide cannot be imported, or None."""
+    try:
+        validate_image_extension(slide.name)
+        validate_image_size(slide.size)
+        check_image(slide)
+    except ValidationError as e:
+        return str(e.detail[0])
+    return None
+
+
+def question_texts(slides, manifest):
+    """Question text for each slide, from the manifest or numbered by position."""
+    if isinstance(manifest, list) and len(manifest) != len(slides):
+        raise ValidationError(f"manifest has {len(manifest)} question texts for {len(slides)} slides")
+
+    texts = []
+    for index, slide in enumerate(slides):
+        if isinstance(manifest, list):
+            text = manifest[index]
+        elif isinstance(manifest, dict):
+            text = manifest.get(slide.name)
+        else:
+            text = None
+        texts.append(text or f"Slide {index + 1}")
+    return texts
+
+
+def import_deck(class_obj, slides, manifest=None):
+    """
+    Create one question per slide in `class_obj`, in slide order, and queue
+    their images for processing (processed once the questions are committed
+    when IMAGE_JOBS_ASYNC is off). Raises InvalidSlides if any slide fails
+    validation, in which case nothing is created.
+    """
+    if not slides:
+        raise ValidationError("No slide images were uploaded")
+    if len(slides) > MAX_DECK_SLIDES:
+        raise ValidationError(f"A deck can have at most {MAX_DECK_SLIDES} slides")
+    texts = question_texts(slides, manifest)
+
+    invalid = [{'filename': slide.name, 'error': error} for slide in slides if (error := slide_error(slide))]
+    if invalid:
+        raise InvalidSlides(invalid)
+
+    # Stored one at a time so identical slides resolve to one content-addressed file
+    field = Question._meta.get_field('image')
+    names = [field.storage.save(field.generate_filename(None, slide.name), slide) for slide in slides]
+
+    with transaction.atomic():
+        # Processing until their images are, so listings leave them to it meanwhile
+        questions = Question.objects.bulk_create([
+            Question(question_text=text, image=name, class_related=class_obj, status=ImageStatus.PROCESSING)
+            for text, name in zip(texts, names)
+        ])
+        retain_blobs(names)
+        if getattr(settings, 'IMAGE_JOBS_ASYNC', False):
+            # Queued with the rows, so a job never finds its question missing
+            schedule_bulk_image_processing(questions)
+        else:
+            # Rendered once the rows are committed, rather than holding the transaction open for the whole deck
+            transaction.on_commit(lambda: schedule_bulk_image_processing(questions))
+        invalidate(classes=[class_obj.id])
+    return questions
+
+
+ROSTER_BATCH_SIZE = 500
+ROSTER_REQUIRED_COLUMNS = ('roster_id', 'name')
+MAX_REPORTED_ROSTER_ERRORS = 100
+
+
+class RosterImportResult:
+    """Counts of a roster import, with the first MAX_REPORTED_ROSTER_ERRORS row errors."""
+    
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+    
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ROSTER_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+    
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'failed': self.failed, 'errors': self.errors}
+
+
+def roster_row_error(row):
+    """Why a roster row cannot be imported, or None if it is valid."""
+    if not row['roster_id']:
+        return "roster_id is required"
+    if len(row['roster_id']) > Student._meta.get_field('roster_id').max_length:
+        return "roster_id is too long"
+    if not row['name']:
+        return "name is required"
+    if len(row['name']) > Student._meta.get_field('name').max_length:
+        return "name is too long"
+    if row.get('phone') and len(row['phone']) > Student._meta.get_field('phone').max_length:
+        return "phone is too long"
+    if row.get('email'):
+        try:
+            validate_email(row['email'])
+        except DjangoValidationError:
+            return "email is not valid"
+    return None
+
+
+def link_accounts(batch, result):
+    """
+    Link the students of a batch ({roster_id: (line, Student, email)}) to
+    the accounts with their emails, in one query. Rows whose email matches
+    no account are reported and left out of the batch.
+    """
+    accounts = accounts_by_email(email for _, _, email in batch.values())
+    for roster_id, (line, student, email) in list(batch.items()):
+        if email and email.lower() not in accounts:
+            result.add_error(line, "No account has this email")
+            del batch[roster_id]
+        else:
+            student.user_id = accounts.get(email.lower()) if email else None
+
+
+def upsert_roster_batch(class_obj, batch, update_fields, result):
+    """
+    Insert or update one batch of students ({roster_id: (line, Student,
+    email)}) with a single upsert, linking accounts first when the file has
+    an email column. A database error fails the batch's rows only.
+    """
+    if 'user' in update_fields:
+        link_accounts(batch, result)
+        if not batch:
+            return
+    try:
+        with transaction.atomic():
+            existing = dict(
+                Student.objects.filter(class_enrolled=class_obj, roster_id__in=batch).values_list('roster_id', 'user_id')
+            )
+            Student.objects.bulk_create(
+                [student for _, student, _ in batch.values()],
+                update_conflicts=True,
+                unique_fields=['class_enrolled', 'roster_id'],
+                update_fields=update_fields,
+            )
+            if 'user' in update_fields:
+                # Bulk upserts skip the save signals that invalidate the class listings of linked users
+                invalidate(users={*existing.values(), *(student.user_id for _, student, _ in batch.values())})
+    except DatabaseError as e:
+        for line, _, _ in batch.values():
+            result.add_error(line, f"Could not be saved: {e}")
+        return
+    result.created += len(batch) - len(existing)
+    result.updated += len(existing)
+
+
+def import_roster(class_obj, lines, batch_size=ROSTER_BATCH_SIZE):
+    """
+    Upsert the students of `class_obj` from CSV `lines` (any iterable of
+    text lines, e.g. an open file, read lazily). The header must have
+    roster_id and name columns; phone and email are optional and only
+    updated when present. Email links the student to the account with that
+    email (blank unlinks it). Invalid rows, and rows whose email matches no
+    account, are reported without stopping the import, and a roster id
+    repeated in the file keeps its last row.
+    """
+    reader = csv.reader(lines)
+    try:
+        header = next(reader, None)
+        columns = [column.strip().lower() for column in header or []]
+        missing = [column for column in ROSTER_REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise ValidationError(f"CSV header is missing column(s): {', '.join(missing)}")
+        update_fields = ['name'] + (['phone'] if 'phone' in columns else []) + (['user'] if 'email' in columns else [])
+        
+        result = RosterImportResult()
+        batch = {}
+        for values in reader:
+            if not any(value.strip() for value in values):
+                continue
+            row = {column: value.strip() for column, value in zip(columns, values)}
+            row.setdefault('roster_id', '')
+            row.setdefault('name', '')
+            error = roster_row_error(row)
+            if error:
+                result.add_error(reader.line_num, error)
+                continue
+            
+            batch[row['roster_id']] = (reader.line_num, Student(
+                class_enrolled=class_obj, roster_id=row['roster_id'], name=row['name'], phone=row.get('phone') or None,
+            ), row.get('email'))
+            if len(batch) >= batch_size:
+                upsert_roster_batch(class_obj, batch, update_fields, result)
+                batch = {}
+        if batch:
+            upsert_roster_batch(class_obj, batch, update_fields, result)
+    except csv.Error as e:
+        raise ValidationError(f"Malformed CSV on line {reader.line_num}: {e}")
+    except UnicodeDecodeError:
+        raise ValidationError("CSV file must be UTF-8 encoded")
+    finally:
+        # Bulk upserts skip the save signals that invalidate cached rosters
+        invalidate(classes=[class_obj.id])
+    return result
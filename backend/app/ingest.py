@@ -0,0 +1,114 @@
+"""
+Normalization of uploaded images.
+
+Phone photos arrive as multi-megapixel JPEGs, often stored sideways with
+an EXIF orientation tag and carrying camera and location metadata. On the
+request only the file header is read (check_image): the real format must
+be JPEG, PNG or GIF and images over IMAGE_MAX_PIXELS are refused, before
+any pixel is decoded. The upload is stored as it came and decoded once by
+its image job (see ``jobs.py``), which turns it upright, downscales it to
+fit IMAGE_MAX_DIMENSION and re-encodes it as a progressive JPEG (WebP when
+it has transparency) without metadata. The normalized file replaces the
+upload, and its dimensions and size are recorded on the row.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework.exceptions import ValidationError
+
+# Formats accepted as uploads, as sniffed from the content (the extension is checked separately)
+SOURCE_FORMATS = ('JPEG', 'PNG', 'GIF')
+
+
+class InvalidImage(Exception):
+    """Raised when an image cannot be normalized; the message says why."""
+
+
+def fitted_size(size, max_dimension):
+    """`size` scaled down (never up) to fit within max_dimension on both sides."""
+    scale = min(1, max_dimension / max(size))
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def has_transparency(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def header_error(image, max_pixels):
+    """Why an opened (not yet decoded) image is refused, or None."""
+    if image.format not in SOURCE_FORMATS:
+        return "File content is not a JPEG, PNG or GIF image"
+    if image.width * image.height > max_pixels:
+        return f"Image is too large: {image.width}x{image.height} pixels (at most {max_pixels:,} pixels)"
+    return None
+
+
+def check_image(upload):
+    """
+    Read an upload's header and raise ValidationError unless it is a JPEG,
+    PNG or GIF image within IMAGE_MAX_PIXELS. No pixel is decoded.
+    """
+    max_pixels = getattr(settings, 'IMAGE_MAX_PIXELS', 40_000_000)
+    upload.seek(0)
+    try:
+        # Opening only parses the header; nothing is decoded until load()
+        with Image.open(upload) as image:
+            error = header_error(image, max_pixels)
+    except Image.DecompressionBombError:
+        error = f"Image is too large (at most {max_pixels:,} pixels)"
+    except (UnidentifiedImageError, SyntaxError, OSError):
+        error = "Not a valid image"
+    finally:
+        upload.seek(0)
+    if error:
+        raise ValidationError(error)
+    return upload
+
+
+def ingest_options():
+    """Settings for normalize_image_data, read up front so worker processes need none."""
+    return {
+        'max_dimension': getattr(settings, 'IMAGE_MAX_DIMENSION', 1920),
+        'max_pixels': getattr(settings, 'IMAGE_MAX_PIXELS', 40_000_000),
+        'quality': getattr(settings, 'IMAGE_INGEST_QUALITY', 85),
+    }
+
+
+def normalize_image_data(data, max_dimension, max_pixels, quality):
+    """
+    Decode an image once and return it upright, within `max_dimension` and
+    re-encoded without metadata, as (bytes, extension, width, height).
+    Works on raw bytes only, so it can run in a worker process. Raises
+    InvalidImage for anything check_image would refuse or that fails to
+    decode.
+    """
+    try:
+        with Image.open(BytesIO(data)) as image:
+            error = header_error(image, max_pixels)
+            if error:
+                raise InvalidImage(error)
+            
+            # JPEGs are decoded straight at the smallest scale still covering the final size
+            image.draft('RGB', fitted_size(image.size, max_dimension))
+            image.load()
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            icc_profile = image.info.get('icc_profile')
+            transparent = has_transparency(image)
+            # Turned upright once downscaled, when there are fewer pixels to move
+            image = ImageOps.exif_transpose(image).convert('RGBA' if transparent else 'RGB')
+    except Image.DecompressionBombError:
+        raise InvalidImage(f"Image is too large (at most {max_pixels:,} pixels)")
+    except (UnidentifiedImageError, SyntaxError, OSError):
+        raise InvalidImage("Not a valid image")
+    
+    buffer = BytesIO()
+    # Only the colour profile is carried over: EXIF (orientation, camera, location) is dropped
+    if transparent:
+        image.save(buffer, 'WEBP', quality=quality, icc_profile=icc_profile)
+        extension = 'webp'
+    else:
+        image.save(buffer, 'JPEG', quality=quality, progressive=True, optimize=True, icc_profile=icc_profile)
+        extension = 'jpg'
+    return buffer.getvalue(), extension, image.width, image.height
+
@@ -0,0 +1,283 @@
+"""
+Background processing of uploaded images through a DB-backed job queue.
+
+Uploads are checked from their headers and stored as they came on the
+request thread, and queued as ImageJob rows with the Answer/Question left
+in the ``processing`` state. Workers started with ``python manage.py
+run_image_workers`` claim jobs, read files and write results on a thread
+pool, and hand the CPU-bound step to a process pool: decoding the upload
+once, normalizing it (see ``ingest.py``) and rendering its derivatives.
+The normalized file then replaces the upload on the row. A job whose row is deleted or given another image
+while it runs is dropped rather than finished. ``IMAGE_JOBS_ASYNC`` is off
+by default, so images are processed inline on the request unless workers
+are running.
+"""
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from .caching import invalidate
+from .images import INLINE_RENDER_THREADS, read_image, render_derivative_images, save_derivatives
+from .ingest import InvalidImage, ingest_options, normalize_image_data
+from .models import Answer, ImageJob, ImageStatus, Question
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the upload itself is bad, so retrying will not help
+INVALID_IMAGE_ERRORS = (InvalidImage, UnidentifiedImageError, Image.DecompressionBombError, SyntaxError)
+
+# Fields describing the normalized image, unknown until its job has run
+NORMALIZED_FIELDS = ('image_width', 'image_height', 'image_bytes')
+
+
+def schedule_image_processing(instance):
+    """
+    Queue processing of instance.image, or process it right away when
+    IMAGE_JOBS_ASYNC is off. Call after the row has been saved.
+    """
+    if not instance.image:
+        return
+    
+    # Derivative files are shared by identical uploads, so only forget them here
+    forget_processed_image(instance)
+    if not getattr(settings, 'IMAGE_JOBS_ASYNC', False):
+        try:
+            finish_image_processing(instance, process_image_data(read_image(instance.image), ingest_options()))
+        except INVALID_IMAGE_ERRORS:
+            fail_image_processing(instance)
+        return
+    
+    instance.status = ImageStatus.PROCESSING
+    type(instance).objects.filter(pk=instance.pk).update(
+        status=instance.status, image_derivatives={}, **dict.fromkeys(NORMALIZED_FIELDS)
+    )
+    invalidate(classes=[getattr(instance, 'class_related_id', None)])
+    target = 'answer' if isinstance(instance, Answer) else 'question'
+    ImageJob.objects.create(**{target: instance}, normalize=True)
+
+
+def forget_processed_image(instance):
+    instance.image_derivatives = {}
+    for name in NORMALIZED_FIELDS:
+        setattr(instance, name, None)
+
+
+def process_image_data(data, options=None):
+    """
+    Normalize an upload with normalize_image_data `options` (or leave it as
+    it is when None) and render its derivatives. Works on raw bytes only,
+    so it can run in a worker process. Returns (normalized, rendered), with
+    normalized None when the image was left as it is.
+    """
+    normalized = normalize_image_data(data, **options) if options is not None else None
+    return normalized, render_derivative_images(normalized[0] if normalized else data)
+
+
+def process_image_file(image):
+    """Normalize a stored upload and render its derivatives, or return the error that makes it invalid."""
+    try:
+        return process_image_data(read_image(image), ingest_options()), None
+    except INVALID_IMAGE_ERRORS as e:
+        return None, e
+
+
+def store_processed_image(instance, processed):
+    """
+    Store the normalized image, if there is one, and the derivatives of a
+    process_image_data result. Returns the fields to record on the row.
+    """
+    normalized, rendered = processed
+    storage = instance.image.storage
+    fields = {}
+    name = instance.image.name
+    if normalized is not None:
+        data, extension, width, height = normalized
+        field = instance._meta.get_field('image')
+        name = storage.save(field.generate_filename(instance, f'image.{extension}'), ContentFile(data))
+        fields = {'image': name, 'image_width': width, 'image_height': height, 'image_bytes': len(data)}
+    fields['image_derivatives'] = save_derivatives(storage, name, rendered)
+    return fields
+
+
+def schedule_bulk_image_processing(instances):
+    """
+    schedule_image_processing for many saved rows of one model, with one
+    UPDATE and one job insert. When IMAGE_JOBS_ASYNC is off the images are
+    rendered inline on a thread pool instead.
+    """
+    instances = [instance for instance in instances if instance.image]
+    if not instances:
+        return
+    
+    for instance in instances:
+        forget_processed_image(instance)
+        # Rows from bulk_create lack the stored name that moves the reference when the normalized image replaces it
+        if getattr(instance, '_stored_image', None) is None:
+            instance._stored_image = instance.image.name
+    if not getattr(settings, 'IMAGE_JOBS_ASYNC', False):
+        with ThreadPoolExecutor(max_workers=INLINE_RENDER_THREADS) as pool:
+            results = list(pool.map(process_image_file, [instance.image for instance in instances]))
+        for instance, (processed, error) in zip(instances, results):
+            if error is None:
+                finish_image_processing(instance, processed)
+            else:
+                fail_image_processing(instance)
+        return
+    
+    model = type(instances[0])
+    model.objects.filter(pk__in=[instance.pk for instance in instances]).update(
+        status=ImageStatus.PROCESSING, image_derivatives={}, **dict.fromkeys(NORMALIZED_FIELDS)
+    )
+    for instance in instances:
+        instance.status = ImageStatus.PROCESSING
+    target = 'answer' if model is Answer else 'question'
+    ImageJob.objects.bulk_create([ImageJob(**{target: instance}, normalize=True) for instance in instances])
+    invalidate(classes={getattr(instance, 'class_related_id', None) for instance in instances})
+
+
+def finish_image_processing(instance, processed):
+    """Store a process_image_data result and mark the image ready."""
+    mark_image_ready(instance, store_processed_image(instance, processed))
+
+
+def mark_image_ready(instance, fields):
+    """
+    Record the fields from store_processed_image and mark the image ready.
+    A normalized image replaces the upload, moving its reference count.
+    """
+    for name, value in fields.items():
+        setattr(instance, name, value)
+    instance.status = ImageStatus.READY
+    instance.save(update_fields=[*fields, 'status'] + (['updated_at'] if isinstance(instance, Answer) else []))
+
+
+def fail_image_processing(instance):
+    instance.status = ImageStatus.FAILED
+    instance.save(update_fields=['status', *NORMALIZED_FIELDS] + (['updated_at'] if isinstance(instance, Answer) else []))
+
+
+def claim_jobs(limit):
+    """
+    Atomically claim up to `limit` pending jobs, plus running jobs whose
+    worker has held them longer than IMAGE_JOBS_LEASE seconds.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'IMAGE_JOBS_LEASE', 300))
+    with transaction.atomic():
+        job_ids = list(
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=ImageJob.Status.PENDING) | Q(status=ImageJob.Status.RUNNING, locked_at__lt=stale))
+            .order_by('id')
+            .values_list('id', flat=True)[:limit]
+        )
+        ImageJob.objects.filter(id__in=job_ids).update(
+            status=ImageJob.Status.RUNNING,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+    return list(ImageJob.objects.select_related('answer', 'question').filter(id__in=job_ids).order_by('id'))
+
+
+def locked_target(job, image_name):
+    """
+    The job's Answer or Question locked for update, or None when the row was
+    deleted or given another image since the job started. Call inside a
+    transaction.
+    """
+    model, pk = (Answer, job.answer_id) if job.answer_id else (Question, job.question_id)
+    return model.objects.select_for_update().filter(pk=pk, image=image_name).first()
+
+
+def record_job_result(job, image_name, fields, error, invalid):
+    """
+    Apply the outcome of a job to its row and to the job itself, and return
+    the job's new status. Call inside a transaction.
+    """
+    target = locked_target(job, image_name)
+    if target is None:
+        # The row is gone (its jobs with it) or has a newer image, queued by a job of its own
+        status = ImageJob.Status.DROPPED
+    elif fields is not None:
+        mark_image_ready(target, fields)
+        status = ImageJob.Status.DONE
+    elif invalid or job.attempts >= getattr(settings, 'IMAGE_JOBS_MAX_ATTEMPTS', 3):
+        fail_image_processing(target)
+        status = ImageJob.Status.FAILED
+    else:
+        status = ImageJob.Status.PENDING
+    
+    # A deleted job updates nothing
+    ImageJob.objects.filter(pk=job.pk).update(
+        status=status, last_error=error, locked_at=None, updated_at=timezone.now()
+    )
+    job.status = status
+    return status
+
+
+def run_job(job, process_pool=None):
+    """
+    Process one claimed job and return its new status. Runs on an I/O
+    thread; the decode/re-encode step runs on `process_pool` when one is
+    given. Never raises, so one job cannot stop the workers: when the
+    result cannot be recorded the job stays running until its lease runs out.
+    """
+    instance = job.target
+    image_name = instance.image.name
+    options = ingest_options() if job.normalize else None
+    fields, error, invalid = None, '', False
+    try:
+        data = read_image(instance.image)
+        if process_pool is not None:
+            processed = process_pool.submit(process_image_data, data, options).result()
+        else:
+            processed = process_image_data(data, options)
+        # Written before the row is locked; files left by a dropped job are removed by gc_media
+        fields = store_processed_image(instance, processed)
+    except INVALID_IMAGE_ERRORS as e:
+        logger.warning("Image job %s rejected %s: %s", job.id, image_name, e)
+        error, invalid = str(e), True
+    except Exception as e:
+        logger.exception("Image job %s failed", job.id)
+        error = str(e)
+    
+    try:
+        with transaction.atomic():
+            return record_job_result(job, image_name, fields, error, invalid)
+    except DatabaseError:
+        logger.exception("Could not record the result of image job %s", job.id)
+        return ImageJob.Status.RUNNING
+    finally:
+        close_old_connections()
+
+
+def run_workers(processes=2, threads=4, poll_interval=1.0, burst=False, stdout=None):
+    """
+    Claim and process jobs until interrupted (or until the queue is empty
+    when `burst` is set). Returns the number of jobs processed.
+    """
+    processed = 0
+    with ProcessPoolExecutor(max_workers=processes) as process_pool, \
+            ThreadPoolExecutor(max_workers=threads) as thread_pool:
+        # Start the worker processes before any threads exist, so they fork cleanly
+        process_pool.submit(int).result()
+        
+        while True:
+            jobs = claim_jobs(threads * 2)
+            if not jobs:
+                if burst:
+                    return processed
+                time.sleep(poll_interval)
+                continue
+            
+            statuses = list(thread_pool.map(lambda job: run_job(job, process_pool), jobs))
+            processed += len(statuses)
+            if stdout is not None:
+                stdout.write(f"Processed {len(statuses)} image job(s), {statuses.count(ImageJob.Status.FAILED)} failed")
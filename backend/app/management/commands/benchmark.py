@@ -0,0 +1,85 @@
+import json
+import platform
+import shutil
+import tempfile
+from io import StringIO
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from app.benchmarks import BenchmarkData, BenchmarkError, run_benchmarks
+
+PREFIX = 'bench'
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every API route against a generated dataset in a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=2, help='Classes per instructor')
+        parser.add_argument('--students', type=int, default=100, help='Students per class')
+        parser.add_argument('--questions', type=int, default=20, help='Questions per class')
+        parser.add_argument('--answers', type=int, default=50, help='Answers per question')
+        parser.add_argument('--seed', type=int, default=1, help='Seed of the generated dataset')
+        parser.add_argument('--iterations', type=int, default=30, help='Timed calls per endpoint')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed calls per endpoint first')
+        parser.add_argument('--only', action='append', help='Only endpoints whose name contains this (repeatable)')
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the JSON results')
+        parser.add_argument('--noinput', action='store_false', dest='interactive',
+                            help='Replace a leftover test database without asking')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 2:
+            raise CommandError('--iterations must be at least 2')
+        dataset = {key: options[key] for key in ('classes', 'students', 'questions', 'answers', 'seed')}
+
+        # The dataset and everything the endpoints write go to a test database
+        # and a temporary media directory, both removed afterwards.
+        media_root = tempfile.mkdtemp()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'], serialize=False)
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root, CHUNKED_UPLOAD_DIR=media_root, CACHES=LOCMEM_CACHE,
+                ALLOWED_HOSTS=['testserver'], IMAGE_JOBS_ASYNC=True,
+            ):
+                self.stdout.write('Generating dataset...')
+                call_command(
+                    'generate_dataset', instructors=2, images=20, prefix=PREFIX, stdout=StringIO(), **dataset
+                )
+                data = BenchmarkData(PREFIX)
+                results = run_benchmarks(
+                    data, options['iterations'], options['warmup'], options['only'],
+                    progress=lambda name: self.stdout.write(f'  {name}'),
+                )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'dataset': dataset,
+            },
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self.stdout.write(f"{'endpoint':<32}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'memory':>10}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<32}{result['p50_ms']:>7.1f}ms{result['p95_ms']:>7.1f}ms{result['p99_ms']:>7.1f}ms"
+                f"{result['queries']:>9}{result['memory_kb']:>8.0f}KB"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
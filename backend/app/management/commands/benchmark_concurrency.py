@@ -0,0 +1,98 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+from io import StringIO
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from app.benchmarks import BenchmarkError
+from app.concurrency import DEFAULT_THREADS, MODES, run_concurrency, session_factory
+
+PREFIX = 'concurrency'
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of the student API under WSGI (sync views) and ASGI (async views) with many simultaneous students'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=500, help='Students sending their requests at the same time')
+        parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='Worker threads of the WSGI server')
+        parser.add_argument('--questions', type=int, default=10, help='Questions in the class')
+        parser.add_argument('--answers', type=int, default=10, help='Existing answers per question')
+        parser.add_argument('--mode', action='append', choices=MODES, help='Only run this mode (repeatable)')
+        parser.add_argument('--seed', type=int, default=1, help='Seed of the generated dataset')
+        parser.add_argument('--output', default='benchmark-concurrency.json', help='Where to write the JSON results')
+        parser.add_argument('--noinput', action='store_false', dest='interactive',
+                            help='Replace a leftover test database without asking')
+
+    def handle(self, *args, **options):
+        if options['students'] < 1:
+            raise CommandError('--students must be at least 1')
+        modes = options['mode'] or MODES
+        dataset = {
+            'students': options['students'], 'questions': options['questions'],
+            'answers': min(options['answers'], options['students']), 'seed': options['seed'],
+        }
+
+        # Requests run on many threads at once, each with its own connection,
+        # so an SQLite test database has to be a file rather than in memory,
+        # and its writers have to wait longer for the lock than by default
+        media_root = tempfile.mkdtemp()
+        if connection.vendor == 'sqlite':
+            if not connection.settings_dict['TEST']['NAME']:
+                connection.settings_dict['TEST']['NAME'] = os.path.join(media_root, 'concurrency.sqlite3')
+            connection.settings_dict['OPTIONS'].setdefault('timeout', 120)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'], serialize=False)
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root, CHUNKED_UPLOAD_DIR=media_root, CACHES=LOCMEM_CACHE,
+                ALLOWED_HOSTS=['testserver'], IMAGE_JOBS_ASYNC=True,
+            ):
+                self.stdout.write('Generating dataset...')
+                call_command(
+                    'generate_dataset', instructors=1, classes=1, images=20, prefix=PREFIX, stdout=StringIO(), **dataset
+                )
+                make_sessions = session_factory(PREFIX)
+                results = run_concurrency(
+                    make_sessions, modes, options['threads'],
+                    progress=lambda mode: self.stdout.write(f"  {mode}: {options['students']} students"),
+                )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'cpus': os.cpu_count(),
+                'wsgi_threads': options['threads'],
+                'dataset': dataset,
+            },
+            'modes': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self.stdout.write(f"{'mode':<8}{'requests':>10}{'wall':>9}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:<8}{result['requests']:>10}{result['wall_s']:>8.2f}s{result['throughput_rps']:>9.1f}"
+                f"{result['p50_ms']:>8.1f}ms{result['p95_ms']:>8.1f}ms{result['p99_ms']:>8.1f}ms"
+            )
+        if set(results) == set(MODES):
+            speedup = results['asgi']['throughput_rps'] / results['wsgi']['throughput_rps']
+            self.stdout.write(f'ASGI throughput is {speedup:.2f}x that of WSGI')
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from app.caching import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counts of the class, question and roster read cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        for name, counts in get_stats().items():
+            total = counts['hits'] + counts['misses']
+            ratio = f"{counts['hits'] / total:.1%}" if total else '-'
+            self.stdout.write(f"{name:<16} hits={counts['hits']:<8} misses={counts['misses']:<8} hit rate={ratio}")
+
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
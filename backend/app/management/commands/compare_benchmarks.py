@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.benchmarks import compare_results
+
+
+class Command(BaseCommand):
+    help = 'Compare benchmark results with a baseline; fails when an endpoint regressed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline', help='Baseline results written by `benchmark`')
+        parser.add_argument('current', help='New results written by `benchmark`')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 latency growth, as a fraction')
+        parser.add_argument('--memory-tolerance', type=float, default=0.25, help='Allowed peak memory growth, as a fraction')
+
+    def handle(self, *args, **options):
+        reports = []
+        for path in (options['baseline'], options['current']):
+            try:
+                with open(path) as f:
+                    reports.append(json.load(f))
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read {path}: {e}')
+        baseline, current = reports
+
+        if baseline['meta'].get('dataset') != current['meta'].get('dataset'):
+            self.stdout.write(self.style.WARNING('The results were measured on different datasets'))
+        if baseline['meta'].get('database') != current['meta'].get('database'):
+            self.stdout.write(self.style.WARNING('The results were measured on different databases'))
+        unmatched = sorted(baseline['endpoints'].keys() ^ current['endpoints'].keys())
+        if unmatched:
+            self.stdout.write(self.style.WARNING(f"Not compared, only in one of the results: {', '.join(unmatched)}"))
+
+        regressions = compare_results(
+            baseline['endpoints'], current['endpoints'], options['tolerance'], options['memory_tolerance']
+        )
+        for message in regressions:
+            self.stdout.write(self.style.ERROR(message))
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
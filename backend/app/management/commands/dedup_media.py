@@ -0,0 +1,91 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from app.media import add_references, image_batches, link_derivatives, repoint_images
+from app.models import Answer, MediaBlob, Question
+from app.storage import content_sha256, hashed_name, is_hashed_name, link_or_copy, media_storage
+
+
+class Command(BaseCommand):
+    help = 'Rename existing question/answer images to content-addressed paths, deduplicating identical files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows to process per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without touching files or rows')
+        parser.add_argument('--recount', action='store_true', help='Rebuild all reference counts from the database afterwards')
+
+    def handle(self, *args, **options):
+        self.storage = media_storage()
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        self.stats = {'renamed': 0, 'deduplicated': 0, 'missing': 0, 'bytes_reclaimed': 0}
+        # Hashes a dry run would have created, so later duplicates are counted as such
+        self.planned = set()
+
+        for model in (Question, Answer):
+            self.stdout.write(f'Rehashing {model.__name__} images...')
+            self.process_model(model, self.batch_size)
+
+        if options['recount'] and not self.dry_run:
+            self.recount()
+
+        prefix = 'Would have ' if self.dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}renamed {self.stats['renamed']} file(s), deduplicated {self.stats['deduplicated']} "
+            f"({self.stats['bytes_reclaimed'] / (1024 * 1024):.2f}MB reclaimed); "
+            f"{self.stats['missing']} missing file(s) skipped"
+        ))
+
+    def process_model(self, model, batch_size):
+        for names in image_batches(model, batch_size):
+            renames = {}
+            for name in names:
+                if is_hashed_name(name):
+                    continue
+                new_name = self.rehash(name)
+                if new_name:
+                    renames[name] = new_name
+            if renames and not self.dry_run:
+                with transaction.atomic():
+                    repoint_images(model, renames)
+
+    def rehash(self, name):
+        """Link a file (and its derivatives) to its content-addressed name; returns that name, or None if missing."""
+        if not self.storage.exists(name):
+            self.stats['missing'] += 1
+            return None
+
+        with self.storage.open(name, 'rb') as f:
+            new_name = hashed_name(name, content_sha256(File(f)))
+        duplicate = new_name in self.planned or self.storage.exists(new_name)
+        self.stats['deduplicated' if duplicate else 'renamed'] += 1
+        if duplicate:
+            self.stats['bytes_reclaimed'] += self.storage.size(name)
+        if self.dry_run:
+            self.planned.add(new_name)
+            return new_name
+
+        if not duplicate:
+            link_or_copy(self.storage.path(name), self.storage.path(new_name))
+        link_derivatives(self.storage, name, new_name)
+        return new_name
+
+    def recount(self):
+        self.stdout.write('Rebuilding reference counts...')
+        with transaction.atomic():
+            MediaBlob.objects.update(ref_count=0)
+            for model in (Question, Answer):
+                rows = (
+                    model.objects.exclude(image='').exclude(image__isnull=True)
+                    .values_list('image').annotate(refs=Count('pk')).order_by()
+                )
+                counts = {}
+                for name, refs in rows.iterator():
+                    counts[name] = refs
+                    if len(counts) >= self.batch_size:
+                        add_references(counts)
+                        counts = {}
+                add_references(counts)
+            MediaBlob.objects.filter(ref_count__lte=0).delete()
@@ -0,0 +1,85 @@
+import heapq
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from app.images import derivative_source
+from app.media import media_files, referenced_names, unreferenced_files
+from app.models import Answer, MediaBlob, Question
+from app.storage import media_storage
+
+MODELS = (Question, Answer)
+
+
+class Command(BaseCommand):
+    help = 'Delete question/answer image files and derivatives that no row references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=float, default=24, help='Keep files written in the last GRACE hours (default 24)')
+        parser.add_argument('--workers', type=int, default=8, help='Threads deleting files')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Unreferenced files rechecked and deleted per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report unreferenced files without deleting them')
+
+    def handle(self, *args, **options):
+        self.storage = media_storage()
+        self.dry_run = options['dry_run']
+        self.stats = {'scanned': 0, 'recent': 0, 'orphaned': 0, 'bytes': 0}
+        # Uploads are stored before their row is committed, so young files are left alone
+        cutoff = time.time() - options['grace'] * 3600
+
+        directories = sorted(model._meta.get_field('image').upload_to.strip('/') for model in MODELS)
+        files = self.counted(itertools.chain.from_iterable(
+            media_files(self.storage.location, directory) for directory in directories
+        ))
+        references = heapq.merge(*(referenced_names(model, options['batch_size']) for model in MODELS))
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as self.pool:
+            batch = []
+            for name, stat in unreferenced_files(files, references):
+                # Hard links (as reshard_media makes) keep the mtime but update the ctime
+                if max(stat.st_mtime, stat.st_ctime) > cutoff:
+                    self.stats['recent'] += 1
+                    continue
+                batch.append((name, stat))
+                if len(batch) >= options['batch_size']:
+                    self.collect(batch)
+                    batch = []
+            self.collect(batch)
+
+        prefix = 'Would have deleted' if self.dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {self.stats['scanned']} file(s). {prefix} {self.stats['orphaned']} unreferenced file(s), "
+            f"reclaiming {self.stats['bytes']} bytes ({self.stats['bytes'] / (1024 * 1024):.2f}MB); "
+            f"kept {self.stats['recent']} unreferenced file(s) younger than the grace period"
+        ))
+
+    def counted(self, files):
+        for item in files:
+            self.stats['scanned'] += 1
+            yield item
+
+    def collect(self, batch):
+        """Delete a batch of unreferenced files, less any a row has started using since the scan."""
+        sources = {name: derivative_source(name) or name for name, _ in batch}
+        referenced = set()
+        for model in MODELS:
+            referenced.update(model.objects.filter(image__in=set(sources.values())).values_list('image', flat=True))
+        batch = [(name, stat) for name, stat in batch if sources[name] not in referenced]
+
+        if not self.dry_run:
+            deleted = list(self.pool.map(self.delete, [name for name, _ in batch]))
+            batch = [item for item, removed in zip(batch, deleted) if removed]
+            MediaBlob.objects.filter(name__in=[name for name, _ in batch]).delete()
+        self.stats['orphaned'] += len(batch)
+        self.stats['bytes'] += sum(stat.st_size for _, stat in batch)
+
+    def delete(self, name):
+        """Remove a file (on a worker thread); False if it was already gone."""
+        try:
+            os.remove(self.storage.path(name))
+        except FileNotFoundError:
+            return False
+        return True
@@ -0,0 +1,170 @@
+import random
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image, ImageDraw
+
+from app.images import render_derivative_images, save_derivatives
+from app.media import retain_blobs
+from app.models import Instructor, Class, Student, Question, Answer
+from app.stats import rebuild_stats
+from app.storage import media_storage
+
+PASSWORD = 'password123'
+
+# Vocabulary for generated question texts
+WORDS = (
+    'what', 'which', 'explain', 'describe', 'compare', 'sketch', 'solve', 'prove', 'estimate', 'derive',
+    'graph', 'function', 'equation', 'limit', 'vector', 'matrix', 'energy', 'force', 'cell', 'market',
+    'theory', 'model', 'system', 'rate', 'value', 'example', 'result', 'method', 'process', 'change',
+)
+
+
+def synthetic_image(rng, width, height):
+    """A small PNG of random shapes, reproducible from the state of `rng`."""
+    image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = rng.randrange(x0, width + 1), rng.randrange(y0, height + 1)
+        fill = tuple(rng.randrange(256) for _ in range(3))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)((x0, y0, x1, y1), fill=fill)
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, deterministic synthetic dataset (instructors, classes, students, questions, answers) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--instructors', type=int, default=2, help='Instructors to create')
+        parser.add_argument('--classes', type=int, default=2, help='Classes per instructor')
+        parser.add_argument('--students', type=int, default=30, help='Students per class')
+        parser.add_argument('--questions', type=int, default=10, help='Questions per class')
+        parser.add_argument('--answers', type=int, default=20, help='Answers per question (at most --students)')
+        parser.add_argument('--images', type=int, default=50, help='Distinct synthetic images shared by the answers')
+        parser.add_argument('--image-size', type=int, nargs=2, default=[320, 240], metavar=('WIDTH', 'HEIGHT'))
+        parser.add_argument('--no-student-accounts', action='store_true', help='Do not create a login for every student')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--prefix', default='load', help='Prefix for generated usernames, so several datasets can coexist')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        if options['answers'] > options['students']:
+            raise CommandError('--answers cannot exceed --students (one answer per student per question)')
+        prefix = options['prefix']
+        if Instructor.objects.filter(username__startswith=f'{prefix}-instructor-').exists():
+            raise CommandError(f"A dataset with prefix '{prefix}' already exists; pick another --prefix")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # Hashing once keeps account creation fast; every generated user gets the same password
+        self.password = make_password(PASSWORD)
+
+        self.stdout.write(f"Rendering {options['images']} synthetic image(s)...")
+        answer_images = self.create_images('answers', options['images'], options['image_size'])
+        question_images = self.create_images('questions', max(1, options['images'] // 5), options['image_size'])
+
+        totals = {'instructors': 0, 'classes': 0, 'students': 0, 'questions': 0, 'answers': 0}
+        for i in range(options['instructors']):
+            with transaction.atomic():
+                counts = self.create_instructor(i, options, answer_images, question_images)
+            for key, value in counts.items():
+                totals[key] += value
+            self.stdout.write(f"Instructor {i + 1}/{options['instructors']}: {totals['answers']} answers so far")
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(f'{count} {name}' for name, count in totals.items())
+            + f" (seed {options['seed']}). All accounts use the password '{PASSWORD}'."
+        ))
+
+    def create_images(self, directory, count, size):
+        """Store `count` synthetic images with their derivatives; returns [(name, derivatives)]."""
+        storage = media_storage()
+        images = []
+        for n in range(count):
+            data = synthetic_image(self.rng, *size)
+            name = storage.save(f'{directory}/synthetic-{n}.png', ContentFile(data))
+            images.append((name, save_derivatives(storage, name, render_derivative_images(data))))
+        return images
+
+    def create_user(self, username, name):
+        return Instructor(username=username, name=name, email=f'{username}@example.com', password=self.password)
+
+    def create_instructor(self, index, options, answer_images, question_images):
+        prefix = options['prefix']
+        instructor = Instructor.objects.bulk_create([
+            self.create_user(f'{prefix}-instructor-{index}', f'Instructor {index}')
+        ])[0]
+        classes = Class.objects.bulk_create([
+            Class(class_name=f'{prefix} class {index}.{n}', instructor=instructor)
+            for n in range(options['classes'])
+        ])
+        counts = {'instructors': 1, 'classes': len(classes), 'students': 0, 'questions': 0, 'answers': 0}
+
+        for c, class_obj in enumerate(classes):
+            # Names come from positions rather than ids so reruns match on any database
+            label = f'{index}.{c}'
+            students = [
+                Student(
+                    class_enrolled=class_obj,
+                    name=f'Student {label}.{n}',
+                    roster_id=f'{n:06d}',
+                    phone=f'555-{self.rng.randrange(10000):04d}',
+                )
+                for n in range(options['students'])
+            ]
+            if not options['no_student_accounts']:
+                # Usernames must start with "student" to get the student role at login
+                users = Instructor.objects.bulk_create([
+                    self.create_user(f'student-{prefix}-{label}.{n}', student.name)
+                    for n, student in enumerate(students)
+                ], batch_size=self.batch_size)
+                for student, user in zip(students, users):
+                    student.user = user
+            students = Student.objects.bulk_create(students, batch_size=self.batch_size)
+
+            questions = []
+            for n in range(options['questions']):
+                name, derivatives = self.rng.choice(question_images) if self.rng.random() < 0.5 else (None, {})
+                questions.append(Question(
+                    class_related=class_obj,
+                    question_text=f'Question {n + 1}: ' + ' '.join(self.rng.choice(WORDS) for _ in range(12)),
+                    image=name,
+                    image_derivatives=derivatives,
+                ))
+            questions = Question.objects.bulk_create(questions, batch_size=self.batch_size)
+
+            answers = []
+            for question in questions:
+                for student in self.rng.sample(students, options['answers']):
+                    name, derivatives = self.rng.choice(answer_images)
+                    answers.append(Answer(
+                        question=question,
+                        student=student,
+                        image=name,
+                        image_derivatives=derivatives,
+                        liked=self.rng.random() < 0.2,
+                    ))
+                if len(answers) >= self.batch_size:
+                    counts['answers'] += self.insert_answers(answers)
+                    answers = []
+            counts['answers'] += self.insert_answers(answers)
+            # bulk_create also skips the signals that move the participation counters
+            rebuild_stats(class_ids=[class_obj.id])
+
+            retain_blobs(question.image.name for question in questions)
+            counts['students'] += len(students)
+            counts['questions'] += len(questions)
+        return counts
+
+    def insert_answers(self, answers):
+        # bulk_create skips the signals that count image references
+        Answer.objects.bulk_create(answers, batch_size=self.batch_size)
+        retain_blobs(answer.image.name for answer in answers)
+        return len(answers)
+
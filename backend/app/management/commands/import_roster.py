@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from app.imports import ROSTER_BATCH_SIZE, import_roster
+from app.models import Class
+
+
+class Command(BaseCommand):
+    help = 'Create or update the students of a class from a CSV file with roster_id, name and optional phone and email columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path to the roster CSV (UTF-8)')
+        parser.add_argument('--class-id', type=int, required=True, help='Class to import the students into')
+        parser.add_argument('--batch-size', type=int, default=ROSTER_BATCH_SIZE, help='Rows to upsert per query')
+
+    def handle(self, *args, **options):
+        try:
+            class_obj = Class.objects.get(id=options['class_id'])
+        except Class.DoesNotExist:
+            raise CommandError(f"Class {options['class_id']} does not exist")
+
+        self.stdout.write(f'Importing roster into {class_obj.class_name}...')
+        try:
+            with open(options['csv_file'], encoding='utf-8-sig', newline='') as lines:
+                result = import_roster(class_obj, lines, batch_size=options['batch_size'])
+        except OSError as e:
+            raise CommandError(f"Could not read {options['csv_file']}: {e}")
+        except ValidationError as e:
+            raise CommandError(str(e.detail[0]))
+
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(f"Line {error['line']}: {error['error']}"))
+        if result.failed > len(result.errors):
+            self.stdout.write(self.style.WARNING(f'...and {result.failed - len(result.errors)} more row error(s)'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.created}, updated {result.updated}, skipped {result.failed} invalid row(s)'
+        ))
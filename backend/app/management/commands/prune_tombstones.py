@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.models import AnswerTombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete tombstones of deleted answers older than ANSWER_TOMBSTONE_RETENTION (delta cursors older than that get a full resync)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tombstones deleted per query')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.ANSWER_TOMBSTONE_RETENTION)
+        expired = AnswerTombstone.objects.filter(deleted_at__lt=cutoff)
+        deleted = 0
+        # In batches, so a large backlog never holds one long delete
+        while True:
+            ids = list(expired.order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += AnswerTombstone.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstone(s) older than {cutoff:%Y-%m-%d %H:%M}'))
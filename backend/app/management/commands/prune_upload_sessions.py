@@ -0,0 +1,75 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.models import UploadSession
+from app.uploads import expiry_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked upload sessions idle longer than UPLOAD_SESSION_EXPIRY, and .part files no session uses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions deleted (and files checked) per query')
+
+    def handle(self, *args, **options):
+        cutoff = expiry_cutoff()
+        batch_size = options['batch_size']
+        expired = UploadSession.objects.filter(updated_at__lt=cutoff)
+        sessions = 0
+        while True:
+            ids = list(expired.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            # Rechecked on delete, so a session that got a chunk since the select is kept
+            sessions += expired.filter(id__in=ids).delete()[0]
+
+        # Files are removed after their rows, so an upload never writes to a session whose file is gone.
+        # This also catches files left by a crash between creating a session's file and its row.
+        self.stats = {'files': 0, 'bytes': 0}
+        batch = []
+        for path, size, session_id in self.stale_files(cutoff.timestamp()):
+            batch.append((path, size, session_id))
+            if len(batch) >= batch_size:
+                self.remove_unused(batch)
+                batch = []
+        self.remove_unused(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {sessions} expired upload session(s) and {self.stats['files']} .part file(s) "
+            f"({self.stats['bytes']} bytes) last written before {cutoff:%Y-%m-%d %H:%M}"
+        ))
+
+    def stale_files(self, cutoff):
+        """(path, size, session id) of the .part files not written to since `cutoff`."""
+        try:
+            entries = os.scandir(settings.CHUNKED_UPLOAD_DIR)
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                if ext != '.part' or not entry.is_file():
+                    continue
+                try:
+                    session_id = uuid.UUID(stem)
+                except ValueError:
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime < cutoff:
+                    yield entry.path, stat.st_size, session_id
+
+    def remove_unused(self, batch):
+        """Delete the files of a batch whose session no longer exists."""
+        live = set(UploadSession.objects.filter(id__in=[session_id for _, _, session_id in batch]).values_list('id', flat=True))
+        for path, size, session_id in batch:
+            if session_id in live:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.stats['files'] += 1
+            self.stats['bytes'] += size
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the question and class participation counters from the answers and report those that were out of date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class', type=int, action='append', dest='class_ids', help='Only rebuild this class (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report out-of-date counters')
+        parser.add_argument('--check', action='store_true', help='Exit with an error if any counter was out of date')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            out_of_date = rebuild_stats(class_ids=options['class_ids'], dry_run=options['dry_run'])
+
+        verb = 'Found' if options['dry_run'] else 'Rebuilt'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {out_of_date['QuestionStats']} question and {out_of_date['ClassStats']} class counter row(s) out of date"
+        ))
+        if options['check'] and any(out_of_date.values()):
+            raise CommandError('Participation counters were out of date')
@@ -0,0 +1,93 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.media import image_batches, link_derivatives, repoint_images
+from app.models import Answer, Question
+from app.storage import content_sha256, hashed_name, link_or_copy, media_storage, parse_hashed_name
+
+
+class Command(BaseCommand):
+    help = 'Move question/answer images into the configured shard layout (MEDIA_SHARD_LEVELS, MEDIA_SHARD_WIDTH)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows to process per transaction')
+        parser.add_argument('--workers', type=int, default=8, help='Threads hashing and linking the files of a batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would move without touching files or rows')
+
+    def handle(self, *args, **options):
+        self.storage = media_storage()
+        self.dry_run = options['dry_run']
+        self.stats = {'moved': 0, 'merged': 0, 'rows': 0, 'missing': 0}
+        # New names used so far, so later files with the same content count as merged
+        self.planned = set()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as self.pool:
+            for model in (Question, Answer):
+                self.stdout.write(f'Resharding {model.__name__} images...')
+                self.process_model(model, options['batch_size'])
+
+        prefix = 'Would have ' if self.dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}moved {self.stats['moved']} file(s) and merged {self.stats['merged']} into existing ones, "
+            f"repointing {self.stats['rows']} row(s); {self.stats['missing']} missing file(s) skipped"
+        ))
+
+    def process_model(self, model, batch_size):
+        # Every batch commits on its own and rows already in the layout are skipped,
+        # so an interrupted run is resumed by starting it again
+        for names in image_batches(model, batch_size):
+            names = [name for name in names if not self.in_layout(name)]
+            staged = dict(zip(names, self.pool.map(self.stage, names)))
+            renames = {}
+            for name, (new_name, existed) in staged.items():
+                if new_name is None:
+                    self.stats['missing'] += 1
+                    continue
+                # Files with the same content end up as one
+                merged = existed or new_name in self.planned
+                self.stats['merged' if merged else 'moved'] += 1
+                self.planned.add(new_name)
+                renames[name] = new_name
+            if self.dry_run:
+                self.stats['rows'] += model.objects.filter(image__in=renames).count()
+            elif renames:
+                with transaction.atomic():
+                    self.stats['rows'] += repoint_images(model, renames)
+
+    def in_layout(self, name):
+        parsed = parse_hashed_name(name)
+        return parsed is not None and self.layout_name(name, parsed) == name
+
+    def layout_name(self, name, parsed):
+        directory, sha256 = parsed
+        return hashed_name(os.path.join(directory, os.path.basename(name)), sha256)
+
+    def stage(self, name):
+        """
+        Link a file and its derivatives under their names in the layout (on
+        a worker thread). Returns (new name, whether it already existed), or
+        (None, False) when the file is missing.
+        """
+        parsed = parse_hashed_name(name)
+        if parsed is None:
+            # Uploaded before content addressing: the name has to come from the content
+            if not self.storage.exists(name):
+                return None, False
+            with self.storage.open(name, 'rb') as f:
+                parsed = (os.path.dirname(name), content_sha256(File(f)))
+        new_name = self.layout_name(name, parsed)
+
+        existed = self.storage.exists(new_name)
+        if not existed and not self.storage.exists(name):
+            return None, False
+        if self.dry_run:
+            return new_name, existed
+
+        if not existed:
+            link_or_copy(self.storage.path(name), self.storage.path(new_name))
+        link_derivatives(self.storage, name, new_name)
+        return new_name, existed
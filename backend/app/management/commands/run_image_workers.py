@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from app.jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = 'Run background workers that verify uploaded images and render their derivatives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Worker processes for decoding and re-encoding images')
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads for file and database I/O')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Starting image workers...')
+        processed = run_workers(
+            processes=options['processes'],
+            threads=options['threads'],
+            poll_interval=options['poll_interval'],
+            burst=options['burst'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} image job(s)'))
@@ -0,0 +1,247 @@
+"""
+Reference counting of stored image files, and finding the files no row uses.
+
+Rows that point at the same content-addressed file share one MediaBlob; its
+file (and resized derivatives) is deleted only when the last reference goes.
+Files without a MediaBlob predate content addressing and belong to a single
+row, so releasing them deletes them straight away.
+
+``dedup_media`` and ``reshard_media`` move files to new names; both walk
+the rows with image_batches and point them at the new names with
+repoint_images.
+
+Files can still outlive their rows: an upload stored by a request that then
+failed, a delete whose after-commit cleanup never ran, an interrupted
+``reshard_media``. ``python manage.py gc_media`` finds them by walking the
+media tree and the image names in the database side by side, both in byte
+order, so neither is ever held in memory whole.
+"""
+import logging
+import os
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from .caching import invalidate
+from .images import DERIVATIVES, derivative_path, derivative_source
+from .models import Answer, MediaBlob, Question
+from .storage import link_or_copy, media_storage
+
+# Collations comparing text by code point, which is how the media tree is walked
+BINARY_COLLATIONS = {'postgresql': 'C', 'sqlite': 'BINARY', 'mysql': 'utf8mb4_bin'}
+
+logger = logging.getLogger(__name__)
+
+
+def retain_blob(name):
+    """Add a reference to a stored file."""
+    if not name:
+        return
+    blob, _ = MediaBlob.objects.get_or_create(name=name)
+    MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def release_blob(name):
+    """Drop a reference to a stored file, deleting it once unreferenced."""
+    if not name:
+        return
+    tracked = MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') - 1)
+    if tracked:
+        deleted, _ = MediaBlob.objects.filter(name=name, ref_count__lte=0).delete()
+        if not deleted:
+            return
+    transaction.on_commit(lambda: delete_media_files(name))
+
+
+def reference_counts(counts):
+    """Expression picking each blob's count out of a {name: count} mapping."""
+    return Case(*[When(name=name, then=Value(count)) for name, count in counts.items()], output_field=IntegerField())
+
+
+def retain_blobs(names):
+    """Add one reference per name (names may repeat) in a fixed number of queries."""
+    add_references(Counter(name for name in names if name))
+
+
+def add_references(counts):
+    """Add `count` references to each stored file of a {name: count} mapping, in two queries."""
+    if not counts:
+        return
+    MediaBlob.objects.bulk_create([MediaBlob(name=name) for name in counts], ignore_conflicts=True)
+    MediaBlob.objects.filter(name__in=counts).update(ref_count=F('ref_count') + reference_counts(counts))
+
+
+def release_blobs(names):
+    """
+    Drop one reference per name (names may repeat) in a fixed number of
+    queries, deleting the files that end up unreferenced. Call inside a
+    transaction.
+    """
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    tracked = set(MediaBlob.objects.filter(name__in=counts).values_list('name', flat=True))
+    unreferenced = []
+    if tracked:
+        MediaBlob.objects.filter(name__in=tracked).update(
+            ref_count=F('ref_count') - reference_counts({name: counts[name] for name in tracked})
+        )
+        unreferenced = list(
+            MediaBlob.objects.select_for_update().filter(name__in=tracked, ref_count__lte=0).values_list('name', flat=True)
+        )
+        MediaBlob.objects.filter(name__in=unreferenced).delete()
+    
+    doomed = unreferenced + [name for name in counts if name not in tracked]
+    
+    def delete_files():
+        for name in doomed:
+            delete_media_files(name)
+    
+    transaction.on_commit(delete_files)
+
+
+def delete_media_files(name):
+    """Delete a stored file and its derivatives, ignoring files already gone."""
+    storage = media_storage()
+    try:
+        storage.delete(name)
+        for derivative in DERIVATIVES:
+            storage.delete(derivative_path(name, derivative))
+    except OSError:
+        logger.warning("Could not delete media file %s", name, exc_info=True)
+
+
+def image_batches(model, batch_size):
+    """
+    The distinct image names of `model` rows, sorted, per batch of
+    `batch_size` rows. Rows are walked by primary key so memory stays flat,
+    and every batch can commit on its own: an interrupted run that skips
+    rows already done is resumed by starting it again.
+    """
+    last_pk = 0
+    while True:
+        rows = list(
+            model.objects.filter(pk__gt=last_pk)
+            .exclude(image='').exclude(image__isnull=True)
+            .order_by('pk')
+            .values_list('pk', 'image')[:batch_size]
+        )
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield sorted({name for _, name in rows})
+
+
+def link_derivatives(storage, name, new_name):
+    """Link the derivatives of a stored file under a new name for it, leaving any already there."""
+    for derivative in DERIVATIVES:
+        old_path, new_path = derivative_path(name, derivative), derivative_path(new_name, derivative)
+        if storage.exists(old_path) and not storage.exists(new_path):
+            link_or_copy(storage.path(old_path), storage.path(new_path))
+
+
+def repoint_images(model, renames):
+    """
+    Point every `model` row using a file of `renames` ({old name: new name},
+    the new files already in place) at its new name, and move the
+    references to match; the old files are deleted after commit. Only the
+    derivatives found under the new name are kept, so missing ones are
+    rendered again. Returns the number of rows repointed. Call inside a
+    transaction.
+    """
+    storage = media_storage()
+    rows = model.objects.filter(image__in=renames)
+    # Cached question listings embed image URLs
+    if model is Question:
+        invalidate(classes=set(rows.values_list('class_related_id', flat=True)))
+    # Delta polls pick up answers by updated_at, which update() does not set on its own
+    changes = {'updated_at': timezone.now()} if model is Answer else {}
+    
+    # One UPDATE per file and set of derivatives (which rows of one file nearly always share),
+    # rather than one per row, since a file can be used by thousands of rows
+    repointed = Counter()
+    for name, derivatives in rows.values_list('image', 'image_derivatives').distinct().order_by():
+        new_name = renames[name]
+        moved = {
+            key: {**info, 'path': derivative_path(new_name, key)}
+            for key, info in (derivatives or {}).items()
+            if storage.exists(derivative_path(new_name, key))
+        }
+        repointed[new_name] += model.objects.filter(image=name, image_derivatives=derivatives).update(
+            image=new_name, image_derivatives=moved, **changes
+        )
+    
+    # References are recounted from the rows, which also heals counts that had drifted
+    MediaBlob.objects.filter(name__in=renames).delete()
+    add_references(repointed)
+    
+    old_names = list(renames)
+    
+    def delete_files():
+        for name in old_names:
+            delete_media_files(name)
+    
+    transaction.on_commit(delete_files)
+    return sum(repointed.values())
+
+
+def media_files(root, directory):
+    """
+    The files under `directory` (relative to `root`) as (key, name, stat),
+    in key order: a file's key is its name, and a derivative's the name of
+    the image it was rendered from. Only one directory is listed at a time.
+    """
+    try:
+        entries = list(os.scandir(os.path.join(root, directory)))
+    except FileNotFoundError:
+        return
+    
+    items = []
+    for entry in entries:
+        name = f'{directory}/{entry.name}'
+        if entry.is_file(follow_symlinks=False):
+            items.append((name, name, entry))
+        elif entry.is_dir(follow_symlinks=False) and entry.name == 'derivatives':
+            for derivative in os.scandir(entry.path):
+                if derivative.is_file(follow_symlinks=False):
+                    derivative_name = f'{name}/{derivative.name}'
+                    items.append((derivative_source(derivative_name) or derivative_name, derivative_name, derivative))
+        elif entry.is_dir(follow_symlinks=False):
+            # Everything below sorts after this key and before the next sibling's
+            items.append((f'{name}/', None, entry))
+    items.sort(key=lambda item: item[0])
+    
+    for key, name, entry in items:
+        if name is None:
+            yield from media_files(root, key[:-1])
+        else:
+            yield key, name, entry.stat(follow_symlinks=False)
+
+
+def referenced_names(model, chunk_size=2000):
+    """The distinct image names of `model` rows in code point order, streamed in chunks."""
+    return (
+        model.objects.exclude(image='').exclude(image__isnull=True)
+        .annotate(key=Collate('image', BINARY_COLLATIONS[connection.vendor]))
+        .order_by('key')
+        .values_list('key', flat=True)
+        .distinct()
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def unreferenced_files(files, references):
+    """
+    The (name, stat) of the files from media_files() whose key is not among
+    `references`, both sorted: a merge join, advancing whichever is behind.
+    """
+    references = iter(references)
+    reference = next(references, None)
+    for key, name, stat in files:
+        while reference is not None and reference < key:
+            reference = next(references, None)
+        if reference != key:
+            yield name, stat
@@ -0,0 +1,92 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Counter of the request being handled; context variables follow a request
+# into the threads sync_to_async runs its queries on
+current_counter = ContextVar('query_counter', default=None)
+
+
+class QueryCounter:
+    """Database execute wrapper that counts queries and the time spent in them."""
+    
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def count_query(execute, sql, params, many, context):
+    """Execute wrapper that hands queries to the current request's counter, if any."""
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_counter(sender, connection, **kwargs):
+    # Every connection, as it opens: the app imports this module when it is ready
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class QueryCountMiddleware:
+    """
+    Report the number of database queries a request ran and the time spent
+    in them, as X-DB-Query-Count, X-DB-Query-Time-Ms and Server-Timing
+    response headers. Only active when the QUERY_COUNT_HEADER setting is on.
+    
+    Queries are counted on every connection, whichever thread opened it, so
+    async views that run their queries through sync_to_async are counted too.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_COUNT_HEADER', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.report(counter, response)
+    
+    async def __acall__(self, request):
+        counter, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.report(counter, response)
+    
+    def start(self):
+        counter = QueryCounter()
+        return counter, current_counter.set(counter)
+    
+    def report(self, counter, response):
+        duration_ms = counter.duration * 1000
+        response['X-DB-Query-Count'] = str(counter.count)
+        response['X-DB-Query-Time-Ms'] = f'{duration_ms:.2f}'
+        response['Server-Timing'] = f'db;dur={duration_ms:.2f};desc="{counter.count} queries"'
+        return response
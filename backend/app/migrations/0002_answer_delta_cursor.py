@@ -0,0 +1,49 @@
+# Generated by Django 5.0 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answer_id', models.BigIntegerField()),
+                ('question_id', models.BigIntegerField()),
+                ('student_id', models.BigIntegerField()),
+                ('class_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', 'updated_at'], name='app_answer_questio_749286_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['student', 'updated_at'], name='app_answer_student_5d9899_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='answertombstone',
+            index=models.Index(fields=['question_id', 'deleted_at'], name='app_answert_questio_ce35da_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='answertombstone',
+            index=models.Index(fields=['student_id', 'deleted_at'], name='app_answert_student_d7f4d9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='answertombstone',
+            index=models.Index(fields=['class_id', 'deleted_at'], name='app_answert_class_i_754175_idx'),
+        ),
+    ]
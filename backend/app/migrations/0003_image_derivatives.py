@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_answer_delta_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-18 19:46
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def link_students_by_name(apps, schema_editor):
+    """
+    Link existing Student rows to the user account with the same name, which
+    is how student endpoints used to find them. Ambiguous names are left unlinked.
+    """
+    Instructor = apps.get_model('app', 'Instructor')
+    Student = apps.get_model('app', 'Student')
+    
+    unique_names = (
+        Instructor.objects.values('name')
+        .annotate(users=Count('id'), user_id=Min('id'))
+        .filter(users=1)
+        .order_by()
+    )
+    for row in unique_names.iterator():
+        Student.objects.filter(user__isnull=True, name=row['name']).update(user_id=row['user_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_student_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_students_by_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_backfill_student_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='roster_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='student',
+            constraint=models.UniqueConstraint(fields=('class_enrolled', 'roster_id'), name='unique_student_roster_id'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0 on 2026-10-18 20:22
+
+import app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_student_roster_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='answer',
+            name='image',
+            field=models.ImageField(db_index=True, storage=app.storage.media_storage, upload_to='answers/'),
+        ),
+        migrations.AlterField(
+            model_name='question',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=app.storage.media_storage, upload_to='questions/'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0 on 2026-10-18 20:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_image_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassStats',
+            fields=[
+                ('class_obj', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='app.class')),
+                ('answer_count', models.IntegerField(default=0)),
+                ('liked_count', models.IntegerField(default=0)),
+                ('respondent_count', models.IntegerField(default=0)),
+                ('last_answer_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='app.question')),
+                ('answer_count', models.IntegerField(default=0)),
+                ('liked_count', models.IntegerField(default=0)),
+                ('respondent_count', models.IntegerField(default=0)),
+                ('last_answer_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
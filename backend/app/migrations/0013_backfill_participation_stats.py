@@ -0,0 +1,38 @@
+# Generated by Django 5.0 on 2026-10-18 20:46
+
+from django.db import migrations
+from django.db.models import Count, Max, Q
+
+TOTALS = {
+    'answer_count': Count('id'),
+    'liked_count': Count('id', filter=Q(liked=True)),
+    'respondent_count': Count('student_id', distinct=True),
+    'last_answer_at': Max('created_at'),
+}
+
+
+def count_existing_answers(apps, schema_editor):
+    """Start the participation counters from the answers already stored."""
+    Answer = apps.get_model('app', 'Answer')
+    QuestionStats = apps.get_model('app', 'QuestionStats')
+    ClassStats = apps.get_model('app', 'ClassStats')
+    
+    for model, field, group in (
+        (QuestionStats, 'question_id', 'question_id'),
+        (ClassStats, 'class_obj_id', 'question__class_related_id'),
+    ):
+        rows = Answer.objects.values(group).annotate(**TOTALS).order_by()
+        model.objects.bulk_create(
+            (model(**{field: row.pop(group)}, **row) for row in rows.iterator()), batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_participation_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_existing_answers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_image_dimensions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagejob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('dropped', 'Dropped')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_image_job_dropped'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagejob',
+            name='normalize',
+            field=models.BooleanField(default=False),
+        ),
+    ]
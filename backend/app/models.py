@@ -1,5 +1,9 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+
+from .storage import media_storage
 
 
 class Instructor(AbstractUser):
@@ -25,7 +29,18 @@ class Class(models.Model):
         return self.class_name
 
 
-class Student(models.Model):
+class StoredClassMixin:
+    """Remembers the class id loaded from the database so moves between classes can be detected on save."""
+    class_field = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_class_id = instance.__dict__.get(cls.class_field)
+        return instance
+
+
+class Student(StoredClassMixin, models.Model):
     """Student model representing enrolled students."""
     name = models.CharField(max_length=255)
     phone = models.CharField(max_length=20, blank=True, null=True)
@@ -34,16 +49,63 @@ class Student(models.Model):
         on_delete=models.CASCADE, 
         related_name='students'
     )
+    user = models.ForeignKey(
+        Instructor,
+        on_delete=models.SET_NULL,
+        related_name='student_records',
+        blank=True,
+        null=True
+    )
+    # The student's id in the class roster (e.g. student number), used to upsert roster imports
+    roster_id = models.CharField(max_length=64, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class_field = 'class_enrolled_id'
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['class_enrolled', 'roster_id'], name='unique_student_roster_id'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The user a record is unlinked from has their cached class listing invalidated too
+        instance._stored_user_id = instance.__dict__.get('user_id')
+        return instance
+    
     def __str__(self):
         return self.name
 
 
-class Question(models.Model):
+class StoredImageMixin:
+    """Remembers the image name loaded from the database so changes can be detected on save."""
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # None means the image column was deferred and its stored value is unknown
+        instance._stored_image = (instance.__dict__.get('image') or '') if 'image' in instance.__dict__ else None
+        return instance
+
+
+class ImageStatus(models.TextChoices):
+    """Processing state of an uploaded image."""
+    PROCESSING = 'processing', 'Processing'
+    READY = 'ready', 'Ready'
+    FAILED = 'failed', 'Failed'
+
+
+class Question(StoredClassMixin, StoredImageMixin, models.Model):
     """Question model for class questions with optional images."""
     question_text = models.TextField()
-    image = models.ImageField(upload_to='questions/', blank=True, null=True)
+    image = models.ImageField(upload_to='questions/', storage=media_storage, blank=True, null=True, db_index=True)
+    image_derivatives = models.JSONField(default=dict, blank=True)
+    # Of the stored image as normalized by its image job (see ingest.py); unknown until then and for older uploads
+    image_width = models.PositiveIntegerField(blank=True, null=True)
+    image_height = models.PositiveIntegerField(blank=True, null=True)
+    image_bytes = models.PositiveIntegerField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=ImageStatus.choices, default=ImageStatus.READY)
     class_related = models.ForeignKey(
         Class, 
         on_delete=models.CASCADE, 
@@ -51,11 +113,13 @@ class Question(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class_field = 'class_related_id'
+    
     def __str__(self):
         return self.question_text[:50]
 
 
-class Answer(models.Model):
+class Answer(StoredImageMixin, models.Model):
     """Answer model for student responses to questions."""
     student = models.ForeignKey(
         Student, 
@@ -67,12 +131,159 @@ class Answer(models.Model):
         on_delete=models.CASCADE, 
         related_name='answers'
     )
-    image = models.ImageField(upload_to='answers/')
+    image = models.ImageField(upload_to='answers/', storage=media_storage, db_index=True)
+    image_derivatives = models.JSONField(default=dict, blank=True)
+    # Of the stored image as normalized by its image job (see ingest.py); unknown until then and for older uploads
+    image_width = models.PositiveIntegerField(blank=True, null=True)
+    image_height = models.PositiveIntegerField(blank=True, null=True)
+    image_bytes = models.PositiveIntegerField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=ImageStatus.choices, default=ImageStatus.READY)
     liked = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['question', '-created_at', '-id']),
+            models.Index(fields=['student', 'question']),
+            models.Index(fields=['question', 'updated_at']),
+            models.Index(fields=['student', 'updated_at']),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # None means liked was deferred; the liked counters follow changes to it
+        instance._stored_liked = instance.__dict__.get('liked')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # The post_save signals move the participation counters in the same transaction
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.student.name} - {self.question.question_text[:30]}"
+
+
+class AnswerTombstone(models.Model):
+    """Record of a deleted answer, used by delta (since cursor) listings."""
+    answer_id = models.BigIntegerField()
+    question_id = models.BigIntegerField()
+    student_id = models.BigIntegerField()
+    class_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['question_id', 'deleted_at']),
+            models.Index(fields=['student_id', 'deleted_at']),
+            models.Index(fields=['class_id', 'deleted_at']),
+        ]
+    
+    def __str__(self):
+        return f"Deleted answer {self.answer_id}"
+
+
+class ImageJob(models.Model):
+    """Queued background processing (normalization and derivatives) of an uploaded image."""
+    
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+        # The row was deleted or given another image while the job ran
+        DROPPED = 'dropped', 'Dropped'
+    
+    answer = models.ForeignKey(
+        Answer,
+        on_delete=models.CASCADE,
+        related_name='image_jobs',
+        blank=True,
+        null=True
+    )
+    question = models.ForeignKey(
+        Question,
+        on_delete=models.CASCADE,
+        related_name='image_jobs',
+        blank=True,
+        null=True
+    )
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    # New uploads are normalized first; backfilled derivatives of stored images are not
+    normalize = models.BooleanField(default=False)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+    
+    @property
+    def target(self):
+        """The Answer or Question whose image this job processes."""
+        return self.answer if self.answer_id else self.question
+    
+    def __str__(self):
+        return f"Image job {self.id} ({self.status})"
+
+
+class UploadSession(models.Model):
+    """A resumable chunked upload; chunks are written to a temp file until finalized."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        Instructor,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    received = models.PositiveIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes)"
+
+
+class MediaBlob(models.Model):
+    """Reference count of a content-addressed media file shared by Question/Answer rows."""
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class QuestionStats(models.Model):
+    """Participation counters of a question, moved with every answer write (see stats.py)."""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    answer_count = models.IntegerField(default=0)
+    liked_count = models.IntegerField(default=0)
+    # Distinct students with at least one answer
+    respondent_count = models.IntegerField(default=0)
+    last_answer_at = models.DateTimeField(blank=True, null=True)
+    
+    def __str__(self):
+        return f"Stats of question {self.question_id}"
+
+
+class ClassStats(models.Model):
+    """Participation counters of a class across its questions, moved with every answer write (see stats.py)."""
+    class_obj = models.OneToOneField(Class, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    answer_count = models.IntegerField(default=0)
+    liked_count = models.IntegerField(default=0)
+    # Distinct students with at least one answer to any question of the class
+    respondent_count = models.IntegerField(default=0)
+    last_answer_at = models.DateTimeField(blank=True, null=True)
+    
+    def __str__(self):
+        return f"Stats of class {self.class_obj_id}"
@@ -0,0 +1,179 @@
+"""
+Contact-sheet mosaics of a question's answers, for showing on the live slide.
+
+A mosaic is a grid of answer thumbnails, each labelled with the student's
+name and framed when liked, composed on the server so the add-in inserts
+one image instead of fetching every answer. Answers are laid out oldest
+first, so new answers only append tiles. The composed canvas is cached with
+a signature of each tile; the next request redraws only the tiles whose
+signature changed (new, liked/unliked or shifted by a deletion) and pastes
+them onto the cached canvas. Tiles are decoded and resized on a thread
+pool, since Pillow releases the GIL while it does so.
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image, ImageDraw, ImageOps, UnidentifiedImageError
+
+from .models import Answer, ImageStatus
+
+DEFAULT_COLUMNS = 4
+MAX_COLUMNS = 12
+DEFAULT_TILE_SIZE = 160
+MIN_TILE_SIZE = 64
+MAX_TILE_SIZE = 400
+MAX_MOSAIC_TILES = 400
+TILE_RENDER_THREADS = 4
+
+GAP = 8
+LABEL_HEIGHT = 18
+BORDER = 4
+BACKGROUND = (255, 255, 255)
+PLACEHOLDER = (230, 230, 230)
+LIKED_COLOR = (232, 62, 140)
+TEXT_COLOR = (40, 40, 40)
+
+# Smallest stored derivative that is at least this big is used as a tile's source
+DERIVATIVE_SIZES = (('thumb', 200), ('slide', 1280))
+
+
+class MosaicLayout:
+    """Grid geometry of a mosaic: `columns` cells across, each `tile` pixels square plus an optional label."""
+    
+    def __init__(self, columns=DEFAULT_COLUMNS, tile=DEFAULT_TILE_SIZE, labels=True):
+        self.columns = columns
+        self.tile = tile
+        self.labels = labels
+        self.cell_width = tile
+        self.cell_height = tile + (LABEL_HEIGHT if labels else 0)
+    
+    @property
+    def key(self):
+        return f'{self.columns}x{self.tile}{"l" if self.labels else ""}'
+    
+    def size(self, count):
+        rows = max(1, -(-count // self.columns))
+        return (
+            GAP + self.columns * (self.cell_width + GAP),
+            GAP + rows * (self.cell_height + GAP),
+        )
+    
+    def position(self, index):
+        row, column = divmod(index, self.columns)
+        return GAP + column * (self.cell_width + GAP), GAP + row * (self.cell_height + GAP)
+
+
+def tile_source(row, tile_size):
+    """(storage, name) of the smallest stored image big enough for a tile."""
+    storage = Answer._meta.get_field('image').storage
+    derivatives = row['image_derivatives'] or {}
+    for name, max_size in DERIVATIVE_SIZES:
+        if max_size >= tile_size and name in derivatives:
+            return storage, derivatives[name]['path']
+    return storage, row['image']
+
+
+def tile_signature(row, tile_size):
+    """Everything a tile's pixels depend on; a tile is redrawn only when this changes."""
+    ready = row['status'] == ImageStatus.READY
+    return (row['id'], tile_source(row, tile_size)[1] if ready else None, row['liked'], row['student__name'])
+
+
+def render_tile(row, layout):
+    """One cell of the mosaic: the answer image fitted into the tile, its frame and label."""
+    cell = Image.new('RGB', (layout.cell_width, layout.cell_height), BACKGROUND)
+    inner = layout.tile - 2 * BORDER
+    picture = None
+    if row['status'] == ImageStatus.READY:
+        storage, name = tile_source(row, layout.tile)
+        try:
+            with storage.open(name, 'rb') as f:
+                picture = Image.open(f)
+                # Lets JPEG decode at a reduced scale straight away
+                picture.draft('RGB', (inner, inner))
+                picture = ImageOps.contain(ImageOps.exif_transpose(picture).convert('RGB'), (inner, inner))
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            picture = None
+    
+    draw = ImageDraw.Draw(cell)
+    if row['liked']:
+        draw.rectangle((0, 0, layout.tile - 1, layout.tile - 1), fill=LIKED_COLOR)
+    if picture is None:
+        draw.rectangle((BORDER, BORDER, layout.tile - BORDER - 1, layout.tile - BORDER - 1), fill=PLACEHOLDER)
+        draw.text((layout.tile // 2, layout.tile // 2), '...', fill=TEXT_COLOR, anchor='mm')
+    else:
+        cell.paste(picture, ((layout.tile - picture.width) // 2, (layout.tile - picture.height) // 2))
+    
+    if layout.labels:
+        name = row['student__name'] or ''
+        while name and draw.textlength(name) > layout.tile:
+            name = name[:-1]
+        draw.text((layout.tile // 2, layout.tile + LABEL_HEIGHT // 2), name, fill=TEXT_COLOR, anchor='mm')
+    return cell
+
+
+def compose(layout, rows, previous=None):
+    """
+    The mosaic canvas of `rows` and their tile signatures. With `previous`
+    (canvas, signatures) of the same layout, only changed tiles are drawn.
+    Returns (canvas, signatures, number of tiles drawn).
+    """
+    signatures = [tile_signature(row, layout.tile) for row in rows]
+    size = layout.size(len(rows))
+    canvas = Image.new('RGB', size, BACKGROUND)
+    old_signatures = []
+    if previous is not None:
+        old_canvas, old_signatures = previous
+        # Keep the cells that are unchanged; the canvas grows or shrinks by whole rows, and new rows start blank
+        overlap = (min(old_canvas.width, size[0]), min(old_canvas.height, size[1]))
+        canvas.paste(old_canvas.crop((0, 0) + overlap), (0, 0))
+        for index in range(len(rows), len(old_signatures)):
+            x, y = layout.position(index)
+            canvas.paste(BACKGROUND, (x, y, x + layout.cell_width, y + layout.cell_height))
+    
+    changed = [
+        index for index, signature in enumerate(signatures)
+        if index >= len(old_signatures) or old_signatures[index] != signature
+    ]
+    with ThreadPoolExecutor(max_workers=TILE_RENDER_THREADS) as pool:
+        tiles = pool.map(lambda index: render_tile(rows[index], layout), changed)
+        for index, tile in zip(changed, tiles):
+            canvas.paste(tile, layout.position(index))
+    return canvas, signatures, len(changed)
+
+
+def question_mosaic(question_id, layout):
+    """
+    The JPEG mosaic of a question's answers (the first MAX_MOSAIC_TILES),
+    read through the cache. Returns (jpeg bytes, etag, tiles drawn).
+    """
+    rows = list(
+        Answer.objects.filter(question_id=question_id)
+        .order_by('created_at', 'id')
+        .values('id', 'image', 'image_derivatives', 'status', 'liked', 'student__name')[:MAX_MOSAIC_TILES]
+    )
+    signatures = [tile_signature(row, layout.tile) for row in rows]
+    etag = '"{}"'.format(hashlib.sha256(f'{layout.key}|{signatures}'.encode()).hexdigest()[:32])
+    
+    cache_key = f'mosaic:{question_id}:{layout.key}'
+    entry = cache.get(cache_key)
+    if entry is not None and entry['etag'] == etag:
+        return entry['jpeg'], etag, 0
+    
+    previous = None
+    if entry is not None:
+        previous = (Image.open(BytesIO(entry['canvas'])), entry['signatures'])
+    canvas, signatures, drawn = compose(layout, rows, previous)
+    
+    # The canvas is kept losslessly so later updates do not compound JPEG artefacts
+    lossless = BytesIO()
+    canvas.save(lossless, 'PNG', compress_level=1)
+    jpeg = BytesIO()
+    canvas.save(jpeg, 'JPEG', quality=85)
+    cache.set(cache_key, {
+        'etag': etag, 'signatures': signatures, 'canvas': lossless.getvalue(), 'jpeg': jpeg.getvalue(),
+    }, getattr(settings, 'READ_CACHE_TIMEOUT', 3600))
+    return jpeg.getvalue(), etag, drawn
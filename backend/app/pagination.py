@@ -0,0 +1,61 @@
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+from .cursors import decode_keyset_cursor, encode_keyset_cursor
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in keyset pagination over (created_at, id), newest first.
+    
+    Listings stay unpaginated unless ?page_size= is given. Each page returns
+    {"results": [...], "next": <cursor or null>}; pass the cursor back as
+    ?after= for the next page. Unlike offset pagination, each page is a
+    single index range scan starting at the cursor, on the listing's
+    (question, -created_at, -id) index, no matter how deep into the
+    listing it is.
+    """
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'after'
+    max_page_size = 500
+    
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param)
+        if page_size is None:
+            return None
+        if not page_size.isdigit() or int(page_size) < 1:
+            raise ValidationError("page_size must be a positive integer")
+        return min(int(page_size), self.max_page_size)
+    
+    def page_queryset(self, queryset, after):
+        """`queryset` in page order, from past the (created_at, id) cursor `after` when given."""
+        queryset = queryset.order_by('-created_at', '-id')
+        if after is None:
+            return queryset
+        created_at, pk = after
+        # The OR alone cannot bound an index scan; the redundant created_at <= cursor starts it at the cursor
+        return queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk), created_at__lte=created_at
+        )
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if page_size is None:
+            return None
+        
+        queryset = self.page_queryset(queryset, decode_keyset_cursor(request.query_params.get(self.cursor_query_param)))
+        
+        # Fetch one extra row to learn whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        page = rows[:page_size]
+        self.next_cursor = None
+        if len(rows) > page_size:
+            # Pages are model instances, or values() rows for projections
+            last = page[-1] if isinstance(page[-1], dict) else vars(page[-1])
+            self.next_cursor = encode_keyset_cursor(last['created_at'], last['id'])
+        return page
+    
+    def get_paginated_response(self, data):
+        return Response({'results': data, 'next': self.next_cursor})
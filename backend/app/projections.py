@@ -0,0 +1,226 @@
+"""
+Lean serialization of list endpoints straight from values() rows.
+
+A listing of a class's answers can be thousands of rows, and the
+ModelSerializers build a model instance per row, call a method per
+computed field and build every absolute URL from scratch. A Projection
+reads only the columns its output needs, with related names and the
+truncated question text computed in SQL, and builds media URLs by
+appending the file path to each storage's absolute base URL, computed
+once per response. Its output is the same JSON as the serializer it
+mirrors, which stays in use for single objects and writes. ``?fields=``
+(a comma-separated list of output fields) narrows both the output and the
+columns read.
+"""
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Case, TextField, Value, When
+from django.db.models.functions import Concat, Length, Substr
+from django.db.models.lookups import GreaterThan
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .images import DERIVATIVES, backfill_derivatives, lacks_derivatives
+from .serializers import AnswerSerializer, ClassSerializer, QuestionSerializer, StudentSerializer
+
+IMAGE_FIELDS = ('image', 'image_url', 'image_urls')
+# Fields whose serializer methods backfill missing derivatives
+DERIVATIVE_FIELDS = ('image_url', 'image_urls')
+IMAGE_COLUMNS = ('image', 'image_derivatives', 'status')
+
+
+def truncated_text(lookup, length):
+    """SQL for AnswerSerializer.get_question_text: the first `length` characters plus '...', or None if empty."""
+    return Case(
+        When(**{lookup: ''}, then=Value(None)),
+        When(GreaterThan(Length(lookup), length), then=Concat(Substr(lookup, 1, length), Value('...'))),
+        default=lookup,
+        output_field=TextField(),
+    )
+
+
+class MediaUrls:
+    """Absolute URLs of stored files for one request, built from each storage's base URL."""
+    
+    def __init__(self, request):
+        self.request = request
+        self.prefixes = {}
+    
+    def prefix(self, storage):
+        if storage not in self.prefixes:
+            # Other storages may build URLs per file (e.g. signed URLs), so only file systems are shortcut
+            self.prefixes[storage] = (
+                self.request.build_absolute_uri(storage.base_url) if isinstance(storage, FileSystemStorage) else None
+            )
+        return self.prefixes[storage]
+    
+    def url(self, storage, name):
+        """Same as request.build_absolute_uri(storage.url(name))."""
+        prefix = self.prefix(storage)
+        if prefix is None:
+            return self.request.build_absolute_uri(storage.url(name))
+        url = prefix + filepath_to_uri(name).lstrip('/')
+        # Signed, for ContentAddressedStorage
+        url_query = getattr(storage, 'url_query', None)
+        return url + url_query(name) if url_query else url
+
+
+class Projection:
+    """
+    List serialization from values() rows that matches `serializer_class`.
+    `columns` maps each output field that is not an image to its values()
+    lookup or an expression; image, image_url and image_urls are built from
+    the image columns like images.build_image_url(s) does.
+    """
+    serializer_class = None
+    columns = {}
+    
+    def __init__(self, request):
+        self.request = request
+        self.serializer = self.serializer_class(context={'request': request})
+        readable = [name for name, field in self.serializer.fields.items() if not field.write_only]
+        self.fields = self.requested_fields(readable)
+        self.media = MediaUrls(request)
+    
+    def requested_fields(self, readable):
+        """The readable fields narrowed by ?fields=, in the serializer's order."""
+        param = self.request.query_params.get('fields')
+        if not param:
+            return readable
+        requested = {name.strip() for name in param.split(',') if name.strip()}
+        unknown = sorted(requested - set(readable))
+        if unknown:
+            raise ValidationError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(readable)}")
+        return [name for name in readable if name in requested]
+    
+    def queryset(self, queryset):
+        """`queryset` as values() rows with the columns of the requested fields (and id and created_at for paging)."""
+        lookups = {'id', 'created_at'}
+        annotations = {}
+        for name in self.fields:
+            if name in IMAGE_FIELDS:
+                lookups.update(IMAGE_COLUMNS)
+            elif isinstance(self.columns[name], str):
+                lookups.add(self.columns[name])
+            else:
+                annotations[f'_{name}'] = self.columns[name]
+        return queryset.values(*lookups, **annotations)
+    
+    def column_value(self, row, name):
+        column = self.columns[name]
+        value = row[column] if isinstance(column, str) else row[f'_{name}']
+        field = self.serializer.fields[name]
+        # Relations are represented by their pk and method fields by their own result, as read
+        if value is None or isinstance(field, (serializers.RelatedField, serializers.SerializerMethodField)):
+            return value
+        return field.to_representation(value)
+    
+    @property
+    def storage(self):
+        return self.serializer_class.Meta.model._meta.get_field('image').storage
+    
+    def image_urls(self, row):
+        urls = {'original': self.media.url(self.storage, row['image'])}
+        derivatives = row['image_derivatives'] or {}
+        for name in DERIVATIVES:
+            if name in derivatives:
+                urls[name] = self.media.url(self.storage, derivatives[name]['path'])
+        return urls
+    
+    def image_value(self, row, name):
+        if not row['image']:
+            return None
+        if name == 'image_urls':
+            return self.image_urls(row)
+        size = self.request.GET.get('size') if name == 'image_url' else None
+        derivatives = row['image_derivatives'] or {}
+        if size in DERIVATIVES and derivatives.get(size):
+            return self.media.url(self.storage, derivatives[size]['path'])
+        return self.media.url(self.storage, row['image'])
+    
+    def to_representation(self, row):
+        return {
+            name: self.image_value(row, name) if name in IMAGE_FIELDS else self.column_value(row, name)
+            for name in self.fields
+        }
+    
+    def serialize(self, rows):
+        """
+        Serialize values() rows from queryset(), in order, backfilling the
+        derivatives missing from any of them like the serializer does.
+        """
+        rows = list(rows)
+        if any(name in DERIVATIVE_FIELDS for name in self.fields):
+            missing = [row['id'] for row in rows if lacks_derivatives(row['image'], row['image_derivatives'], row['status'])]
+            if missing:
+                changed = backfill_derivatives(self.serializer_class.Meta.model, missing)
+                for row in rows:
+                    row.update((name, value) for name, value in changed.get(row['id'], {}).items() if name in row)
+        return [self.to_representation(row) for row in rows]
+    
+    def data(self, queryset):
+        return self.serialize(self.queryset(queryset))
+
+
+class ClassProjection(Projection):
+    serializer_class = ClassSerializer
+    columns = {
+        'id': 'id',
+        'class_name': 'class_name',
+        'instructor': 'instructor_id',
+        'instructor_name': 'instructor__name',
+        'created_at': 'created_at',
+    }
+
+
+class StudentProjection(Projection):
+    serializer_class = StudentSerializer
+    columns = {
+        'id': 'id',
+        'name': 'name',
+        'phone': 'phone',
+        'roster_id': 'roster_id',
+        'class_enrolled': 'class_enrolled_id',
+        'class_name': 'class_enrolled__class_name',
+        'user': 'user_id',
+        'created_at': 'created_at',
+    }
+
+
+class QuestionProjection(Projection):
+    serializer_class = QuestionSerializer
+    columns = {
+        'id': 'id',
+        'question_text': 'question_text',
+        'status': 'status',
+        'class_related': 'class_related_id',
+        'created_at': 'created_at',
+    }
+
+
+class AnswerProjection(Projection):
+    serializer_class = AnswerSerializer
+    columns = {
+        'id': 'id',
+        'student': 'student_id',
+        'student_name': 'student__name',
+        'question': 'question_id',
+        'question_text': truncated_text('question__question_text', 50),
+        'status': 'status',
+        'liked': 'liked',
+        'created_at': 'created_at',
+    }
+
+
+class ProjectedListMixin:
+    """Serve a ViewSet's list action through `projection_class` instead of its serializer."""
+    projection_class = None
+    
+    def list(self, request, *args, **kwargs):
+        projection = self.projection_class(request)
+        queryset = projection.queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(projection.serialize(page))
+        return Response(projection.serialize(queryset))
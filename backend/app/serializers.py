@@ -1,31 +1,45 @@
+from django.db.models.functions import Lower
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from .models import Instructor, Class, Student, Question, Answer
+from .models import Instructor, Class, Student, Question, Answer, UploadSession
+from .images import build_image_url, build_image_urls
+from .ingest import check_image
+from .jobs import schedule_image_processing
 import os
 
+# Upload limits shared by multipart and chunked uploads (8MB = 8 * 1024 * 1024 bytes)
+MAX_IMAGE_SIZE = 8 * 1024 * 1024
+ALLOWED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif']
+
+
+def validate_image_extension(filename):
+    """Validate that a filename has an allowed image extension."""
+    file_extension = os.path.splitext(filename)[1].lower()
+    
+    if file_extension not in ALLOWED_IMAGE_EXTENSIONS:
+        raise ValidationError(f"Invalid file extension. Allowed: {', '.join(ALLOWED_IMAGE_EXTENSIONS)}")
+
+
+def validate_image_size(size):
+    """Validate that a file size is within the upload limit."""
+    if size > MAX_IMAGE_SIZE:
+        raise ValidationError(f"File size exceeds 8MB limit. Current size: {size / (1024 * 1024):.2f}MB")
+
 
 def validate_image_file(image):
     """
-    Validate image file size and extension.
+    Validate image file size and extension, and check from its header that
+    it is an image; it is normalized later by its image job (see ingest.py).
     Max size: 8MB
     Allowed extensions: .jpg, .jpeg, .png, .gif
     """
     if not image:
         return image
     
-    # Check file size (8MB = 8 * 1024 * 1024 bytes)
-    max_size = 8 * 1024 * 1024
-    if image.size > max_size:
-        raise ValidationError(f"File size exceeds 8MB limit. Current size: {image.size / (1024 * 1024):.2f}MB")
-    
-    # Check file extension
-    allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif']
-    file_extension = os.path.splitext(image.name)[1].lower()
+    validate_image_size(image.size)
+    validate_image_extension(image.name)
     
-    if file_extension not in allowed_extensions:
-        raise ValidationError(f"Invalid file extension. Allowed: {', '.join(allowed_extensions)}")
-    
-    return image
+    return check_image(image)
 
 
 class InstructorSerializer(serializers.ModelSerializer):
@@ -63,31 +77,76 @@ class ClassSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+def accounts_by_email(emails):
+    """Ids of the accounts with the given emails, matched case-insensitively: {lowercased email: id}."""
+    emails = {email.lower() for email in emails if email}
+    if not emails:
+        return {}
+    return dict(
+        Instructor.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails).values_list('email_lower', 'id')
+    )
+
+
 class StudentSerializer(serializers.ModelSerializer):
     class_name = serializers.SerializerMethodField()
+    # The account to link the record to, by its email; blank unlinks it
+    email = serializers.EmailField(write_only=True, required=False, allow_blank=True)
     
     class Meta:
         model = Student
-        fields = ['id', 'name', 'phone', 'class_enrolled', 'class_name', 'created_at']
+        fields = ['id', 'name', 'phone', 'roster_id', 'class_enrolled', 'class_name', 'user', 'email', 'created_at']
+        # Enrollment checks trust the link, so it is only made through a matching email
+        read_only_fields = ['user']
     
     def get_class_name(self, obj):
         return obj.class_enrolled.class_name if obj.class_enrolled else None
+    
+    def validate_roster_id(self, roster_id):
+        # Blank means no roster id; store NULL so it never collides with another student's
+        return roster_id or None
+    
+    def validate_email(self, email):
+        """The id of the account with this email, or None when blank."""
+        if not email:
+            return None
+        user_id = accounts_by_email([email]).get(email.lower())
+        if user_id is None:
+            raise ValidationError("No account has this email")
+        return user_id
+    
+    def create(self, validated_data):
+        if 'email' in validated_data:
+            validated_data['user_id'] = validated_data.pop('email')
+        return super().create(validated_data)
+    
+    def update(self, instance, validated_data):
+        if 'email' in validated_data:
+            validated_data['user_id'] = validated_data.pop('email')
+        return super().update(instance, validated_data)
 
 
 class QuestionSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_urls = serializers.SerializerMethodField()
     class_id = serializers.IntegerField(write_only=True, required=False)
     
     class Meta:
         model = Question
-        fields = ['id', 'question_text', 'image', 'image_url', 'class_related', 'class_id', 'created_at']
-        read_only_fields = ['class_related']
+        fields = ['id', 'question_text', 'image', 'image_url', 'image_urls', 'status', 'class_related', 'class_id', 'created_at']
+        read_only_fields = ['class_related', 'status']
     
     def get_image_url(self, obj):
         if obj.image:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.image.url)
+                return build_image_url(obj, request)
+        return None
+    
+    def get_image_urls(self, obj):
+        if obj.image:
+            request = self.context.get('request')
+            if request:
+                return build_image_urls(obj, request)
         return None
     
     def validate_image(self, image):
@@ -98,11 +157,21 @@ class QuestionSerializer(serializers.ModelSerializer):
         class_id = validated_data.pop('class_id', None)
         if class_id:
             validated_data['class_related_id'] = class_id
-        return super().create(validated_data)
+        question = super().create(validated_data)
+        schedule_image_processing(question)
+        return question
+    
+    def update(self, instance, validated_data):
+        question = super().update(instance, validated_data)
+        # A replaced image needs verifying and new derivatives
+        if 'image' in validated_data:
+            schedule_image_processing(question)
+        return question
 
 
 class AnswerSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_urls = serializers.SerializerMethodField()
     student_name = serializers.SerializerMethodField()
     question_text = serializers.SerializerMethodField()
     student_id = serializers.IntegerField(write_only=True, required=False)
@@ -110,14 +179,21 @@ class AnswerSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Answer
-        fields = ['id', 'student', 'student_name', 'question', 'question_text', 'image', 'image_url', 'liked', 'student_id', 'question_id', 'created_at']
-        read_only_fields = ['student', 'question']
+        fields = ['id', 'student', 'student_name', 'question', 'question_text', 'image', 'image_url', 'image_urls', 'status', 'liked', 'student_id', 'question_id', 'created_at']
+        read_only_fields = ['student', 'question', 'status']
     
     def get_image_url(self, obj):
         if obj.image:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.image.url)
+                return build_image_url(obj, request)
+        return None
+    
+    def get_image_urls(self, obj):
+        if obj.image:
+            request = self.context.get('request')
+            if request:
+                return build_image_urls(obj, request)
         return None
     
     def get_student_name(self, obj):
@@ -140,5 +216,30 @@ class AnswerSerializer(serializers.ModelSerializer):
             validated_data['student_id'] = student_id
         if question_id:
             validated_data['question_id'] = question_id
-            
-        return super().create(validated_data)
+        
+        answer = super().create(validated_data)
+        schedule_image_processing(answer)
+        return answer
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
+    
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'sha256', 'offset', 'created_at']
+        read_only_fields = ['id', 'created_at']
+    
+    def validate_filename(self, filename):
+        validate_image_extension(filename)
+        return os.path.basename(filename)
+    
+    def validate_size(self, size):
+        validate_image_size(size)
+        return size
+    
+    def validate_sha256(self, sha256):
+        sha256 = sha256.lower()
+        if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+            raise ValidationError("sha256 must be a hex-encoded SHA-256 digest")
+        return sha256
@@ -0,0 +1,151 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import user_states
+from .caching import invalidate
+from .media import release_blob, retain_blob
+from .models import Answer, AnswerTombstone, Class, Instructor, Question, Student
+from .stats import answer_change, move_counters, rebuild_stats
+
+
+_bulk_deletion = threading.local()
+
+
+@contextmanager
+def answers_recorded_in_bulk():
+    """
+    Have the post_delete receivers below skip the answers deleted in this
+    block, whose tombstones, blob releases and counter moves the caller
+    records in batches instead (see views.bulk_delete_answers).
+    """
+    _bulk_deletion.active = True
+    try:
+        yield
+    finally:
+        _bulk_deletion.active = False
+
+
+def recorded_in_bulk(sender):
+    return sender is Answer and getattr(_bulk_deletion, 'active', False)
+
+
+# Registered first, for the receivers below
+@receiver(post_delete, sender=Answer)
+def share_deleted_question(sender, instance, origin=None, **kwargs):
+    """Answers deleted along with their question are given it, so their class needs no query per answer."""
+    if isinstance(origin, Question) and origin.pk == instance.question_id and not Answer.question.is_cached(instance):
+        Answer.question.field.set_cached_value(instance, origin)
+
+
+@receiver(post_delete, sender=Answer)
+def record_answer_tombstone(sender, instance, **kwargs):
+    """Leave a tombstone so delta listings can report the deletion."""
+    if recorded_in_bulk(sender):
+        return
+    if Answer.question.is_cached(instance):
+        class_id = instance.question.class_related_id
+    else:
+        # Looked up by the INSERT instead of a query of its own
+        class_id = Subquery(Question.objects.filter(pk=instance.question_id).values('class_related_id')[:1])
+    AnswerTombstone.objects.create(
+        answer_id=instance.id,
+        question_id=instance.question_id,
+        student_id=instance.student_id,
+        class_id=class_id,
+    )
+
+
+@receiver(post_save, sender=Answer)
+def count_saved_answer(sender, instance, created, **kwargs):
+    """Move the participation counters for a new answer or a like toggle."""
+    stored = getattr(instance, '_stored_liked', None)
+    if created:
+        move_counters([answer_change(instance, 1, int(instance.liked))])
+    elif stored is not None and stored != instance.liked:
+        move_counters([answer_change(instance, 0, 1 if instance.liked else -1)])
+    instance._stored_liked = instance.liked
+
+
+@receiver(post_delete, sender=Answer)
+def count_deleted_answer(sender, instance, **kwargs):
+    if recorded_in_bulk(sender):
+        return
+    move_counters([answer_change(instance, -1, -int(instance.liked))])
+
+
+@receiver(post_save, sender=Answer)
+@receiver(post_save, sender=Question)
+def track_image_reference(sender, instance, created, **kwargs):
+    """Move the image reference count when a row gets a new image."""
+    stored = '' if created else getattr(instance, '_stored_image', None)
+    if stored is None:
+        return
+    current = instance.image.name or ''
+    if current != stored:
+        retain_blob(current)
+        release_blob(stored)
+        instance._stored_image = current
+
+
+@receiver(post_delete, sender=Answer)
+@receiver(post_delete, sender=Question)
+def release_image_reference(sender, instance, **kwargs):
+    """Drop the deleted row's image reference (deleting the file if it was the last)."""
+    if recorded_in_bulk(sender):
+        return
+    stored = getattr(instance, '_stored_image', None)
+    release_blob(instance.image.name if stored is None else stored)
+
+
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+def invalidate_class_reads(sender, instance, **kwargs):
+    invalidate(classes=[instance.id], instructors=[instance.instructor_id])
+
+
+# Registered before invalidate_question_reads, which records the new class as stored
+@receiver(post_save, sender=Question)
+def recount_moved_question(sender, instance, **kwargs):
+    """A question moved to another class takes its answers to the other class's counters."""
+    stored = getattr(instance, '_stored_class_id', None)
+    if stored is not None and stored != instance.class_related_id:
+        rebuild_stats(class_ids=[stored, instance.class_related_id])
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question_reads(sender, instance, **kwargs):
+    invalidate(classes=[instance.class_related_id, getattr(instance, '_stored_class_id', None)])
+    instance._stored_class_id = instance.class_related_id
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def invalidate_roster_reads(sender, instance, **kwargs):
+    """The roster of the record's class changed, and so did the classes of the users it is (or was) linked to."""
+    invalidate(
+        classes=[instance.class_enrolled_id, getattr(instance, '_stored_class_id', None)],
+        users=[instance.user_id, getattr(instance, '_stored_user_id', None)],
+    )
+    instance._stored_class_id = instance.class_enrolled_id
+    instance._stored_user_id = instance.user_id
+
+
+@receiver(post_save, sender=Instructor)
+def invalidate_instructor_reads(sender, instance, created, update_fields=None, **kwargs):
+    """Cached class listings show the instructor's name; logins only touch last_login."""
+    if created or update_fields == frozenset(['last_login']):
+        return
+    invalidate(classes=instance.classes.values_list('id', flat=True), instructors=[instance.id])
+
+
+@receiver(post_save, sender=Instructor)
+@receiver(post_delete, sender=Instructor)
+def forget_user_state(sender, instance, update_fields=None, **kwargs):
+    """Recheck an account on its next request, e.g. after it was deactivated."""
+    if update_fields != frozenset(['last_login']):
+        user_states.discard(instance.pk)
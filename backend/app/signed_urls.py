@@ -0,0 +1,86 @@
+"""
+Short-lived signed URLs, for requests that cannot send an Authorization
+header: ``<img>`` tags loading media, EventSource streams and downloads
+started by navigating the browser. The access token itself never goes in
+a query string, where it would be kept in server logs and browser history.
+
+Media URLs carry a signature of the file name (see
+ContentAddressedStorage.url). Whoever holds one can read that file, and
+nothing else, until it expires: the listing that returned it already let
+its user see the file. The signature's timestamp is rounded down, so a
+file's URL stays the same for a while and browsers keep using their cached
+copy; it is valid for at least media_url_lifetime() seconds after it was
+issued, which cached listings are kept within.
+
+Other URLs are signed for a user by ``POST /api/signed-urls/``, bound to
+that user and the URL's path, and are valid for SIGNED_URL_MAX_AGE
+seconds: long enough to open the stream or start the download.
+"""
+import time
+
+from django.conf import settings
+from django.core.signing import BadSignature, TimestampSigner, b62_encode
+
+MEDIA_SALT = 'app.signed_urls.media'
+REQUEST_SALT = 'app.signed_urls.request'
+
+
+class RoundedTimestampSigner(TimestampSigner):
+    """TimestampSigner whose timestamps are rounded down to `interval` seconds."""
+    
+    def __init__(self, *, interval, **kwargs):
+        super().__init__(**kwargs)
+        self.interval = interval
+    
+    def timestamp(self):
+        now = int(time.time())
+        return b62_encode(now - now % self.interval)
+
+
+def media_url_max_age():
+    return getattr(settings, 'SIGNED_MEDIA_URL_MAX_AGE', 7200)
+
+
+def media_url_lifetime():
+    """How long a media URL stays valid at least, counted from when it was issued."""
+    return media_url_max_age() // 2
+
+
+def split_signature(signed, value):
+    """The 'timestamp:signature' part of a signer's output for `value`."""
+    return signed[len(value) + 1:]
+
+
+def sign_media_name(name):
+    """Signature for the URL of the stored file `name`."""
+    signer = RoundedTimestampSigner(salt=MEDIA_SALT, interval=media_url_max_age() - media_url_lifetime())
+    return split_signature(signer.sign(name), name)
+
+
+def valid_media_signature(name, signature):
+    """Whether `signature` (from sign_media_name) is a current signature of `name`."""
+    try:
+        TimestampSigner(salt=MEDIA_SALT).unsign(f'{name}:{signature}', max_age=media_url_max_age())
+    except BadSignature:
+        return False
+    return True
+
+
+def sign_request_path(user_id, path):
+    """Signature letting `user_id` request `path` (any query string) for SIGNED_URL_MAX_AGE seconds."""
+    value = f'{user_id}:{path}'
+    return f'{user_id}:{split_signature(TimestampSigner(salt=REQUEST_SALT).sign(value), value)}'
+
+
+def signed_request_user_id(request):
+    """The user a request's ?signature= (from sign_request_path) was issued to, or None."""
+    user_id, _, signature = request.GET.get('signature', '').partition(':')
+    if not user_id.isdigit():
+        return None
+    try:
+        TimestampSigner(salt=REQUEST_SALT).unsign(
+            f'{user_id}:{request.path}:{signature}', max_age=getattr(settings, 'SIGNED_URL_MAX_AGE', 60)
+        )
+    except BadSignature:
+        return None
+    return int(user_id)
@@ -0,0 +1,258 @@
+"""
+Participation statistics of questions and classes, read from counters.
+
+QuestionStats and ClassStats rows hold the number of answers, liked
+answers and distinct answering students, and the time of the latest
+answer, so the stats endpoint reads one row per question instead of
+counting answers. The counters are moved in the same transaction as the
+answer writes that change them: by signals for single answers and
+directly by the bulk paths, which skip signals. A row missing when an
+answer is added or liked is computed from the answers at that point.
+``python manage.py rebuild_stats`` recomputes every counter to verify them.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Case, Count, F, IntegerField, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Answer, Class, ClassStats, Question, QuestionStats, Student
+
+COUNTERS = ('answer_count', 'liked_count', 'respondent_count')
+FIELDS = COUNTERS + ('last_answer_at',)
+EMPTY = {'answer_count': 0, 'liked_count': 0, 'respondent_count': 0, 'last_answer_at': None}
+
+# Aggregates computing the counters from answers
+TOTALS = {
+    'answer_count': Count('id'),
+    'liked_count': Count('id', filter=Q(liked=True)),
+    'respondent_count': Count('student_id', distinct=True),
+    'last_answer_at': Max('created_at'),
+}
+
+# For each counters model: the model its rows belong to, and the answer field grouping answers by row
+SCOPES = {
+    QuestionStats: (Question, 'question_id'),
+    ClassStats: (Class, 'question__class_related_id'),
+}
+
+# Latest answer time of a row, recomputed after deletions (question rows are updated first)
+LATEST_ANSWER = {
+    QuestionStats: Answer.objects.filter(question_id=OuterRef('pk')).order_by('-created_at').values('created_at')[:1],
+    ClassStats: QuestionStats.objects.filter(
+        question__class_related_id=OuterRef('pk'), last_answer_at__isnull=False
+    ).order_by('-last_answer_at').values('last_answer_at')[:1],
+}
+
+
+def answer_change(answer, answers, liked):
+    """
+    A change to the counters by one answer instance: `answers` is 1 for a
+    new answer, -1 for a deleted one and 0 for a like toggle; `liked` is the
+    change in liked answers.
+    """
+    return {
+        'question_id': answer.question_id,
+        'class_id': answer.question.class_related_id,
+        'student_id': answer.student_id,
+        'answers': answers,
+        'liked': liked,
+        'created_at': answer.created_at,
+    }
+
+
+def row_change(row, answers, liked):
+    """answer_change for an answer row from bulk_answer_targets."""
+    return {
+        'question_id': row['question_id'],
+        'class_id': row['question__class_related_id'],
+        'student_id': row['student_id'],
+        'answers': answers,
+        'liked': liked,
+        'created_at': None,
+    }
+
+
+def per_row(values):
+    """Expression picking each row's value out of a {pk: value} mapping."""
+    return Case(*[When(pk=pk, then=Value(value)) for pk, value in values.items()], default=Value(0), output_field=IntegerField())
+
+
+def count_respondents(changes, questions, classes):
+    """
+    Add respondent deltas to the question and class deltas: +1 where a
+    student's first answer was added, -1 where their last one was removed.
+    Reads the answers of the students involved, after the write.
+    
+    The students' rows are locked first, so transactions writing answers of
+    the same student count them one after the other: otherwise two first
+    answers, each not seeing the other's uncommitted row, would both count
+    the student.
+    """
+    moved = [change for change in changes if change['answers']]
+    if not moved:
+        return
+    
+    student_ids = sorted({change['student_id'] for change in moved})
+    # In id order, so transactions locking several students cannot deadlock
+    list(Student.objects.select_for_update().filter(id__in=student_ids).order_by('id').values_list('id', flat=True))
+    
+    remaining = Counter()
+    rows = (
+        Answer.objects.filter(student_id__in=student_ids)
+        .values('student_id', 'question_id', 'question__class_related_id')
+        .annotate(answers=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        remaining['question', row['student_id'], row['question_id']] += row['answers']
+        remaining['class', row['student_id'], row['question__class_related_id']] += row['answers']
+    
+    added = Counter()
+    for change in moved:
+        added['question', change['student_id'], change['question_id']] += change['answers']
+        added['class', change['student_id'], change['class_id']] += change['answers']
+    for (scope, student_id, pk), count in added.items():
+        deltas = questions if scope == 'question' else classes
+        if count > 0 and remaining[scope, student_id, pk] == count:
+            deltas[pk]['respondent_count'] += 1
+        elif count < 0 and remaining[scope, student_id, pk] == 0:
+            deltas[pk]['respondent_count'] -= 1
+
+
+def create_missing_rows(model, pks):
+    """Create the rows of `pks` that do not exist yet (for existing owners), computed from the answers."""
+    owner, group = SCOPES[model]
+    missing = set(owner.objects.filter(pk__in=pks, stats__isnull=True).values_list('pk', flat=True))
+    if not missing:
+        return
+    totals = {
+        row.pop(group): row
+        for row in Answer.objects.filter(**{f'{group}__in': missing}).values(group).annotate(**TOTALS).order_by()
+    }
+    model.objects.bulk_create(
+        [model(pk=pk, **totals.get(pk, EMPTY)) for pk in missing], ignore_conflicts=True
+    )
+
+
+def update_counters(model, deltas, latest, stale, create_missing):
+    """
+    Add `deltas` ({pk: Counter}) to the counters of `model` rows in one
+    UPDATE, moving last_answer_at forward to `latest` ({pk: time}) and
+    recomputing it for the `stale` pks.
+    """
+    updates = {}
+    for field in COUNTERS:
+        moved = {pk: delta[field] for pk, delta in deltas.items() if delta[field]}
+        if moved:
+            updates[field] = F(field) + per_row(moved)
+    whens = [
+        When(pk=pk, then=Greatest(Coalesce('last_answer_at', Value(time)), Value(time)))
+        for pk, time in latest.items()
+    ]
+    if stale:
+        whens.append(When(pk__in=stale, then=Subquery(LATEST_ANSWER[model])))
+    if whens:
+        updates['last_answer_at'] = Case(*whens, default=F('last_answer_at'))
+    if not updates:
+        return
+    
+    updated = model.objects.filter(pk__in=deltas).update(**updates)
+    # Deletions leave missing rows alone: their question or class may be being deleted
+    if updated < len(deltas) and create_missing:
+        create_missing_rows(model, set(deltas))
+
+
+def move_counters(changes):
+    """
+    Apply answer changes (see answer_change) to the question and class
+    counters, in a fixed number of queries. Call after the answers have
+    been written, inside the same transaction (which count_respondents
+    locks the students of).
+    """
+    changes = [change for change in changes if change['answers'] or change['liked']]
+    if not changes:
+        return
+    
+    questions, classes = defaultdict(Counter), defaultdict(Counter)
+    latest = {QuestionStats: {}, ClassStats: {}}
+    stale = {QuestionStats: set(), ClassStats: set()}
+    for change in changes:
+        for model, deltas, pk in ((QuestionStats, questions, change['question_id']), (ClassStats, classes, change['class_id'])):
+            deltas[pk]['answer_count'] += change['answers']
+            deltas[pk]['liked_count'] += change['liked']
+            if change['answers'] > 0:
+                latest[model][pk] = max(latest[model].get(pk, change['created_at']), change['created_at'])
+            elif change['answers'] < 0:
+                stale[model].add(pk)
+    count_respondents(changes, questions, classes)
+    
+    create_missing = all(change['answers'] >= 0 for change in changes)
+    update_counters(QuestionStats, questions, latest[QuestionStats], stale[QuestionStats], create_missing)
+    update_counters(ClassStats, classes, latest[ClassStats], stale[ClassStats], create_missing)
+
+
+def rebuild_stats(class_ids=None, dry_run=False):
+    """
+    Recompute the counters of every question and class (or those of
+    `class_ids`) from the answers and store the ones that differ, unless
+    `dry_run`. Returns the number of out-of-date rows per model name.
+    """
+    owners = {QuestionStats: Question.objects.all(), ClassStats: Class.objects.all()}
+    if class_ids is not None:
+        owners = {
+            QuestionStats: Question.objects.filter(class_related_id__in=class_ids),
+            ClassStats: Class.objects.filter(id__in=class_ids),
+        }
+    
+    out_of_date = {}
+    for model, rows in owners.items():
+        _, group = SCOPES[model]
+        totals = {
+            row.pop(group): row
+            for row in Answer.objects.filter(**{f'{group}__in': rows.values('pk')}).values(group).annotate(**TOTALS).order_by()
+        }
+        stored = {row.pop('pk'): row for row in model.objects.filter(pk__in=rows.values('pk')).values('pk', *FIELDS)}
+        changed = [
+            model(pk=pk, **totals.get(pk, EMPTY))
+            for pk in rows.values_list('pk', flat=True)
+            if stored.get(pk) != totals.get(pk, EMPTY)
+        ]
+        if changed and not dry_run:
+            model.objects.bulk_create(
+                changed, update_conflicts=True, unique_fields=[model._meta.pk.name], update_fields=list(FIELDS)
+            )
+        out_of_date[model.__name__] = len(changed)
+    return out_of_date
+
+
+def participation(counters, student_count):
+    """Public form of a counters row, with its participation rate among `student_count` students."""
+    return {
+        'answer_count': counters['answer_count'],
+        'liked_count': counters['liked_count'],
+        'respondent_count': counters['respondent_count'],
+        'participation_rate': round(counters['respondent_count'] / student_count, 4) if student_count else 0.0,
+        'last_answer_at': counters['last_answer_at'],
+    }
+
+
+def class_stats(class_obj):
+    """Participation statistics of a class and of each of its questions, read from the counters."""
+    student_count = Student.objects.filter(class_enrolled=class_obj).count()
+    counters = ClassStats.objects.filter(pk=class_obj.pk).values(*FIELDS).first() or EMPTY
+    questions = (
+        Question.objects.filter(class_related=class_obj)
+        .order_by('id')
+        .values('id', *(f'stats__{field}' for field in FIELDS))
+    )
+    
+    stats = {'class_id': class_obj.id, 'student_count': student_count}
+    stats.update(participation(counters, student_count))
+    stats['questions'] = [
+        {'question_id': row['id'], **participation(
+            {field: row[f'stats__{field}'] if row[f'stats__{field}'] is not None else EMPTY[field] for field in FIELDS},
+            student_count,
+        )}
+        for row in questions
+    ]
+    return stats
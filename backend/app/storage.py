@@ -0,0 +1,121 @@
+"""
+Content-addressed file storage for question and answer images.
+
+Files are named by the SHA-256 of their content under sharded
+subdirectories, e.g. ``answers/3f/a9/3fa9...c1.png``, so identical uploads
+resolve to one file. The shards are leading hex digits of the hash:
+MEDIA_SHARD_LEVELS directories of MEDIA_SHARD_WIDTH digits each, so every
+directory holds at most 16 ** MEDIA_SHARD_WIDTH entries however many files
+there are. Files stored under an earlier layout stay valid and are moved by
+``python manage.py reshard_media``. Reference counts live in MediaBlob (see
+``media.py``).
+"""
+import hashlib
+import os
+import re
+import shutil
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from .signed_urls import sign_media_name
+
+
+def shard_directories(sha256):
+    """The shard directories of a hash in the configured layout, e.g. ['3f', 'a9']."""
+    levels = getattr(settings, 'MEDIA_SHARD_LEVELS', 2)
+    width = getattr(settings, 'MEDIA_SHARD_WIDTH', 2)
+    return [sha256[level * width:(level + 1) * width] for level in range(levels)]
+
+
+def hashed_name(name, sha256):
+    """Content-addressed path for a file originally named `name`."""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, *shard_directories(sha256), f'{sha256}{extension}')
+
+
+# Any layout: the upload directory, hex shard directories and the hash
+HASHED_NAME_RE = re.compile(
+    r'^(?:(?P<directory>.*?)/)??(?P<shards>(?:[0-9a-f]{1,8}/)*)(?P<sha256>[0-9a-f]{64})(?P<extension>\.[a-z0-9]+)?$'
+)
+
+
+def parse_hashed_name(name):
+    """(upload directory, sha256) of a content-addressed name in any shard layout, or None."""
+    match = HASHED_NAME_RE.match(name)
+    if match is None or not match['sha256'].startswith(match['shards'].replace('/', '')):
+        return None
+    return match['directory'] or '', match['sha256']
+
+
+def is_hashed_name(name):
+    """Whether a stored name is already content-addressed."""
+    return parse_hashed_name(name) is not None
+
+
+def link_or_copy(source, destination):
+    """Hard-link a file to a new path, copying when linking is not possible."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def content_sha256(content):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that stores each distinct content once, behind signed URLs."""
+    
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        
+        name = hashed_name(name, content_sha256(content))
+        if self.exists(name):
+            # Marked as just written, so gc_media's grace period covers it until the new row commits
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                # Deleted in the meantime: store it again
+                pass
+        return super().save(name, content, max_length=max_length)
+    
+    def url(self, name):
+        return super().url(name) + self.url_query(name)
+    
+    def url_query(self, name):
+        """Query string of a file's URL: a signature granting read access for a while (see signed_urls.py)."""
+        return f'?signature={sign_media_name(name)}'
+    
+    def save_as(self, name, content):
+        """
+        Store `content` under exactly `name`, replacing any file there: for
+        derivatives, which are named after the content-addressed image.
+        """
+        if self.exists(name):
+            self.delete(name)
+        return super().save(name, content)
+
+
+_media_storage = None
+
+
+def media_storage():
+    """Storage used by Question.image and Answer.image."""
+    global _media_storage
+    if _media_storage is None:
+        _media_storage = ContentAddressedStorage()
+    return _media_storage
@@ -1,3 +1,2606 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from urllib.parse import parse_qs, urlsplit
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageChops
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import async_views, uploads, urls
+from .benchmarks import BenchmarkData, build_endpoints, compare_results, run_benchmarks
+from .authentication import remember_user, user_states
+from .caching import get_stats, reset_stats
+from .concurrency import run_concurrency, session_factory, student_urlconf
+from .cursors import decode_cursor, decode_keyset_cursor, encode_cursor, encode_keyset_cursor
+from .events import get_broker, question_channel, student_channel
+from .exports import CRC_CACHE_TIMEOUT
+from .images import DERIVATIVES, derivative_path
+from .imports import import_roster
+from .ingest import InvalidImage, check_image, ingest_options, normalize_image_data
+from .jobs import claim_jobs, run_job, schedule_image_processing
+from .media import media_files, referenced_names
+from .mosaics import MosaicLayout, compose, question_mosaic
+from .pagination import KeysetPagination
+from .models import (
+    Instructor, Class, Student, Question, Answer, AnswerTombstone, MediaBlob, ClassStats, QuestionStats, ImageStatus,
+    ImageJob, UploadSession,
+)
+from .projections import AnswerProjection, ClassProjection, QuestionProjection, StudentProjection
+from .stats import rebuild_stats
+from .storage import hashed_name, media_storage, parse_hashed_name
+from .serializers import AnswerSerializer
+from .uploads import ChunkTooLarge, create_session_file, write_chunk
+from .views import BULK_DELETE_BATCH_SIZE, CustomTokenObtainPairSerializer
+
+# Every budget is checked against datasets of these sizes; the query count
+# of a route must not grow with the number of rows it reads.
+ROW_COUNTS = (1, 10, 1000)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_bytes(rows):
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), (rows % 256, 0, 0)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def image_upload(rows):
+    return SimpleUploadedFile('answer.png', image_bytes(rows), content_type='image/png')
+
+
+class Dataset:
+    """
+    One instructor with a class of `rows` students and `rows` questions.
+    The first question has an answer from every student, and the first
+    student (linked to a student login) has answered every question.
+    """
+    
+    def __init__(self, rows):
+        self.rows = rows
+        self.instructor = Instructor.objects.create_user(
+            username=f'instructor{rows}', email=f'instructor{rows}@example.com',
+            name=f'Instructor {rows}', password='password123'
+        )
+        self.student_user = Instructor.objects.create_user(
+            username=f'student{rows}', email=f'student{rows}@example.com',
+            name=f'Student {rows}', password='password123'
+        )
+        self.class_obj = Class.objects.create(class_name=f'Class {rows}', instructor=self.instructor)
+        self.students = Student.objects.bulk_create([
+            Student(name=f'Student {i}', class_enrolled=self.class_obj, user=self.student_user if i == 0 else None)
+            for i in range(rows)
+        ])
+        self.questions = Question.objects.bulk_create([
+            Question(question_text=f'Question {i} ' + 'x' * 60, class_related=self.class_obj)
+            for i in range(rows)
+        ])
+        derivatives = {
+            name: {'path': f'answers/derivatives/answer.png.{name}.jpg', 'width': 8, 'height': 8}
+            for name in DERIVATIVES
+        }
+        pairs = [(student, self.questions[0]) for student in self.students]
+        pairs += [(self.students[0], question) for question in self.questions[1:]]
+        self.answers = Answer.objects.bulk_create([
+            Answer(student=student, question=question, image=f'answers/{rows}-{i}.png', image_derivatives=derivatives)
+            for i, (student, question) in enumerate(pairs)
+        ])
+        MediaBlob.objects.bulk_create([MediaBlob(name=answer.image.name, ref_count=1) for answer in self.answers])
+        rebuild_stats(class_ids=[self.class_obj.id])
+        self.question = self.questions[0]
+        self.answer = self.answers[0]
+        self.student = self.students[0]
+        self.tokens = {
+            user.pk: CustomTokenObtainPairSerializer.get_token(user)
+            for user in (self.instructor, self.student_user)
+        }
+
+
+def asgi_get(url, **kwargs):
+    """GET `url` through the ASGI handler, as event streams need."""
+    return async_to_sync(AsyncClient().get)(url, **kwargs)
+
+
+def recent_cursor():
+    """A delta cursor from a minute ago, well within ANSWER_TOMBSTONE_RETENTION."""
+    return encode_cursor(timezone.now() - timedelta(minutes=1))
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHUNKED_UPLOAD_DIR=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE)
+class QueryBudgetTests(TestCase):
+    """
+    Fixed query budgets for every route in app/urls.py, asserted at 1, 10
+    and 1000 rows so N+1 queries show up as failures.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.datasets = [Dataset(rows) for rows in ROW_COUNTS]
+    
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    
+    def setUp(self):
+        # Budgets are for cold reads; read cache hits are covered by ReadCacheTests
+        cache.clear()
+        # but for accounts already checked, as after logging in
+        for data in self.datasets:
+            remember_user(data.instructor)
+            remember_user(data.student_user)
+    
+    def client_for(self, user):
+        # Tokens are minted in setUpTestData so their claim lookups stay
+        # outside the measured requests.
+        client = APIClient()
+        token = self.token_for(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+    
+    def token_for(self, user):
+        for data in self.datasets:
+            if user.pk in data.tokens:
+                return data.tokens[user.pk]
+        raise KeyError(user.pk)
+    
+    def assertQueryBudget(self, budget, make_request, status=None):
+        """
+        Run make_request(dataset) on every dataset within `budget` queries,
+        or budget(dataset) queries when it is a function.
+        """
+        for data in self.datasets:
+            with self.subTest(rows=data.rows):
+                with self.assertNumQueries(budget(data) if callable(budget) else budget):
+                    response = make_request(data)
+                if status is not None:
+                    self.assertEqual(response.status_code, status, getattr(response, 'data', None))
+                else:
+                    self.assertLess(response.status_code, 300, getattr(response, 'data', None))
+    
+    def instructor_get(self, url):
+        return lambda data: self.client_for(data.instructor).get(url(data))
+    
+    def student_get(self, url):
+        return lambda data: self.client_for(data.student_user).get(url(data))
+    
+    # Public and auth routes
+    
+    def test_health_check(self):
+        self.assertQueryBudget(0, lambda data: APIClient().get(reverse('health_check')))
+    
+    def test_login(self):
+        self.assertQueryBudget(3, lambda data: APIClient().post(
+            reverse('token_obtain_pair'),
+            {'username': data.instructor.username, 'password': 'password123'},
+            format='json'
+        ))
+    
+    def test_token_refresh(self):
+        def refresh(data):
+            token = self.token_for(data.instructor)
+            return APIClient().post(reverse('token_refresh'), {'refresh': str(token)}, format='json')
+        self.assertQueryBudget(0, refresh)
+    
+    # Student routes
+    
+    def test_student_classes(self):
+        self.assertQueryBudget(2, self.student_get(lambda data: reverse('student_classes')))
+    
+    def test_student_questions(self):
+        self.assertQueryBudget(2, self.student_get(
+            lambda data: f"{reverse('student_questions')}?class_id={data.class_obj.id}"
+        ))
+    
+    def test_student_answers(self):
+        self.assertQueryBudget(2, self.student_get(
+            lambda data: f"{reverse('student_answers')}?class_id={data.class_obj.id}"
+        ))
+    
+    def test_student_answers_delta(self):
+        self.assertQueryBudget(3, self.student_get(
+            lambda data: f"{reverse('student_answers')}?class_id={data.class_obj.id}&since={recent_cursor()}"
+        ))
+    
+    def test_student_answers_page(self):
+        self.assertQueryBudget(2, self.student_get(
+            lambda data: f"{reverse('student_answers')}?class_id={data.class_obj.id}&page_size=50"
+        ))
+    
+    def test_student_submit_answer(self):
+        self.assertQueryBudget(14, lambda data: self.client_for(data.student_user).post(
+            reverse('student_submit_answer'),
+            {'question_id': data.question.id, 'image': image_upload(data.rows)},
+            format='multipart'
+        ), status=202)
+    
+    def test_student_answer_events_rejects_anonymous(self):
+        self.assertQueryBudget(0, lambda data: asgi_get(reverse('student_answer_events')), status=401)
+    
+    def test_answer_events_rejects_foreign_question(self):
+        def request(data):
+            other = self.datasets[0] if data is not self.datasets[0] else self.datasets[1]
+            token = self.token_for(data.instructor).access_token
+            return asgi_get(
+                f"{reverse('answer_events')}?question_id={other.question.id}", headers={'Authorization': f'Bearer {token}'}
+            )
+        self.assertQueryBudget(1, request, status=404)
+    
+    def test_answer_events_are_refused_under_wsgi(self):
+        # So clients poll instead of waiting on a stream that would never start
+        self.assertQueryBudget(0, self.instructor_get(
+            lambda data: f"{reverse('answer_events')}?question_id={data.question.id}"
+        ), status=501)
+    
+    # Chunked uploads
+    
+    def test_upload_session_lifecycle(self):
+        def upload(data):
+            content = image_bytes(data.rows)
+            client = self.client_for(data.student_user)
+            session = client.post(reverse('upload_sessions'), {'filename': 'a.png', 'size': len(content)}, format='json').data
+            detail = reverse('upload_session_detail', args=[session['id']])
+            client.put(f'{detail}?offset=0', content, content_type='application/octet-stream')
+            client.get(detail)
+            return client.post(
+                reverse('finalize_upload_session', args=[session['id']]),
+                {'target': 'answer', 'question_id': data.question.id},
+                format='json'
+            )
+        self.assertQueryBudget(20, upload, status=202)
+    
+    # Instructor routes
+    
+    def test_instructor_class_answers(self):
+        self.assertQueryBudget(2, self.instructor_get(
+            lambda data: f"{reverse('instructor_class_answers')}?class_id={data.class_obj.id}"
+        ))
+    
+    def test_instructor_class_answers_page(self):
+        self.assertQueryBudget(2, self.instructor_get(
+            lambda data: f"{reverse('instructor_class_answers')}?class_id={data.class_obj.id}&page_size=50"
+        ))
+    
+    def test_export_answers(self):
+        def export(data):
+            response = self.client_for(data.instructor).get(f"{reverse('export_answers')}?class_id={data.class_obj.id}")
+            b''.join(response.streaming_content)
+            return response
+        self.assertQueryBudget(2, export)
+    
+    def test_class_list(self):
+        self.assertQueryBudget(2, self.instructor_get(lambda data: reverse('class-list')))
+    
+    def test_class_detail(self):
+        self.assertQueryBudget(1, self.instructor_get(lambda data: reverse('class-detail', args=[data.class_obj.id])))
+    
+    def test_class_create(self):
+        self.assertQueryBudget(1, lambda data: self.client_for(data.instructor).post(
+            reverse('class-list'), {'class_name': 'New class'}, format='json'
+        ))
+    
+    def test_class_stats(self):
+        self.assertQueryBudget(4, self.instructor_get(lambda data: reverse('class-stats', args=[data.class_obj.id])))
+    
+    def test_class_roster_import(self):
+        def upload(data):
+            roster = 'roster_id,name,phone\n' + ''.join(f'R{i},Student {i},555-{i:04d}\n' for i in range(50))
+            return self.client_for(data.instructor).post(
+                reverse('class-roster', args=[data.class_obj.id]),
+                {'file': SimpleUploadedFile('roster.csv', roster.encode(), content_type='text/csv')},
+                format='multipart'
+            )
+        self.assertQueryBudget(5, upload)
+    
+    def test_student_list(self):
+        self.assertQueryBudget(2, self.instructor_get(lambda data: reverse('student-list')))
+    
+    def test_student_list_for_class(self):
+        self.assertQueryBudget(2, self.instructor_get(
+            lambda data: f"{reverse('student-list')}?class_id={data.class_obj.id}"
+        ))
+    
+    def test_student_detail(self):
+        self.assertQueryBudget(1, self.instructor_get(lambda data: reverse('student-detail', args=[data.student.id])))
+    
+    def test_question_list(self):
+        self.assertQueryBudget(1, self.instructor_get(
+            lambda data: f"{reverse('question-list')}?class_id={data.class_obj.id}"
+        ))
+    
+    def test_question_detail(self):
+        self.assertQueryBudget(1, self.instructor_get(lambda data: reverse('question-detail', args=[data.question.id])))
+    
+    def test_question_mosaic(self):
+        self.assertQueryBudget(2, self.instructor_get(lambda data: reverse('question-mosaic', args=[data.question.id])))
+    
+    def test_question_create(self):
+        self.assertQueryBudget(9, lambda data: self.client_for(data.instructor).post(
+            reverse('question-list'),
+            {'class_id': data.class_obj.id, 'question_text': 'New question', 'image': image_upload(data.rows)},
+            format='multipart'
+        ), status=202)
+    
+    def test_question_import(self):
+        self.assertQueryBudget(8, lambda data: self.client_for(data.instructor).post(
+            reverse('question-import-deck'),
+            {'class_id': data.class_obj.id, 'images': [image_upload(data.rows), image_upload(data.rows + 1)]},
+            format='multipart'
+        ), status=202)
+    
+    def test_answer_list(self):
+        self.assertQueryBudget(2, self.instructor_get(
+            lambda data: f"{reverse('answer-list')}?question_id={data.question.id}"
+        ))
+    
+    def test_answer_list_delta(self):
+        self.assertQueryBudget(3, self.instructor_get(
+            lambda data: f"{reverse('answer-list')}?question_id={data.question.id}&since={recent_cursor()}"
+        ))
+    
+    def test_answer_detail(self):
+        self.assertQueryBudget(1, self.instructor_get(lambda data: reverse('answer-detail', args=[data.answer.id])))
+    
+    def test_answer_like(self):
+        self.assertQueryBudget(5, lambda data: self.client_for(data.instructor).patch(
+            reverse('answer-detail', args=[data.answer.id]), {'liked': True}, format='json'
+        ))
+    
+    def test_answer_delete(self):
+        self.assertQueryBudget(10, lambda data: self.client_for(data.instructor).delete(
+            reverse('answer-detail', args=[data.answers[-1].id])
+        ))
+    
+    def test_answer_bulk_like(self):
+        self.assertQueryBudget(7, lambda data: self.client_for(data.instructor).post(
+            reverse('answer-bulk'), {'action': 'like', 'question_id': data.question.id}, format='json'
+        ))
+    
+    def test_answer_bulk_delete(self):
+        def budget(data):
+            # Per batch the rows for the delete signals, their image jobs, the delete and the tombstones
+            return 11 + 4 * math.ceil(data.rows / BULK_DELETE_BATCH_SIZE)
+        
+        self.assertQueryBudget(budget, lambda data: self.client_for(data.instructor).post(
+            reverse('answer-bulk'), {'action': 'delete', 'ids': [answer.id for answer in data.answers[:data.rows]]}, format='json'
+        ))
+
+
+@override_settings(QUERY_COUNT_HEADER=True, CACHES=LOCMEM_CACHE)
+class QueryCountMiddlewareTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_reports_query_count_and_time(self):
+        instructor = Instructor.objects.create_user(
+            username='instructor', email='instructor@example.com', name='Instructor', password='password123'
+        )
+        client = APIClient()
+        token = CustomTokenObtainPairSerializer.get_token(instructor).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        
+        response = client.get(reverse('class-list'))
+        
+        self.assertEqual(response['X-DB-Query-Count'], '2')
+        self.assertIn('X-DB-Query-Time-Ms', response)
+        self.assertTrue(response['Server-Timing'].startswith('db;dur='))
+    
+    def test_counts_the_queries_of_async_views(self):
+        data = Dataset(1)
+        headers = {'Authorization': f'Bearer {data.tokens[data.student_user.pk].access_token}'}
+        url = f"{reverse('student_answers')}?class_id={data.class_obj.id}"
+        
+        with override_settings(ROOT_URLCONF=student_urlconf(async_views)), CaptureQueriesContext(connection) as queries:
+            response = async_to_sync(AsyncClient().get)(url, headers=headers)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(queries), 0)
+        self.assertEqual(response['X-DB-Query-Count'], str(len(queries)))
+    
+    @override_settings(QUERY_COUNT_HEADER=False)
+    def test_disabled_by_default(self):
+        response = APIClient().get(reverse('health_check'))
+        
+        self.assertNotIn('X-DB-Query-Count', response)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class KeysetPaginationTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(5)
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+    
+    def pages(self, page_size):
+        """Walk the first question's answers page by page; returns the pages' answer ids."""
+        pages, after = [], ''
+        while True:
+            response = self.client.get(
+                reverse('answer-list'), {'question_id': self.data.question.id, 'page_size': page_size, 'after': after}
+            )
+            self.assertEqual(response.status_code, 200, response.data)
+            pages.append([answer['id'] for answer in response.data['results']])
+            after = response.data['next']
+            if after is None:
+                return pages
+    
+    def test_cursor_round_trips(self):
+        created_at = timezone.now()
+        cursor = encode_keyset_cursor(created_at, 42)
+        
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+$')
+        self.assertEqual(decode_keyset_cursor(cursor), (created_at, 42))
+        self.assertIsNone(decode_keyset_cursor(''))
+    
+    def test_invalid_cursors_are_refused(self):
+        for cursor in ('!', encode_cursor(timezone.now()), 'bm90Om51bWJlcnM'):
+            with self.assertRaises(ValidationError):
+                decode_keyset_cursor(cursor)
+        response = self.client.get(reverse('answer-list'), {'question_id': self.data.question.id, 'page_size': 2, 'after': '!'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_pages_follow_created_at_then_id(self):
+        answers = sorted(self.data.answers[:5], key=lambda answer: answer.id)
+        now = timezone.now()
+        for n, answer in enumerate(answers):
+            Answer.objects.filter(pk=answer.pk).update(created_at=now - timedelta(minutes=n))
+        
+        self.assertEqual(self.pages(2), [[answers[0].id, answers[1].id], [answers[2].id, answers[3].id], [answers[4].id]])
+    
+    def test_equal_created_at_is_broken_by_id(self):
+        # Rows from one bulk insert often share a timestamp; none may be skipped or repeated at a page boundary
+        Answer.objects.filter(question=self.data.question).update(created_at=timezone.now())
+        ids = sorted((answer.id for answer in self.data.answers[:5]), reverse=True)
+        
+        for page_size in (1, 2, 4):
+            pages = self.pages(page_size)
+            self.assertEqual([answer_id for page in pages for answer_id in page], ids)
+            self.assertTrue(all(len(page) <= page_size for page in pages))
+
+
+    def index_scan(self, after):
+        """The part of a page query's plan that scans the answers, checked to be a range scan of their index."""
+        answers = AnswerProjection(Request(APIRequestFactory().get('/'))).queryset(
+            Answer.objects.filter(question=self.data.question).select_related('student', 'question')
+        )
+        queryset = KeysetPagination().page_queryset(answers, after)[:2]
+        if connection.vendor == 'sqlite':
+            return next(line for line in queryset.explain().splitlines() if 'app_answer ' in line).split(' ', 3)[3]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Tables this small would otherwise be read sequentially
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            return next(line for line in plan.splitlines() if 'Index Cond' in line and 'question_id' in line).strip()
+        self.skipTest(f'No plan check for {connection.vendor}')
+    
+    def test_deep_pages_start_the_index_scan_at_the_cursor(self):
+        first = self.index_scan(None)
+        deep = self.index_scan((timezone.now(), self.data.answer.id))
+        
+        self.assertNotIn('created_at', first)
+        self.assertIn('created_at', deep)
+        # The same index, entered at the cursor instead of read from its head
+        self.assertEqual(first.split('(')[0], deep.split('(')[0])
+
+
+@override_settings(ANSWER_DELTA_OVERLAP=30, ANSWER_TOMBSTONE_RETENTION=3600, CACHES=LOCMEM_CACHE)
+class AnswerDeltaTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(3)
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+        # Older than the overlap window of any poll in a test
+        Answer.objects.update(updated_at=timezone.now() - timedelta(minutes=5))
+    
+    def poll(self, cursor=''):
+        response = self.client.get(reverse('answer-list'), {'question_id': self.data.question.id, 'since': cursor})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+    
+    def test_polls_return_only_changes(self):
+        first = self.poll()
+        self.assertEqual(len(first['results']), 3)
+        self.assertEqual((first['deleted'], first['reset']), ([], False))
+        self.assertEqual(self.poll(first['cursor'])['results'], [])
+        
+        liked, deleted = self.data.answers[1], self.data.answers[2]
+        Answer.objects.filter(pk=liked.pk).update(liked=True, updated_at=timezone.now())
+        Answer.objects.get(pk=deleted.pk).delete()
+        delta = self.poll(first['cursor'])
+        
+        self.assertEqual([answer['id'] for answer in delta['results']], [liked.id])
+        self.assertEqual(delta['deleted'], [deleted.id])
+    
+    def test_rows_committed_after_the_poll_are_read_again(self):
+        cursor = self.poll()['cursor']
+        # A transaction that took its timestamp before the poll but committed after it
+        late = self.data.answers[1]
+        Answer.objects.filter(pk=late.pk).update(liked=True, updated_at=decode_cursor(cursor) - timedelta(seconds=10))
+        
+        delta = self.poll(cursor)
+        
+        self.assertEqual([(answer['id'], answer['liked']) for answer in delta['results']], [(late.id, True)])
+    
+    def test_cursor_older_than_the_tombstones_resyncs(self):
+        delta = self.poll(encode_cursor(timezone.now() - timedelta(hours=2)))
+        
+        self.assertTrue(delta['reset'])
+        self.assertEqual(len(delta['results']), 3)
+    
+    def test_fields_narrow_the_delta(self):
+        response = self.client.get(reverse('answer-list'), {
+            'question_id': self.data.question.id, 'since': '', 'fields': 'id,liked',
+        })
+        
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual({tuple(answer) for answer in response.data['results']}, {('id', 'liked')})
+        response = self.client.get(reverse('answer-list'), {'question_id': self.data.question.id, 'since': '', 'fields': 'nope'})
+        self.assertEqual(response.status_code, 400)
+    
+    @override_settings(IMAGE_JOBS_ASYNC=True)
+    def test_missing_derivatives_are_queued_together(self):
+        Answer.objects.update(image_derivatives={})
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.poll()
+        
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "app_imagejob"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ImageJob.objects.count(), 3)
+    
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('answer-list'), {'question_id': self.data.question.id, 'since': '!'})
+        
+        self.assertEqual(response.status_code, 400)
+    
+    def test_prune_tombstones(self):
+        for answer in self.data.answers[:2]:
+            Answer.objects.get(pk=answer.pk).delete()
+        AnswerTombstone.objects.filter(answer_id=self.data.answers[0].id).update(
+            deleted_at=timezone.now() - timedelta(hours=2)
+        )
+        
+        call_command('prune_tombstones', stdout=StringIO())
+        
+        self.assertEqual(list(AnswerTombstone.objects.values_list('answer_id', flat=True)), [self.data.answers[1].id])
+    
+    def test_tombstones_need_no_query_per_answer(self):
+        question = Question.objects.get(pk=self.data.question.pk)
+        with CaptureQueriesContext(connection) as queries:
+            question.delete()
+        
+        lookups = [query['sql'] for query in queries if query['sql'].startswith('SELECT "app_question"')]
+        self.assertEqual(lookups, [])
+        self.assertEqual(
+            set(AnswerTombstone.objects.values_list('answer_id', 'class_id')),
+            {(answer.id, self.data.class_obj.id) for answer in self.data.answers[:3]},
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BulkAnswerTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(3)
+        cls.other = Dataset(2)
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+    
+    def bulk(self, **body):
+        response = self.client.post(reverse('answer-bulk'), body, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [(result['id'], result['status']) for result in response.data['results']]
+    
+    def liked(self, answers):
+        return list(Answer.objects.filter(pk__in=[answer.pk for answer in answers]).order_by('pk').values_list('liked', flat=True))
+    
+    def test_like_and_unlike_report_each_answer(self):
+        first, second = self.data.answers[:2]
+        Answer.objects.filter(pk=first.pk).update(liked=True)
+        
+        self.assertEqual(self.bulk(action='like', ids=[first.id, second.id, 0]), [
+            (first.id, 'unchanged'), (second.id, 'liked'), (0, 'not_found'),
+        ])
+        self.assertEqual(self.liked([first, second]), [True, True])
+        
+        self.assertEqual(self.bulk(action='unlike', ids=[second.id]), [(second.id, 'unliked')])
+        self.assertEqual(self.liked([first, second]), [True, False])
+    
+    def test_delete_reports_each_answer(self):
+        answer = self.data.answers[0]
+        
+        self.assertEqual(self.bulk(action='delete', ids=[answer.id, 0]), [(answer.id, 'deleted'), (0, 'not_found')])
+        self.assertFalse(Answer.objects.filter(pk=answer.pk).exists())
+        self.assertTrue(AnswerTombstone.objects.filter(answer_id=answer.id).exists())
+    
+    def test_answers_deleted_meanwhile_are_not_recorded_again(self):
+        answers = self.data.answers[:3]
+        Answer.objects.filter(pk__in=[answer.pk for answer in answers]).update(image='answers/shared.png')
+        MediaBlob.objects.create(name='answers/shared.png', ref_count=3)
+        job = ImageJob.objects.create(answer=answers[1])
+        self.assertEqual(self.client.delete(reverse('answer-detail', args=[answers[0].id])).status_code, 204)
+        
+        self.assertEqual(self.bulk(action='delete', ids=[answers[0].id, answers[1].id]), [
+            (answers[0].id, 'not_found'), (answers[1].id, 'deleted'),
+        ])
+        
+        self.assertEqual(MediaBlob.objects.get(name='answers/shared.png').ref_count, 1)
+        self.assertEqual(AnswerTombstone.objects.filter(answer_id__in=[answers[0].id, answers[1].id]).count(), 2)
+        self.assertEqual(QuestionStats.objects.get(question=self.data.question).answer_count, 1)
+        self.assertFalse(ImageJob.objects.filter(pk=job.pk).exists())
+    
+    def test_question_selector_is_capped(self):
+        with mock.patch('app.views.MAX_BULK_ANSWER_IDS', 2):
+            response = self.client.post(
+                reverse('answer-bulk'), {'action': 'delete', 'question_id': self.data.question.id}, format='json'
+            )
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Answer.objects.filter(question=self.data.question).count(), 3)
+    
+    def test_other_instructors_answers_are_not_found(self):
+        foreign = self.other.answers[0]
+        
+        for action in ('like', 'delete'):
+            self.assertEqual(self.bulk(action=action, ids=[foreign.id]), [(foreign.id, 'not_found')])
+        self.assertEqual(self.liked([foreign]), [False])
+        
+        self.assertEqual(self.bulk(action='like', question_id=self.other.question.id), [])
+        self.assertEqual(self.liked([foreign]), [False])
+    
+    def test_question_and_liked_filter(self):
+        answers = self.data.answers[:3]
+        Answer.objects.filter(pk=answers[0].pk).update(liked=True)
+        
+        results = self.bulk(action='delete', question_id=self.data.question.id, liked=False)
+        
+        self.assertEqual(sorted(results), [(answers[1].id, 'deleted'), (answers[2].id, 'deleted')])
+        self.assertEqual(list(Answer.objects.filter(question=self.data.question).values_list('id', flat=True)), [answers[0].id])
+    
+    def test_invalid_targets_are_refused(self):
+        for body in (
+            {'action': 'like', 'question_id': 'abc'},
+            {'action': 'like', 'question_id': True},
+            {'action': 'like', 'ids': ['1']},
+            {'action': 'like', 'question_id': self.data.question.id, 'liked': 'yes'},
+            {'action': 'like'},
+            {'action': 'star', 'ids': []},
+        ):
+            with self.subTest(body=body):
+                response = self.client.post(reverse('answer-bulk'), body, format='json')
+                self.assertEqual(response.status_code, 400)
+    
+    def test_likes_publish_the_serialized_answer(self):
+        answer = Answer.objects.select_related('student', 'question').get(pk=self.data.answer.pk)
+        
+        with mock.patch('app.views.publish_answer_event') as publish, self.captureOnCommitCallbacks(execute=True):
+            self.bulk(action='like', ids=[answer.id])
+        
+        answer.liked = True
+        request = Request(APIRequestFactory().post(reverse('answer-bulk')))
+        (event, published, payload), _ = publish.call_args
+        self.assertEqual((event, published.id, published.question_id), ('answer.updated', answer.id, answer.question_id))
+        self.assertEqual(payload, AnswerSerializer(answer, context={'request': request}).data)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, UPLOAD_SESSION_EXPIRY=3600, CACHES=LOCMEM_CACHE)
+class UploadSessionTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(1)
+    
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_dir, ignore_errors=True)
+        self.enterContext(self.settings(CHUNKED_UPLOAD_DIR=self.upload_dir))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.student_user.pk].access_token}')
+        self.content = image_bytes(1)
+    
+    def start(self, **fields):
+        response = self.client.post(
+            reverse('upload_sessions'), {'filename': 'a.png', 'size': len(self.content), **fields}, format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+    
+    def put(self, session_id, offset, chunk):
+        return self.client.put(
+            f"{reverse('upload_session_detail', args=[session_id])}?offset={offset}",
+            chunk, content_type='application/octet-stream'
+        )
+    
+    def finalize(self, session_id):
+        return self.client.post(
+            reverse('finalize_upload_session', args=[session_id]),
+            {'target': 'answer', 'question_id': self.data.questions[0].id}, format='json'
+        )
+    
+    def expire(self, session_id):
+        UploadSession.objects.filter(id=session_id).update(updated_at=timezone.now() - timedelta(hours=2))
+        stale = time.time() - 2 * 3600
+        os.utime(os.path.join(self.upload_dir, f'{session_id}.part'), (stale, stale))
+    
+    def test_interrupted_upload_resumes_from_its_offset(self):
+        session_id = self.start()
+        half = len(self.content) // 2
+        self.assertEqual(self.put(session_id, 0, self.content[:half]).data['offset'], half)
+        
+        offset = self.client.get(reverse('upload_session_detail', args=[session_id])).data['offset']
+        self.assertEqual(offset, half)
+        self.assertEqual(self.put(session_id, offset, self.content[offset:]).data['offset'], len(self.content))
+        response = self.finalize(session_id)
+        
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertFalse(UploadSession.objects.filter(id=session_id).exists())
+        self.assertEqual(os.listdir(self.upload_dir), [])
+    
+    def test_chunk_at_the_wrong_offset_is_refused(self):
+        session_id = self.start()
+        self.put(session_id, 0, self.content[:10])
+        
+        for offset in (0, 20):
+            response = self.put(session_id, offset, self.content[offset:offset + 10])
+            self.assertEqual((response.status_code, response.data['offset']), (409, 10))
+        self.assertEqual(UploadSession.objects.get(id=session_id).received, 10)
+    
+    def test_chunks_past_the_declared_size_are_refused(self):
+        session_id = self.start()
+        
+        response = self.put(session_id, 0, self.content + b'x')
+        self.assertEqual((response.status_code, response.data['offset']), (413, 0))
+        self.put(session_id, 0, self.content[:-1])
+        response = self.put(session_id, len(self.content) - 1, b'xx')
+        self.assertEqual((response.status_code, response.data['offset']), (413, len(self.content) - 1))
+    
+    def test_stream_is_cut_off_at_the_declared_size(self):
+        # Without a Content-Length to check up front
+        session = UploadSession.objects.create(owner=self.data.student_user, filename='a.png', size=4)
+        create_session_file(session)
+        
+        with self.assertRaises(ChunkTooLarge):
+            write_chunk(session, 0, BytesIO(b'12345'))
+    
+    def test_sha256_mismatch_discards_the_upload(self):
+        session_id = self.start(sha256=hashlib.sha256(b'something else').hexdigest())
+        self.put(session_id, 0, self.content)
+        answers = Answer.objects.count()
+        
+        response = self.finalize(session_id)
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Answer.objects.count(), answers)
+        self.assertFalse(UploadSession.objects.filter(id=session_id).exists())
+        self.assertEqual(os.listdir(self.upload_dir), [])
+    
+    def test_matching_sha256_is_accepted(self):
+        session_id = self.start(sha256=hashlib.sha256(self.content).hexdigest())
+        self.put(session_id, 0, self.content)
+        
+        self.assertEqual(self.finalize(session_id).status_code, 202)
+    
+    def test_sha256_is_computed_as_chunks_arrive(self):
+        session_id = self.start(sha256=hashlib.sha256(self.content).hexdigest())
+        half = len(self.content) // 2
+        self.put(session_id, 0, self.content[:half])
+        # A rejected chunk leaves the digest at the session's offset
+        self.put(session_id, half, self.content[half:] + b'x')
+        self.put(session_id, half, self.content[half:])
+        
+        with mock.patch('app.uploads.file_sha256') as file_sha256:
+            self.assertEqual(self.finalize(session_id).status_code, 202)
+        file_sha256.assert_not_called()
+    
+    def test_sha256_of_chunks_written_by_another_process(self):
+        # Losing the digest after the first chunk has the next one hash the file so far, after the last the finalize
+        for chunks_before_loss in (1, 2):
+            with self.subTest(chunks_before_loss=chunks_before_loss):
+                session_id = self.start(sha256=hashlib.sha256(self.content).hexdigest())
+                half = len(self.content) // 2
+                for i, (offset, chunk) in enumerate([(0, self.content[:half]), (half, self.content[half:])], 1):
+                    self.put(session_id, offset, chunk)
+                    if i == chunks_before_loss:
+                        uploads._session_digests.clear()
+                
+                with mock.patch('app.uploads.file_sha256', wraps=uploads.file_sha256) as file_sha256:
+                    self.assertEqual(self.finalize(session_id).status_code, 202)
+                self.assertEqual(file_sha256.called, chunks_before_loss == 2)
+    
+    def test_expired_sessions_are_gone(self):
+        session_id = self.start()
+        self.put(session_id, 0, self.content[:10])
+        self.expire(session_id)
+        
+        self.assertEqual(self.client.get(reverse('upload_session_detail', args=[session_id])).status_code, 404)
+        self.assertEqual(self.put(session_id, 10, self.content[10:]).status_code, 404)
+        self.assertEqual(self.finalize(session_id).status_code, 404)
+    
+    def test_prune_upload_sessions(self):
+        expired, active = self.start(), self.start()
+        self.expire(expired)
+        # Left by a crash before its session row was saved
+        orphan = os.path.join(self.upload_dir, f'{uuid.uuid4()}.part')
+        open(orphan, 'wb').close()
+        os.utime(orphan, (0, 0))
+        
+        out = StringIO()
+        call_command('prune_upload_sessions', stdout=out)
+        
+        self.assertIn('Deleted 1 expired upload session(s) and 2 .part file(s)', out.getvalue())
+        self.assertEqual(list(UploadSession.objects.values_list('id', flat=True)), [uuid.UUID(active)])
+        self.assertEqual(os.listdir(self.upload_dir), [f'{active}.part'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE)
+class DeckImportTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(1)
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+    
+    def archive(self, files):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+        return SimpleUploadedFile('deck.zip', buffer.getvalue(), content_type='application/zip')
+    
+    def upload(self, **fields):
+        return self.client.post(
+            reverse('question-import-deck'), {'class_id': self.data.class_obj.id, **fields}, format='multipart'
+        )
+    
+    def imported(self, response):
+        """(question text, image content) of the imported questions, in the order of the returned ids."""
+        self.assertIn(response.status_code, (201, 202), response.data)
+        questions = Question.objects.in_bulk(response.data['ids'])
+        return [(questions[i].question_text, questions[i].image.read()) for i in response.data['ids']]
+    
+    def test_archive_slides_are_imported_in_natural_order(self):
+        slides = {f'slide{n}.png': image_bytes(n) for n in (10, 2, 1)}
+        
+        imported = self.imported(self.upload(archive=self.archive(slides)))
+        
+        self.assertEqual(imported, [
+            ('Slide 1', image_bytes(1)), ('Slide 2', image_bytes(2)), ('Slide 3', image_bytes(10)),
+        ])
+    
+    def test_manifest_as_a_list(self):
+        slides = {f'slide{n}.png': image_bytes(n) for n in (2, 1)}
+        slides['manifest.json'] = '["First", "Second"]'
+        
+        imported = self.imported(self.upload(archive=self.archive(slides)))
+        
+        self.assertEqual(imported, [('First', image_bytes(1)), ('Second', image_bytes(2))])
+        response = self.upload(archive=self.archive({'slide1.png': image_bytes(1)}), manifest='["One", "Two"]')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_manifest_as_an_object(self):
+        images = [SimpleUploadedFile(f'slide{n}.png', image_bytes(n), content_type='image/png') for n in (1, 2, 3)]
+        
+        imported = self.imported(self.upload(images=images, manifest='{"slide2.png": "Second"}'))
+        
+        self.assertEqual([text for text, _ in imported], ['Slide 1', 'Second', 'Slide 3'])
+    
+    def test_one_invalid_slide_rejects_the_deck(self):
+        slides = {'slide1.png': image_bytes(1), 'slide2.png': b'not an image', 'slide3.png': image_bytes(3)}
+        
+        response = self.upload(archive=self.archive(slides))
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([slide['filename'] for slide in response.data['slides']], ['slide2.png'])
+        self.assertEqual(Question.objects.count(), len(self.data.questions))
+    
+    @override_settings(IMAGE_JOBS_ASYNC=False)
+    def test_without_workers_slides_are_processed_after_commit(self):
+        images = [SimpleUploadedFile(f'slide{n}.png', image_bytes(n), content_type='image/png') for n in (1, 2)]
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.upload(images=images)
+        questions = Question.objects.filter(pk__in=response.data['ids'])
+        self.assertEqual(set(questions.values_list('status', flat=True)), {ImageStatus.PROCESSING})
+        
+        for callback in callbacks:
+            callback()
+        
+        self.assertEqual(set(questions.values_list('status', flat=True)), {ImageStatus.READY})
+        self.assertTrue(all(question.image_derivatives for question in questions))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RosterImportTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(1)
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+    
+    def upload(self, roster):
+        return self.client.post(
+            reverse('class-roster', args=[self.data.class_obj.id]),
+            {'file': SimpleUploadedFile('roster.csv', roster.encode(), content_type='text/csv')},
+            format='multipart'
+        )
+    
+    def roster(self):
+        return set(Student.objects.filter(class_enrolled=self.data.class_obj, roster_id__isnull=False).values_list(
+            'roster_id', 'name', 'phone'
+        ))
+    
+    def test_invalid_rows_are_reported_by_line(self):
+        response = self.upload(
+            'roster_id,name,phone\n'
+            'R1,Ann,555-0001\n'
+            ',No roster id,\n'
+            'R2,,\n'
+            '\n'
+            f"R3,Bob,{'5' * 21}\n"
+            'R4,Cy,\n'
+        )
+        
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, {'created': 2, 'updated': 0, 'failed': 3, 'errors': [
+            {'line': 3, 'error': 'roster_id is required'},
+            {'line': 4, 'error': 'name is required'},
+            {'line': 6, 'error': 'phone is too long'},
+        ]})
+        self.assertEqual(self.roster(), {('R1', 'Ann', '555-0001'), ('R4', 'Cy', None)})
+    
+    def test_reimport_upserts_by_roster_id(self):
+        self.upload('roster_id,name,phone\nR1,Ann,555-0001\nR2,Bob,555-0002\n')
+        ids = dict(Student.objects.filter(roster_id__isnull=False).values_list('roster_id', 'id'))
+        
+        # Without a phone column phones are kept; a repeated roster id keeps its last row
+        response = self.upload('Name,Roster_ID\nAnnie,R1\nCy,R3\nCyrus,R3\n')
+        
+        self.assertEqual(response.data, {'created': 1, 'updated': 1, 'failed': 0, 'errors': []})
+        self.assertEqual(self.roster(), {('R1', 'Annie', '555-0001'), ('R2', 'Bob', '555-0002'), ('R3', 'Cyrus', None)})
+        self.assertEqual(Student.objects.get(roster_id='R1').id, ids['R1'])
+    
+    def test_counts_add_up_across_batches(self):
+        with tempfile.TemporaryFile('w+', newline='') as lines:
+            lines.write('roster_id,name\n' + ''.join(f'R{i},Student {i}\n' for i in range(7)))
+            lines.seek(0)
+            self.assertEqual(import_roster(self.data.class_obj, lines, batch_size=3).as_dict(), {
+                'created': 7, 'updated': 0, 'failed': 0, 'errors': [],
+            })
+            lines.seek(0)
+            self.assertEqual(import_roster(self.data.class_obj, lines, batch_size=3).as_dict(), {
+                'created': 0, 'updated': 7, 'failed': 0, 'errors': [],
+            })
+    
+    def test_header_without_required_columns_is_refused(self):
+        response = self.upload('id,name\n1,Ann\n')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('roster_id', response.data['error'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, IMAGE_JOBS_MAX_ATTEMPTS=2, CACHES=LOCMEM_CACHE)
+class ImageJobTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(1)
+    
+    def setUp(self):
+        self.answer = Answer.objects.get(pk=self.data.answer.pk)
+        self.answer.image.save('answer.png', ContentFile(image_bytes(1)), save=True)
+        schedule_image_processing(self.answer)
+    
+    def claim(self):
+        jobs = claim_jobs(10)
+        self.assertEqual(len(jobs), 1)
+        return jobs[0]
+    
+    def test_claimed_job_makes_the_image_ready(self):
+        self.assertEqual(Answer.objects.get(pk=self.answer.pk).status, ImageStatus.PROCESSING)
+        job = self.claim()
+        self.assertEqual((job.status, job.attempts), (ImageJob.Status.RUNNING, 1))
+        self.assertEqual(claim_jobs(10), [])
+        
+        self.assertEqual(run_job(job), ImageJob.Status.DONE)
+        
+        answer = Answer.objects.get(pk=self.answer.pk)
+        self.assertEqual(answer.status, ImageStatus.READY)
+        self.assertEqual(set(answer.image_derivatives), set(DERIVATIVES))
+        self.assertTrue(media_storage().exists(answer.image_derivatives['thumb']['path']))
+    
+    def test_expired_lease_is_claimed_again(self):
+        job = self.claim()
+        ImageJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        
+        self.assertEqual(self.claim().attempts, 2)
+    
+    def test_errors_are_retried_until_attempts_run_out(self):
+        with mock.patch('app.jobs.read_image', side_effect=OSError('disk unavailable')), self.assertLogs('app.jobs'):
+            self.assertEqual(run_job(self.claim()), ImageJob.Status.PENDING)
+            self.assertEqual(Answer.objects.get(pk=self.answer.pk).status, ImageStatus.PROCESSING)
+            self.assertEqual(run_job(self.claim()), ImageJob.Status.FAILED)
+        
+        job = ImageJob.objects.get(answer=self.answer)
+        self.assertEqual((job.attempts, job.last_error), (2, 'disk unavailable'))
+        self.assertEqual(Answer.objects.get(pk=self.answer.pk).status, ImageStatus.FAILED)
+    
+    def test_invalid_image_fails_at_once(self):
+        with mock.patch('app.jobs.read_image', return_value=b'not an image'), self.assertLogs('app.jobs', 'WARNING'):
+            self.assertEqual(run_job(self.claim()), ImageJob.Status.FAILED)
+        
+        self.assertEqual(Answer.objects.get(pk=self.answer.pk).status, ImageStatus.FAILED)
+    
+    def test_deleted_row_drops_the_job(self):
+        job = self.claim()
+        Answer.objects.filter(pk=self.answer.pk).delete()
+        
+        self.assertEqual(run_job(job), ImageJob.Status.DROPPED)
+        self.assertFalse(ImageJob.objects.exists())
+    
+    def test_replaced_image_is_left_to_its_own_job(self):
+        job = self.claim()
+        self.answer.image.save('other.png', ContentFile(image_bytes(2)), save=True)
+        schedule_image_processing(self.answer)
+        
+        self.assertEqual(run_job(job), ImageJob.Status.DROPPED)
+        answer = Answer.objects.get(pk=self.answer.pk)
+        self.assertEqual((answer.status, answer.image_derivatives), (ImageStatus.PROCESSING, {}))
+        self.assertEqual(run_job(self.claim()), ImageJob.Status.DONE)
+        self.assertEqual(Answer.objects.get(pk=self.answer.pk).status, ImageStatus.READY)
+    
+    def test_workers_outlive_a_job_whose_result_cannot_be_saved(self):
+        job = self.claim()
+        with mock.patch('app.jobs.record_job_result', side_effect=DatabaseError('connection lost')), \
+                self.assertLogs('app.jobs', 'ERROR'):
+            self.assertEqual(run_job(job), ImageJob.Status.RUNNING)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE)
+class DerivativeQueueTests(TestCase):
+    """
+    Images without derivatives are queued for the workers when they run,
+    and rendered on the request that first lists them when they do not.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(1)
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+        self.url = f"{reverse('instructor_class_answers')}?class_id={self.data.class_obj.id}&size=thumb"
+    
+    def store(self, data):
+        # Uploaded before derivatives existed
+        answer = Answer.objects.get(pk=self.data.answer.pk)
+        answer.image.save('answer.png', ContentFile(data), save=False)
+        Answer.objects.filter(pk=answer.pk).update(image=answer.image.name, image_derivatives={}, status=ImageStatus.READY)
+        return answer
+    
+    def image_url(self):
+        cache.clear()
+        return self.client.get(self.url).data[0]['image_url']
+    
+    def test_listing_queues_missing_derivatives(self):
+        answer = self.store(image_bytes(1))
+        
+        with mock.patch('app.jobs.render_derivative_images', side_effect=AssertionError('rendered on a request')):
+            self.assertTrue(self.image_url().endswith(answer.image.url))
+            self.image_url()
+        
+        self.assertEqual(ImageJob.objects.filter(answer=answer, status=ImageJob.Status.PENDING).count(), 1)
+        self.assertEqual(Answer.objects.get(pk=answer.pk).image_derivatives, {})
+        
+        self.assertEqual(run_job(claim_jobs(10)[0]), ImageJob.Status.DONE)
+        
+        thumb = Answer.objects.get(pk=answer.pk).image_derivatives['thumb']['path']
+        self.assertTrue(media_storage().exists(thumb))
+        self.assertTrue(self.image_url().endswith(media_storage().url(thumb)))
+    
+    def test_undecodable_image_is_queued_once(self):
+        answer = self.store(b'not an image')
+        self.image_url()
+        
+        with self.assertLogs('app.jobs', 'WARNING'):
+            self.assertEqual(run_job(claim_jobs(10)[0]), ImageJob.Status.FAILED)
+        
+        self.assertEqual(Answer.objects.get(pk=answer.pk).status, ImageStatus.FAILED)
+        self.assertTrue(self.image_url().endswith(answer.image.url))
+        self.assertEqual(ImageJob.objects.filter(answer=answer).count(), 1)
+    
+    @override_settings(IMAGE_JOBS_ASYNC=False)
+    def test_without_workers_the_first_listing_renders_them(self):
+        answer = self.store(image_bytes(1))
+        
+        url = self.image_url()
+        
+        thumb = Answer.objects.get(pk=answer.pk).image_derivatives['thumb']['path']
+        self.assertTrue(media_storage().exists(thumb))
+        self.assertTrue(url.endswith(media_storage().url(thumb)))
+        self.assertFalse(ImageJob.objects.exists())
+        with mock.patch('app.images.render_derivative_images', side_effect=AssertionError('rendered again')):
+            self.assertEqual(self.image_url(), url)
+            detail = self.client.get(reverse('answer-detail', args=[answer.pk]), {'size': 'thumb'})
+        self.assertEqual(detail.data['image_url'], url)
+    
+    @override_settings(IMAGE_JOBS_ASYNC=False)
+    def test_without_workers_undecodable_image_fails_once(self):
+        answer = self.store(b'not an image')
+        
+        with self.assertLogs('app.images', 'WARNING'):
+            self.assertTrue(self.image_url().endswith(answer.image.url))
+        
+        self.assertEqual(Answer.objects.get(pk=answer.pk).status, ImageStatus.FAILED)
+        with mock.patch('app.images.render_derivative_images', side_effect=AssertionError('rendered again')):
+            self.image_url()
+        self.assertFalse(ImageJob.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHE, IMAGE_JOBS_ASYNC=True)
+class ReadCacheTests(TestCase):
+    """Cached listings are served without queries and invalidated exactly on change."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(3)
+        cls.other_class = Class.objects.create(class_name='Other class', instructor=cls.data.instructor)
+    
+    def setUp(self):
+        cache.clear()
+        self.instructor = APIClient()
+        self.instructor.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+        self.student = APIClient()
+        self.student.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.student_user.pk].access_token}')
+    
+    def change(self, func):
+        """Run a write and its on-commit invalidation."""
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+    
+    def test_repeat_read_is_a_hit(self):
+        url = reverse('class-list')
+        self.assertEqual(self.instructor.get(url)['X-Cache'], 'MISS')
+        
+        with self.assertNumQueries(0):
+            response = self.instructor.get(url)
+        
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(response.data), 2)
+    
+    def test_class_rename_invalidates_class_listings(self):
+        self.instructor.get(reverse('class-list'))
+        self.student.get(reverse('student_classes'))
+        
+        renamed = Class.objects.get(pk=self.data.class_obj.pk)
+        renamed.class_name = 'Renamed'
+        self.change(renamed.save)
+        
+        response = self.instructor.get(reverse('class-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Renamed', [c['class_name'] for c in response.data])
+        response = self.student.get(reverse('student_classes'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data[0]['class_name'], 'Renamed')
+    
+    def test_new_question_invalidates_only_its_class(self):
+        url = f"{reverse('student_questions')}?class_id={self.data.class_obj.id}"
+        other_url = f"{reverse('question-list')}?class_id={self.other_class.id}"
+        self.student.get(url)
+        self.instructor.get(other_url)
+        
+        self.change(lambda: Question.objects.create(question_text='New', class_related=self.data.class_obj))
+        
+        response = self.student.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(self.instructor.get(other_url)['X-Cache'], 'HIT')
+    
+    def test_moving_a_student_invalidates_both_rosters(self):
+        url = f"{reverse('student-list')}?class_id={self.data.class_obj.id}"
+        other_url = f"{reverse('student-list')}?class_id={self.other_class.id}"
+        self.assertEqual(len(self.instructor.get(url).data), 3)
+        self.assertEqual(len(self.instructor.get(other_url).data), 0)
+        
+        student = Student.objects.get(pk=self.data.students[-1].pk)
+        student.class_enrolled = self.other_class
+        self.change(student.save)
+        
+        self.assertEqual(len(self.instructor.get(url).data), 2)
+        self.assertEqual(len(self.instructor.get(other_url).data), 1)
+    
+    def test_login_does_not_invalidate(self):
+        url = reverse('class-list')
+        self.instructor.get(url)
+        
+        self.change(lambda: APIClient().post(
+            reverse('token_obtain_pair'),
+            {'username': self.data.instructor.username, 'password': 'password123'},
+            format='json'
+        ))
+        
+        self.assertEqual(self.instructor.get(url)['X-Cache'], 'HIT')
+    
+    def test_hit_and_miss_counters(self):
+        url = reverse('class-list')
+        self.instructor.get(url)
+        self.instructor.get(url)
+        self.instructor.get(url)
+        
+        self.assertEqual(get_stats()['classes'], {'hits': 2, 'misses': 1})
+        reset_stats()
+        self.assertEqual(get_stats()['classes'], {'hits': 0, 'misses': 0})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHUNKED_UPLOAD_DIR=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE)
+class BenchmarkTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_dataset', instructors=2, classes=1, students=5, questions=2, answers=3, images=2,
+            prefix='bench', stdout=StringIO()
+        )
+    
+    def test_every_route_is_benchmarked(self):
+        routes = {getattr(pattern, 'name', None) for pattern in urls.urlpatterns} - {None}
+        routes |= {pattern.name for pattern in urls.router.urls}
+        
+        benchmarked = {endpoint.route for endpoint in build_endpoints(BenchmarkData('bench'))}
+        
+        self.assertEqual(routes - benchmarked, set())
+    
+    def test_every_endpoint_answers_as_expected(self):
+        results = run_benchmarks(BenchmarkData('bench'), iterations=2, warmup=0)
+        
+        self.assertEqual(results['health']['queries'], 0)
+        for name, result in results.items():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'], name)
+            self.assertGreater(result['memory_kb'], 0, name)
+    
+    def test_compare_flags_regressions(self):
+        baseline = {'list': {'status': 200, 'queries': 3, 'p95_ms': 10.0, 'memory_kb': 100.0}}
+        
+        self.assertEqual(compare_results(baseline, {'list': dict(baseline['list'], p95_ms=12.0)}), [])
+        self.assertEqual(compare_results(baseline, {}), [])
+        self.assertEqual(compare_results(baseline, {'list': dict(baseline['list'], queries=4, p95_ms=20.0)}), [
+            'list: queries 3 -> 4',
+            'list: p95 10.00ms -> 20.00ms',
+        ])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE)
+class AnswerExportTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(3)
+        for i, answer in enumerate(cls.data.answers):
+            answer.image.save('answer.png', ContentFile(image_bytes(i)), save=True)
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+        self.url = f"{reverse('export_answers')}?class_id={self.data.class_obj.id}"
+    
+    def download(self, **headers):
+        response = self.client.get(self.url, **headers)
+        return response, b''.join(response.streaming_content)
+    
+    def test_archive_holds_every_image_and_a_manifest(self):
+        response, body = self.download()
+        
+        self.assertEqual(int(response['Content-Length']), len(body))
+        archive = zipfile.ZipFile(BytesIO(body))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(len(archive.namelist()), len(self.data.answers) + 1)
+        manifest = archive.read('manifest.csv').decode()
+        self.assertEqual(len(manifest.splitlines()), len(self.data.answers) + 1)
+    
+    def test_ranges_resume_the_same_archive(self):
+        response, body = self.download()
+        # A cold cache makes the resumed parts recompute earlier CRCs
+        cache.clear()
+        
+        parts = []
+        while sum(map(len, parts)) < len(body):
+            start = sum(map(len, parts))
+            part, content = self.download(HTTP_RANGE=f'bytes={start}-{start + 99}', HTTP_IF_RANGE=response['ETag'])
+            self.assertEqual(part.status_code, 206)
+            self.assertEqual(part['Content-Range'], f'bytes {start}-{start + len(content) - 1}/{len(body)}')
+            parts.append(content)
+        
+        self.assertEqual(b''.join(parts), body)
+    
+    def test_changed_archive_is_sent_whole(self):
+        response, body = self.download()
+        Answer.objects.filter(pk=self.data.answer.pk).update(liked=True)
+        
+        resumed, content = self.download(HTTP_RANGE='bytes=100-', HTTP_IF_RANGE=response['ETag'])
+        
+        self.assertEqual(resumed.status_code, 200)
+        self.assertEqual(len(content), int(resumed['Content-Length']))
+    
+    def test_signed_url_downloads_without_credentials(self):
+        signed = self.client.post(reverse('signed_urls'), {'url': self.url}, format='json').data['url']
+        _, body = self.download()
+        
+        response = APIClient().get(signed)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), body)
+        self.assertEqual(APIClient().get(f'{self.url}&signature={signed[-10:]}').status_code, 401)
+    
+    def test_crcs_are_cached_for_a_limited_time(self):
+        with mock.patch('app.exports.cache.set') as cache_set:
+            self.download()
+        
+        self.assertTrue(cache_set.called)
+        for call in cache_set.call_args_list:
+            self.assertEqual(call.kwargs['timeout'], CRC_CACHE_TIMEOUT)
+    
+    def test_unsatisfiable_range(self):
+        response, body = self.download()
+        
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(body)}-')
+        
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(body)}')
+    
+    def test_other_instructors_class_is_not_found(self):
+        other = Class.objects.create(class_name='Other', instructor=self.data.student_user)
+        
+        response = self.client.get(f"{reverse('export_answers')}?class_id={other.id}")
+        
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES=LOCMEM_CACHE)
+class MosaicTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(6)
+        for i, answer in enumerate(cls.data.answers):
+            answer.image.save('answer.png', ContentFile(image_bytes(i)), save=True)
+            answer.image_derivatives = {}
+            answer.save()
+    
+    def setUp(self):
+        cache.clear()
+        self.layout = MosaicLayout(columns=3, tile=64)
+    
+    def test_only_changed_tiles_are_drawn(self):
+        _, _, drawn = question_mosaic(self.data.question.id, self.layout)
+        self.assertEqual(drawn, 6)
+        
+        Answer.objects.filter(pk=self.data.answers[2].pk).update(liked=True)
+        Answer.objects.filter(pk=self.data.answers[4].pk).delete()
+        incremental, etag, drawn = question_mosaic(self.data.question.id, self.layout)
+        
+        # Liked tile, and the tile that moved into the deleted one's place
+        self.assertEqual(drawn, 2)
+        cache.clear()
+        recomposed, fresh_etag, drawn = question_mosaic(self.data.question.id, self.layout)
+        self.assertEqual(drawn, 5)
+        self.assertEqual(etag, fresh_etag)
+        self.assertEqual(
+            list(Image.open(BytesIO(incremental)).resize((20, 20)).getdata()),
+            list(Image.open(BytesIO(recomposed)).resize((20, 20)).getdata()),
+        )
+    
+    def test_growing_grid_matches_a_fresh_compose(self):
+        layout = MosaicLayout(columns=4, tile=64)
+        rows = list(
+            Answer.objects.filter(question=self.data.question).order_by('created_at', 'id')
+            .values('id', 'image', 'image_derivatives', 'status', 'liked', 'student__name')
+        )
+        canvas, signatures, _ = compose(layout, rows[:4])
+        
+        # A new answer starts a second row, whose other cells stay empty
+        incremental, _, drawn = compose(layout, rows[:5], (canvas, signatures))
+        fresh, _, _ = compose(layout, rows[:5])
+        
+        self.assertEqual(drawn, 1)
+        self.assertEqual(incremental.size, fresh.size)
+        self.assertIsNone(ImageChops.difference(incremental, fresh).getbbox())
+    
+    def test_unchanged_mosaic_is_not_modified(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+        url = reverse('question-mosaic', args=[self.data.question.id])
+        
+        response = client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['X-Mosaic-Tiles-Drawn'], '0')
+    
+    def test_layout_is_validated(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+        
+        response = client.get(f"{reverse('question-mosaic', args=[self.data.question.id])}?tile=10000")
+        
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, MEDIA_SENDFILE='')
+class MediaServingTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(2)
+        cls.answer = cls.data.answer
+        cls.answer.image.save('answer.png', ContentFile(image_bytes(7)), save=True)
+        cls.outsider = Instructor.objects.create_user(
+            username='outsider', email='outsider@example.com', name='Outsider', password='password123'
+        )
+        cls.data.tokens[cls.outsider.pk] = CustomTokenObtainPairSerializer.get_token(cls.outsider)
+    
+    def get(self, user, name=None, **headers):
+        token = self.data.tokens[user.pk].access_token
+        return self.client.get(
+            reverse('serve_media', args=[name or self.answer.image.name]), HTTP_AUTHORIZATION=f'Bearer {token}', **headers
+        )
+    
+    def test_owner_and_student_see_the_image_in_one_query(self):
+        for user in (self.data.instructor, self.data.student_user):
+            # Their state is cached at login
+            remember_user(user)
+            with self.assertNumQueries(1):
+                response = self.get(user)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), image_bytes(7))
+            self.assertIn('immutable', response['Cache-Control'])
+    
+    def test_others_and_anonymous_are_refused(self):
+        url = reverse('serve_media', args=[self.answer.image.name])
+        token = self.data.tokens[self.data.instructor.pk].access_token
+        
+        self.assertEqual(self.get(self.outsider).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 401)
+        # Access tokens are not accepted in the query string
+        self.assertEqual(self.client.get(f'{url}?token={token}').status_code, 401)
+    
+    def test_deactivated_users_are_refused(self):
+        self.data.student_user.is_active = False
+        self.data.student_user.save(update_fields=['is_active'])
+        
+        # Their token is still valid until it expires
+        self.assertEqual(self.get(self.data.student_user).status_code, 401)
+        self.assertEqual(self.get(self.data.instructor).status_code, 200)
+    
+    def test_signed_url_needs_no_credentials(self):
+        url = self.answer.image.url
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), image_bytes(7))
+        # Signed for one file only
+        other = Answer.objects.exclude(pk=self.answer.pk).first()
+        other.image.save('other.png', ContentFile(image_bytes(8)), save=True)
+        signature = url.partition('?')[2]
+        self.assertEqual(self.client.get(f"{reverse('serve_media', args=[other.image.name])}?{signature}").status_code, 401)
+        self.assertEqual(self.client.get(f'{url[:-1]}x').status_code, 401)
+    
+    @override_settings(SIGNED_MEDIA_URL_MAX_AGE=600)
+    def test_signed_url_expires(self):
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            url = self.answer.image.url
+            # Stable for a while, so browsers keep using their cached copy
+            self.assertEqual(Answer.objects.get(pk=self.answer.pk).image.url, url)
+        
+        with mock.patch('time.time', return_value=now + 601):
+            self.assertEqual(self.client.get(url).status_code, 401)
+    
+    def test_etag_and_range(self):
+        etag = self.get(self.data.instructor)['ETag']
+        
+        self.assertEqual(self.get(self.data.instructor, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(self.data.instructor, HTTP_IF_NONE_MATCH=f'"other", W/{etag}').status_code, 304)
+        self.assertEqual(self.get(self.data.instructor, HTTP_IF_NONE_MATCH='*').status_code, 304)
+        # Compared as whole ETags, not substrings
+        self.assertEqual(self.get(self.data.instructor, HTTP_IF_NONE_MATCH=f'"x{etag[1:]}').status_code, 200)
+        response = self.get(self.data.instructor, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), image_bytes(7)[:10])
+    
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_ACCEL_PREFIX='/protected/')
+    def test_transfer_is_handed_to_nginx(self):
+        response = self.get(self.data.instructor)
+        
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.answer.image.name}')
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(CACHES=LOCMEM_CACHE, SIGNED_URL_MAX_AGE=60)
+class SignedUrlTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(1)
+        cls.foreign_question = Question.objects.create(
+            question_text='Elsewhere', class_related=Class.objects.create(
+                class_name='Elsewhere', instructor=Instructor.objects.create_user(
+                    username='elsewhere', email='elsewhere@example.com', name='Elsewhere', password='password123'
+                )
+            )
+        )
+    
+    def sign(self, url):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+        return client.post(reverse('signed_urls'), {'url': url}, format='json')
+    
+    def test_event_stream_urls_are_signed_for_the_user_and_path(self):
+        response = self.sign(f"{reverse('answer_events')}?question_id={self.foreign_question.id}")
+        self.assertEqual(response.status_code, 200)
+        url = response.data['url']
+        
+        # Authenticated as the instructor, who cannot see that question
+        self.assertEqual(asgi_get(url).status_code, 404)
+        signature = parse_qs(urlsplit(url).query)['signature'][0]
+        self.assertEqual(asgi_get(f"{reverse('student_answer_events')}?signature={signature}").status_code, 401)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertEqual(asgi_get(url).status_code, 401)
+    
+    def test_only_signed_url_views_are_signed(self):
+        self.assertEqual(self.sign(reverse('class-list')).status_code, 400)
+        self.assertEqual(self.sign('/nowhere/').status_code, 400)
+        anonymous = APIClient().post(reverse('signed_urls'), {'url': reverse('answer_events')}, format='json')
+        self.assertEqual(anonymous.status_code, 401)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE, ANSWER_EVENTS_REDIS_URL='')
+class AnswerEventTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(1)
+    
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[user.pk].access_token}')
+        return client
+    
+    def write(self, request):
+        """Make a write request, publishing its events as its transaction commits."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = request()
+        self.assertLess(response.status_code, 300, response.data)
+        return response
+    
+    async def read_events(self, frames, count):
+        """The next `count` events of an SSE stream, as (type, data); heartbeats are skipped."""
+        events = []
+        while len(events) < count:
+            frame = (await anext(frames)).decode()
+            if frame.startswith('event: '):
+                event, data = frame.strip().split('\n')
+                events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+        return events
+    
+    async def subscribed(self, *channels):
+        """Wait until the local broker has subscribers on every one of `channels`."""
+        while not set(channels) <= get_broker()._subscribers.keys():
+            await asyncio.sleep(0.01)
+    
+    def test_answers_written_after_the_streams_open_reach_the_question_and_student_streams(self):
+        student, instructor = self.client_for(self.data.student_user), self.client_for(self.data.instructor)
+        
+        async def run():
+            streams = []
+            for url, user in (
+                (f"{reverse('answer_events')}?question_id={self.data.question.id}", self.data.instructor),
+                (reverse('student_answer_events'), self.data.student_user),
+            ):
+                response = await AsyncClient().get(
+                    url, headers={'Authorization': f'Bearer {self.data.tokens[user.pk].access_token}'}
+                )
+                self.assertEqual(response.status_code, 200)
+                frames = aiter(response.streaming_content)
+                self.assertEqual(await anext(frames), b'retry: 3000\n\n')
+                streams.append(frames)
+            # A stream subscribes to its channels when its next frame is awaited
+            readers = [asyncio.create_task(self.read_events(frames, 3)) for frames in streams]
+            try:
+                await asyncio.wait_for(self.subscribed(
+                    question_channel(self.data.question.id), student_channel(self.data.student.id)
+                ), 5)
+                
+                created = await sync_to_async(self.write)(lambda: student.post(
+                    reverse('student_submit_answer'),
+                    {'question_id': self.data.question.id, 'image': image_upload(1)},
+                    format='multipart'
+                ))
+                answer_id = created.data['id']
+                await sync_to_async(self.write)(lambda: instructor.patch(
+                    reverse('answer-detail', args=[answer_id]), {'liked': True}, format='json'
+                ))
+                await sync_to_async(self.write)(lambda: instructor.delete(reverse('answer-detail', args=[answer_id])))
+                
+                for events in await asyncio.wait_for(asyncio.gather(*readers), 5):
+                    self.assertEqual([(event, data['id']) for event, data in events], [
+                        ('answer.created', answer_id), ('answer.updated', answer_id), ('answer.deleted', answer_id),
+                    ])
+                    self.assertTrue(events[1][1]['liked'])
+            finally:
+                for reader in readers:
+                    reader.cancel()
+                await asyncio.gather(*readers, return_exceptions=True)
+                for frames in streams:
+                    await frames.aclose()
+        
+        async_to_sync(run)()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class GenerateDatasetTests(TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.enterContext(self.settings(MEDIA_ROOT=self.root))
+    
+    def generate(self, prefix, seed):
+        """Generate a small dataset; returns its content, without ids, timestamps or the prefix."""
+        call_command(
+            'generate_dataset', instructors=2, classes=2, students=6, questions=3, answers=4, images=4,
+            image_size=[32, 24], seed=seed, prefix=prefix, stdout=StringIO()
+        )
+        classes = Class.objects.filter(instructor__username__startswith=f'{prefix}-').order_by('id')
+        students = Student.objects.filter(class_enrolled__in=classes).order_by('id')
+        questions = Question.objects.filter(class_related__in=classes).order_by('id')
+        answers = Answer.objects.filter(question__in=questions).order_by('id')
+        return {
+            'classes': [name.removeprefix(prefix) for name in classes.values_list('class_name', flat=True)],
+            'students': list(students.values_list('name', 'roster_id', 'phone', 'user__name')),
+            'questions': list(questions.values_list('question_text', 'image', 'image_derivatives')),
+            'answers': list(answers.values_list('question__question_text', 'student__name', 'image', 'liked')),
+            'images': {
+                name: media_storage().open(name).read()
+                for name in set(answers.values_list('image', flat=True)) | set(questions.exclude(image='').values_list('image', flat=True))
+            },
+        }
+    
+    def test_same_seed_gives_the_same_dataset(self):
+        first = self.generate('a', seed=7)
+        second = self.generate('b', seed=7)
+        
+        self.assertEqual(len(first['answers']), 2 * 2 * 3 * 4)
+        self.assertEqual(first, second)
+        self.assertNotEqual(self.generate('c', seed=8), first)
+    
+    def test_references_and_counters_match_the_rows(self):
+        self.generate('a', seed=7)
+        
+        for name, refs in MediaBlob.objects.values_list('name', 'ref_count'):
+            self.assertEqual(
+                refs, Answer.objects.filter(image=name).count() + Question.objects.filter(image=name).count(), name
+            )
+        # Exits with an error if any participation counter was out of date
+        call_command('rebuild_stats', dry_run=True, check=True, stdout=StringIO())
+    
+    def test_existing_prefix_is_refused(self):
+        self.generate('a', seed=7)
+        
+        with self.assertRaises(CommandError):
+            self.generate('a', seed=7)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MediaReferenceTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(2)
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.enterContext(self.settings(MEDIA_ROOT=self.root))
+        self.first, self.second, self.third = Answer.objects.filter(
+            pk__in=[answer.pk for answer in self.data.answers]
+        ).order_by('pk')
+    
+    def share_file(self):
+        """Give the first two answers the same upload; returns its name."""
+        for answer in (self.first, self.second):
+            answer.image.save('answer.png', ContentFile(image_bytes(1)), save=True)
+        self.assertEqual(self.first.image.name, self.second.image.name)
+        return self.first.image.name
+    
+    def dedup(self, **options):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedup_media', stdout=out, **options)
+        return out.getvalue()
+    
+    def test_replacing_an_image_moves_its_reference(self):
+        shared = self.share_file()
+        self.assertEqual(MediaBlob.objects.get(name=shared).ref_count, 2)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.image.save('other.png', ContentFile(image_bytes(2)), save=True)
+        self.assertEqual(MediaBlob.objects.get(name=shared).ref_count, 1)
+        self.assertEqual(MediaBlob.objects.get(name=self.first.image.name).ref_count, 1)
+        self.assertTrue(media_storage().exists(shared))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.image.save('other.png', ContentFile(image_bytes(2)), save=True)
+        self.assertEqual(MediaBlob.objects.get(name=self.first.image.name).ref_count, 2)
+        self.assertFalse(MediaBlob.objects.filter(name=shared).exists())
+        self.assertFalse(media_storage().exists(shared))
+    
+    def test_deleting_rows_releases_their_references(self):
+        shared = self.share_file()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Answer.objects.get(pk=self.first.pk).delete()
+        self.assertEqual(MediaBlob.objects.get(name=shared).ref_count, 1)
+        self.assertTrue(media_storage().exists(shared))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Answer.objects.filter(pk=self.second.pk).delete()
+        self.assertFalse(MediaBlob.objects.filter(name=shared).exists())
+        self.assertFalse(media_storage().exists(shared))
+    
+    def test_dedup_merges_identical_files_in_batches(self):
+        # Identical uploads from before content addressing, one of them used twice and with a derivative
+        one = FileSystemStorage().save('answers/one.png', ContentFile(image_bytes(1)))
+        two = FileSystemStorage().save('answers/two.png', ContentFile(image_bytes(1)))
+        thumb = derivative_path(one, 'thumb')
+        FileSystemStorage().save(thumb, ContentFile(b'thumb'))
+        derivatives = {'thumb': {'path': thumb, 'width': 8, 'height': 8}}
+        Answer.objects.filter(pk__in=[self.first.pk, self.third.pk]).update(image=one, image_derivatives=derivatives)
+        Answer.objects.filter(pk=self.second.pk).update(image=two, image_derivatives={})
+        MediaBlob.objects.all().delete()
+        Answer.objects.update(updated_at=timezone.now() - timedelta(minutes=5))
+        before = timezone.now()
+        
+        with CaptureQueriesContext(connection) as queries:
+            output = self.dedup()
+        
+        self.assertIn('renamed 1 file(s), deduplicated 1', output)
+        new_name = hashed_name(one, hashlib.sha256(image_bytes(1)).hexdigest())
+        answers = Answer.objects.order_by('pk')
+        self.assertEqual({answer.image.name for answer in answers}, {new_name})
+        self.assertTrue(all(answer.updated_at >= before for answer in answers))
+        self.assertEqual(answers[0].image_derivatives['thumb']['path'], derivative_path(new_name, 'thumb'))
+        self.assertEqual(MediaBlob.objects.get(name=new_name).ref_count, 3)
+        for name in (one, two, thumb):
+            self.assertFalse(media_storage().exists(name), name)
+        # One UPDATE per old file, and one for all of the batch's reference counts
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len([sql for sql in updates if sql.startswith('UPDATE "app_answer"')]), 2)
+        self.assertEqual(len([sql for sql in updates if sql.startswith('UPDATE "app_mediablob"')]), 1)
+    
+    def test_recount_rebuilds_reference_counts(self):
+        shared = self.share_file()
+        MediaBlob.objects.filter(name=shared).update(ref_count=7)
+        MediaBlob.objects.create(name='answers/gone.png', ref_count=1)
+        
+        self.dedup(recount=True, batch_size=1)
+        
+        counts = dict(MediaBlob.objects.values_list('name', 'ref_count'))
+        self.assertEqual(counts[shared], 2)
+        self.assertEqual(counts[self.third.image.name], 1)
+        self.assertNotIn('answers/gone.png', counts)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ReshardMediaTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(2)
+        cls.sha256 = hashlib.sha256(image_bytes(1)).hexdigest()
+    
+    def setUp(self):
+        # A media tree of each test's own, as resharding moves its files
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.enterContext(self.settings(MEDIA_ROOT=self.root))
+        # Stored under the default layout, with a derivative
+        answer = Answer.objects.get(pk=self.data.answers[0].pk)
+        answer.image.save('answer.png', ContentFile(image_bytes(1)), save=True)
+        self.old_name = answer.image.name
+        thumb = derivative_path(self.old_name, 'thumb')
+        media_storage().save_as(thumb, ContentFile(b'thumb'))
+        Answer.objects.filter(pk=answer.pk).update(image_derivatives={'thumb': {'path': thumb, 'width': 8, 'height': 8}})
+        # The same content uploaded before content addressing
+        self.legacy_name = FileSystemStorage().save('answers/legacy.png', ContentFile(image_bytes(1)))
+        Answer.objects.filter(pk=self.data.answers[1].pk).update(image=self.legacy_name)
+        # The third answer's file does not exist
+    
+    def reshard(self, **options):
+        out = StringIO()
+        with self.settings(MEDIA_SHARD_LEVELS=3, MEDIA_SHARD_WIDTH=1), self.captureOnCommitCallbacks(execute=True):
+            call_command('reshard_media', workers=2, stdout=out, **options)
+        return out.getvalue()
+    
+    def test_names_in_any_layout_are_recognised(self):
+        self.assertEqual(self.old_name, f'answers/{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}.png')
+        with self.settings(MEDIA_SHARD_LEVELS=3, MEDIA_SHARD_WIDTH=1):
+            new_name = hashed_name('answers/photo.PNG', self.sha256)
+        
+        self.assertEqual(new_name, f'answers/{self.sha256[0]}/{self.sha256[1]}/{self.sha256[2]}/{self.sha256}.png')
+        for name in (self.old_name, new_name):
+            self.assertEqual(parse_hashed_name(name), ('answers', self.sha256))
+        self.assertIsNone(parse_hashed_name(self.legacy_name))
+        self.assertIsNone(parse_hashed_name(f'answers/ff/{self.sha256}.png'))
+    
+    def test_files_and_rows_move_into_the_layout(self):
+        before = Answer.objects.get(pk=self.data.answers[0].pk).updated_at
+        
+        output = self.reshard()
+        
+        self.assertIn('moved 1 file(s) and merged 1 into existing ones, repointing 2 row(s); 1 missing', output)
+        with self.settings(MEDIA_SHARD_LEVELS=3, MEDIA_SHARD_WIDTH=1):
+            new_name = hashed_name('answers/answer.png', self.sha256)
+        first, second, third = Answer.objects.filter(pk__in=[answer.pk for answer in self.data.answers]).order_by('pk')
+        self.assertEqual((first.image.name, second.image.name), (new_name, new_name))
+        self.assertEqual(third.image.name, self.data.answers[2].image.name)
+        self.assertEqual(first.image_derivatives['thumb']['path'], derivative_path(new_name, 'thumb'))
+        self.assertGreater(first.updated_at, before)
+        
+        self.assertTrue(media_storage().exists(new_name))
+        self.assertTrue(media_storage().exists(derivative_path(new_name, 'thumb')))
+        for name in (self.old_name, self.legacy_name, derivative_path(self.old_name, 'thumb')):
+            self.assertFalse(media_storage().exists(name), name)
+        self.assertEqual(MediaBlob.objects.get(name=new_name).ref_count, 2)
+        self.assertFalse(MediaBlob.objects.filter(name=self.old_name).exists())
+        
+        # Running again only finds the missing file
+        self.assertIn('moved 0 file(s) and merged 0 into existing ones, repointing 0 row(s); 1 missing', self.reshard())
+    
+    def test_derivatives_without_files_are_dropped(self):
+        # Another legacy upload, whose recorded derivative file is gone
+        legacy = FileSystemStorage().save('answers/other.png', ContentFile(image_bytes(2)))
+        missing = {'thumb': {'path': derivative_path(legacy, 'thumb'), 'width': 8, 'height': 8}}
+        Answer.objects.filter(pk=self.data.answers[2].pk).update(image=legacy, image_derivatives=missing)
+        
+        self.reshard()
+        
+        first, third = Answer.objects.filter(pk__in=[self.data.answers[0].pk, self.data.answers[2].pk]).order_by('pk')
+        self.assertNotEqual(third.image.name, legacy)
+        self.assertEqual(list(first.image_derivatives), ['thumb'])
+        # Left for the derivative backfill to render again
+        self.assertEqual(third.image_derivatives, {})
+    
+    def test_dry_run_changes_nothing(self):
+        output = self.reshard(dry_run=True)
+        
+        self.assertIn('Would have moved 1 file(s) and merged 1 into existing ones, repointing 2 row(s)', output)
+        self.assertEqual(Answer.objects.get(pk=self.data.answers[1].pk).image.name, self.legacy_name)
+        self.assertTrue(media_storage().exists(self.old_name))
+        self.assertTrue(media_storage().exists(self.legacy_name))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MediaGarbageCollectionTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(1)
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.enterContext(self.settings(MEDIA_ROOT=self.root))
+        
+        answer = Answer.objects.get(pk=self.data.answer.pk)
+        answer.image.save('answer.png', ContentFile(image_bytes(1)), save=True)
+        self.live = answer.image.name
+        self.orphans = [
+            media_storage().save('answers/orphan.png', ContentFile(image_bytes(2))),
+            media_storage().save('questions/slide.png', ContentFile(image_bytes(3))),
+            # Stored before content addressing, next to the shard directories
+            FileSystemStorage().save('answers/a-legacy.png', ContentFile(image_bytes(4))),
+        ]
+        for name in (self.live, self.orphans[0]):
+            media_storage().save_as(derivative_path(name, 'thumb'), ContentFile(b'thumb'))
+        self.orphans.append(derivative_path(self.orphans[0], 'thumb'))
+        # A reference count that had drifted
+        MediaBlob.objects.create(name=self.orphans[0], ref_count=1)
+    
+    def gc(self, **options):
+        out = StringIO()
+        call_command('gc_media', stdout=out, **options)
+        return out.getvalue()
+    
+    def test_media_tree_is_walked_in_key_order(self):
+        files = list(media_files(self.root, 'answers'))
+        
+        keys = [key for key, _, _ in files]
+        self.assertEqual(keys, sorted(keys))
+        self.assertIn((self.live, derivative_path(self.live, 'thumb')), [(key, name) for key, name, _ in files])
+    
+    def test_unreferenced_files_are_deleted(self):
+        size = sum(os.path.getsize(media_storage().path(name)) for name in self.orphans)
+        
+        output = self.gc(grace=0, workers=2, batch_size=2)
+        
+        self.assertIn(f'Scanned 6 file(s). Deleted 4 unreferenced file(s), reclaiming {size} bytes', output)
+        for name in self.orphans:
+            self.assertFalse(media_storage().exists(name), name)
+        self.assertTrue(media_storage().exists(self.live))
+        self.assertTrue(media_storage().exists(derivative_path(self.live, 'thumb')))
+        self.assertFalse(MediaBlob.objects.filter(name=self.orphans[0]).exists())
+        self.assertEqual(MediaBlob.objects.get(name=self.live).ref_count, 1)
+    
+    def test_grace_period_and_dry_run_keep_files(self):
+        self.assertIn('Deleted 0 unreferenced file(s), reclaiming 0 bytes (0.00MB); kept 4', self.gc())
+        self.assertIn('Would have deleted 4 unreferenced file(s)', self.gc(grace=0, dry_run=True))
+        for name in self.orphans:
+            self.assertTrue(media_storage().exists(name), name)
+    
+    def test_files_referenced_since_the_scan_are_kept(self):
+        # A row created between the scan and the deletion
+        references = list(referenced_names(Answer))
+        Answer.objects.create(student=self.data.student, question=self.data.question, image=self.orphans[0])
+        
+        with mock.patch('app.management.commands.gc_media.referenced_names', side_effect=[referenced_names(Question), references]):
+            output = self.gc(grace=0)
+        
+        self.assertIn('Deleted 2 unreferenced file(s)', output)
+        self.assertTrue(media_storage().exists(self.orphans[0]))
+        self.assertTrue(media_storage().exists(self.orphans[3]))
+
+
+def photo_upload(name, size, image_format='JPEG', mode='RGB', **options):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 10, 10, 0)[:len(mode)]).save(buffer, image_format, **options)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=False)
+class IngestTests(TestCase):
+    
+    def normalize(self, upload):
+        return normalize_image_data(upload.read(), **ingest_options())
+    
+    def test_photos_are_upright_without_metadata(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees clockwise
+        exif[0x010F] = 'Camera maker'
+        
+        data, extension, width, height = self.normalize(photo_upload('photo.jpeg', (40, 20), exif=exif.tobytes()))
+        
+        self.assertEqual((extension, width, height), ('jpg', 20, 40))
+        with Image.open(BytesIO(data)) as stored:
+            self.assertEqual((stored.format, stored.size), ('JPEG', (20, 40)))
+            self.assertTrue(stored.info.get('progressive'))
+            self.assertEqual(dict(stored.getexif()), {})
+    
+    @override_settings(IMAGE_MAX_DIMENSION=32)
+    def test_large_images_are_downscaled(self):
+        data, _, width, height = self.normalize(photo_upload('photo.png', (100, 50), 'PNG'))
+        
+        self.assertEqual((width, height), (32, 16))
+        self.assertEqual(Image.open(BytesIO(data)).size, (32, 16))
+    
+    def test_transparent_images_are_stored_as_webp(self):
+        data, extension, _, _ = self.normalize(photo_upload('logo.png', (8, 8), 'PNG', 'RGBA'))
+        
+        self.assertEqual(extension, 'webp')
+        self.assertEqual(Image.open(BytesIO(data)).mode, 'RGBA')
+    
+    def test_format_is_read_from_the_content(self):
+        with self.assertRaisesMessage(ValidationError, 'not a JPEG, PNG or GIF'):
+            check_image(photo_upload('photo.png', (8, 8), 'BMP'))
+        with self.assertRaisesMessage(ValidationError, 'Not a valid image'):
+            check_image(SimpleUploadedFile('photo.png', b'not an image'))
+        with self.assertRaisesMessage(InvalidImage, 'not a JPEG, PNG or GIF'):
+            self.normalize(photo_upload('photo.png', (8, 8), 'BMP'))
+    
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_pixel_count_is_refused_before_decoding(self):
+        # Only the headers: decoding would fail on the missing pixel data
+        png = photo_upload('bomb.png', (100, 100), 'PNG').read()
+        header = png[:png.index(b'IDAT') + 4]
+        
+        with self.assertRaisesMessage(ValidationError, '100x100 pixels'):
+            check_image(SimpleUploadedFile('bomb.png', header))
+    
+    @override_settings(IMAGE_JOBS_ASYNC=True)
+    def test_uploads_are_normalized_by_their_job(self):
+        data = Dataset(1)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {data.tokens[data.instructor.pk].access_token}')
+        upload = photo_upload('slide.png', (30, 10), 'PNG')
+        
+        with mock.patch('app.jobs.normalize_image_data', side_effect=AssertionError('normalized on the request')):
+            response = client.post(reverse('question-import-deck'), {
+                'class_id': data.class_obj.id, 'images': [upload],
+            }, format='multipart')
+        
+        self.assertEqual(response.status_code, 202, response.data)
+        question = Question.objects.get(id=response.data['ids'][0])
+        upload_name = question.image.name
+        self.assertTrue(upload_name.endswith('.png'))
+        self.assertEqual((question.status, question.image_width), (ImageStatus.PROCESSING, None))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_job(claim_jobs(10)[0]), ImageJob.Status.DONE)
+        
+        question = Question.objects.get(pk=question.pk)
+        self.assertTrue(question.image.name.endswith('.jpg'))
+        self.assertEqual((question.image_width, question.image_height), (30, 10))
+        self.assertEqual(question.image_bytes, question.image.size)
+        self.assertEqual(MediaBlob.objects.get(name=question.image.name).ref_count, 1)
+        # The upload's only reference went with it
+        self.assertFalse(MediaBlob.objects.filter(name=upload_name).exists())
+        self.assertFalse(media_storage().exists(upload_name))
+    
+    def test_uploads_store_the_normalized_image(self):
+        data = Dataset(1)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {data.tokens[data.instructor.pk].access_token}')
+        
+        # Slides are processed once their questions are committed, which a TestCase only simulates
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('question-import-deck'), {
+                'class_id': data.class_obj.id, 'images': [photo_upload('slide.gif', (30, 10), 'GIF', 'P')],
+            }, format='multipart')
+        
+        self.assertLess(response.status_code, 300, response.data)
+        question = Question.objects.get(id=response.data['ids'][0])
+        self.assertTrue(question.image.name.endswith('.jpg'))
+        self.assertEqual((question.image_width, question.image_height), (30, 10))
+        self.assertEqual(question.image_bytes, question.image.size)
+        self.assertEqual(question.status, ImageStatus.READY)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE)
+class ProjectionTests(TestCase):
+    """List projections render the same bytes as the serializers they replace."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(3)
+        Student.objects.filter(pk=cls.data.students[1].pk).update(name='Zoë “Q” Ñandú', phone='555-0101', roster_id='R1')
+        Question.objects.filter(pk=cls.data.questions[1].pk).update(question_text='é' * 50)
+        Question.objects.filter(pk=cls.data.questions[2].pk).update(
+            question_text='', image='questions/slide one.png', image_derivatives={
+                name: {'path': f'questions/derivatives/slide one.png.{name}.jpg', 'width': 8, 'height': 8}
+                for name in DERIVATIVES
+            }
+        )
+        Answer.objects.filter(pk=cls.data.answers[1].pk).update(image='answers/ünï code #1.png', liked=True)
+        # One image still processing, one without derivatives (queued, not rendered)
+        Answer.objects.filter(pk=cls.data.answers[2].pk).update(status=ImageStatus.PROCESSING, image_derivatives={})
+        answer = Answer.objects.get(pk=cls.data.answers[3].pk)
+        answer.image.save('answer.png', ContentFile(image_bytes(5)), save=False)
+        Answer.objects.filter(pk=answer.pk).update(image=answer.image.name, image_derivatives={})
+    
+    def assertSameAsSerializer(self, projection_class, queryset, query=''):
+        request = Request(APIRequestFactory().get(f'/api/?{query}'))
+        actual = projection_class(request).data(queryset)
+        
+        expected = projection_class.serializer_class(queryset, many=True, context={'request': request}).data
+        
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+    
+    def test_output_matches_the_serializers(self):
+        answers = Answer.objects.select_related('student', 'question').filter(question__class_related=self.data.class_obj)
+        cases = [
+            (ClassProjection, Class.objects.select_related('instructor')),
+            (StudentProjection, Student.objects.select_related('class_enrolled').order_by('id')),
+            (QuestionProjection, Question.objects.order_by('id')),
+            (AnswerProjection, answers),
+        ]
+        for projection_class, queryset in cases:
+            for query in ('', 'size=thumb', 'size=original'):
+                with self.subTest(projection_class.__name__, query=query):
+                    self.assertSameAsSerializer(projection_class, queryset, query)
+    
+    def test_sparse_fields(self):
+        client = self.client_for(self.data.instructor)
+        url = f"{reverse('instructor_class_answers')}?class_id={self.data.class_obj.id}"
+        
+        response = client.get(f'{url}&fields=liked,id,image_url&page_size=2')
+        
+        self.assertEqual([list(row) for row in response.data['results']], [['id', 'image_url', 'liked']] * 2)
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(client.get(f'{url}&fields=id,secret').status_code, 400)
+        self.assertEqual(client.get(f"{reverse('answer-list')}?question_id={self.data.question.id}&fields=nope").status_code, 400)
+    
+    def test_cached_listings_vary_by_fields(self):
+        client = self.client_for(self.data.instructor)
+        cache.clear()
+        
+        narrow = client.get(f"{reverse('class-list')}?fields=class_name")
+        full = client.get(reverse('class-list'))
+        
+        self.assertEqual(narrow.data, [{'class_name': self.data.class_obj.class_name}])
+        self.assertEqual(full['X-Cache'], 'MISS')
+        self.assertIn('instructor_name', full.data[0])
+    
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[user.pk].access_token}')
+        return client
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE)
+class ParticipationStatsTests(TestCase):
+    """Stats are read from counters that every answer write keeps equal to a recount."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(3)
+        cls.other = Dataset(2)
+    
+    def setUp(self):
+        self.instructor = APIClient()
+        self.instructor.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.instructor.pk].access_token}')
+    
+    def stats(self):
+        response = self.instructor.get(reverse('class-stats', args=[self.data.class_obj.id]))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    
+    def assertCountersMatchAnswers(self):
+        self.assertEqual(rebuild_stats(dry_run=True), {'QuestionStats': 0, 'ClassStats': 0})
+    
+    def test_class_and_question_stats(self):
+        stats = self.stats()
+        
+        self.assertEqual(
+            {key: stats[key] for key in ('student_count', 'answer_count', 'liked_count', 'respondent_count', 'participation_rate')},
+            {'student_count': 3, 'answer_count': 5, 'liked_count': 0, 'respondent_count': 3, 'participation_rate': 1.0},
+        )
+        self.assertEqual(stats['last_answer_at'], max(answer.created_at for answer in self.data.answers))
+        self.assertEqual([question['question_id'] for question in stats['questions']], [q.id for q in self.data.questions])
+        self.assertEqual([question['answer_count'] for question in stats['questions']], [3, 1, 1])
+        self.assertEqual(stats['questions'][1]['participation_rate'], 0.3333)
+    
+    def test_students_are_locked_before_their_answers_are_counted(self):
+        # Two first answers of a student in concurrent transactions must not both count them
+        with CaptureQueriesContext(connection) as queries:
+            Answer.objects.create(student=self.data.students[1], question=self.data.questions[2], image='answers/new.png')
+        
+        sql = [query['sql'] for query in queries]
+        lock = next(n for n, query in enumerate(sql) if query.startswith('SELECT "app_student"."id" FROM "app_student"'))
+        count = next(n for n, query in enumerate(sql) if query.startswith('SELECT') and 'GROUP BY' in query and '"app_answer"' in query)
+        self.assertLess(lock, count)
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', sql[lock])
+        self.assertEqual(self.stats()['questions'][2]['respondent_count'], 2)
+        self.assertCountersMatchAnswers()
+    
+    def test_single_writes_move_the_counters(self):
+        student = APIClient()
+        student.credentials(HTTP_AUTHORIZATION=f'Bearer {self.data.tokens[self.data.student_user.pk].access_token}')
+        question = self.data.questions[1]
+        
+        response = student.post(
+            reverse('student_submit_answer'), {'question_id': question.id, 'image': image_upload(1)}, format='multipart'
+        )
+        self.instructor.patch(reverse('answer-detail', args=[response.data['id']]), {'liked': True}, format='json')
+        self.instructor.delete(reverse('answer-detail', args=[self.data.answers[1].id]))
+        
+        stats = self.stats()
+        # The deleted answer was the only one of its student
+        self.assertEqual((stats['answer_count'], stats['liked_count'], stats['respondent_count']), (5, 1, 2))
+        self.assertEqual(stats['questions'][0]['respondent_count'], 2)
+        self.assertEqual(stats['questions'][1]['answer_count'], 2)
+        self.assertEqual(stats['last_answer_at'], Answer.objects.get(pk=response.data['id']).created_at)
+        self.assertCountersMatchAnswers()
+    
+    def test_like_toggles_read_the_answer_locked(self):
+        detail = reverse('answer-detail', args=[self.data.answer.id])
+        sql = []
+        
+        def record(execute, query, *args):
+            sql.append(query)
+            return execute(query, *args)
+        
+        # Recorded through a wrapper, as the request resets the connection's query log
+        with connection.execute_wrapper(record):
+            self.instructor.patch(detail, {'liked': True}, format='json')
+        self.instructor.patch(detail, {'liked': True}, format='json')
+        
+        read = next(n for n, query in enumerate(sql) if query.startswith('SELECT') and 'FROM "app_answer"' in query)
+        write = next(n for n, query in enumerate(sql) if query.startswith('UPDATE "app_answer"'))
+        self.assertLess(read, write)
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE OF', sql[read])
+        # The second, identical toggle changes nothing
+        self.assertEqual(self.stats()['liked_count'], 1)
+        self.assertCountersMatchAnswers()
+    
+    def test_bulk_writes_move_the_counters(self):
+        bulk = reverse('answer-bulk')
+        self.instructor.post(bulk, {'action': 'like', 'question_id': self.data.question.id}, format='json')
+        self.instructor.post(bulk, {'action': 'delete', 'ids': [self.data.answers[0].id, self.data.answers[-1].id]}, format='json')
+        
+        stats = self.stats()
+        self.assertEqual((stats['answer_count'], stats['liked_count'], stats['respondent_count']), (3, 2, 3))
+        self.assertCountersMatchAnswers()
+    
+    def test_cascades_and_moves_move_the_counters(self):
+        self.data.students[1].delete()
+        self.data.questions[1].delete()
+        question = Question.objects.get(pk=self.data.questions[2].pk)
+        question.class_related = self.other.class_obj
+        question.save()
+        
+        stats = self.stats()
+        self.assertEqual((stats['answer_count'], stats['respondent_count']), (2, 2))
+        self.assertCountersMatchAnswers()
+    
+    def test_rebuild_command_repairs_counters(self):
+        QuestionStats.objects.filter(pk=self.data.question.pk).update(answer_count=99)
+        ClassStats.objects.filter(pk=self.data.class_obj.pk).delete()
+        
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stats', dry_run=True, check=True, stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_stats', stdout=out)
+        
+        self.assertIn('Rebuilt 1 question and 1 class', out.getvalue())
+        self.assertEqual(self.stats()['questions'][0]['answer_count'], 3)
+        self.assertCountersMatchAnswers()
+    
+    def test_other_instructors_class_is_not_found(self):
+        response = self.instructor.get(reverse('class-stats', args=[self.other.class_obj.id]))
+        
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ClaimsAuthenticationTests(TestCase):
+    """Requests are authenticated from token claims, with account state cached per process."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = Instructor.objects.create_user(
+            username='instructor', email='instructor@example.com', name='Instructor', password='password123'
+        )
+    
+    def setUp(self):
+        user_states.clear()
+        self.token = CustomTokenObtainPairSerializer.get_token(self.instructor).access_token
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        # Warm the read cache, so that only authentication can query
+        cache.clear()
+        self.client.get(reverse('class-list'))
+    
+    def test_known_account_needs_no_query(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('class-list'))
+        
+        self.assertEqual(response.status_code, 200)
+    
+    def test_unknown_account_is_checked_once(self):
+        user_states.clear()
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('class-list')).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('class-list')).status_code, 200)
+    
+    def test_deactivated_account_is_refused(self):
+        self.instructor.is_active = False
+        self.instructor.save()
+        
+        response = self.client.get(reverse('class-list'))
+        
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'user_inactive')
+    
+    def test_deleted_account_is_refused(self):
+        self.instructor.delete()
+        
+        self.assertEqual(self.client.get(reverse('class-list')).status_code, 401)
+    
+    @override_settings(AUTH_USER_STATE_TTL=-1)
+    def test_expired_state_is_checked_again(self):
+        user_states.set(self.instructor.pk, True)
+        Instructor.objects.filter(pk=self.instructor.pk).update(is_active=False)
+        
+        self.assertEqual(self.client.get(reverse('class-list')).status_code, 401)
+    
+    @override_settings(AUTH_USER_STATE_CACHE_SIZE=2)
+    def test_cache_keeps_recent_accounts(self):
+        for user_id in (1, 2, 3):
+            user_states.set(user_id, True)
+        
+        self.assertIsNone(user_states.get(1))
+        self.assertTrue(user_states.get(3))
+    
+    def test_token_without_claims_loads_the_user(self):
+        del self.token['username']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('class-list'))
+        
+        self.assertEqual(response.status_code, 200)
+    
+    def test_login_updates_last_login_at_most_hourly(self):
+        def login():
+            return APIClient().post(
+                reverse('token_obtain_pair'), {'username': 'instructor', 'password': 'password123'}, format='json'
+            )
+        
+        login()
+        last_login = Instructor.objects.get(pk=self.instructor.pk).last_login
+        login()
+        
+        self.assertIsNotNone(last_login)
+        self.assertEqual(Instructor.objects.get(pk=self.instructor.pk).last_login, last_login)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StudentClaimTests(TestCase):
+    """The token's student_ids claim is a hint; enrollment is checked against the user's records."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = Instructor.objects.create_user(
+            username='instructor', email='instructor@example.com', name='Instructor', password='password123'
+        )
+        cls.classes = [Class.objects.create(class_name=f'Class {n}', instructor=cls.instructor) for n in range(3)]
+        cls.first, cls.second = [
+            Instructor.objects.create_user(
+                username=f'student{n}', email=f'student{n}@example.com', name=f'Student {n}', password='password123'
+            )
+            for n in range(2)
+        ]
+        # The first student is enrolled in two classes, the second in the third
+        cls.records = [
+            Student.objects.create(name=f'Student {n}', class_enrolled=class_obj, user=user)
+            for n, (class_obj, user) in enumerate(zip(cls.classes, (cls.first, cls.first, cls.second)))
+        ]
+    
+    def setUp(self):
+        cache.clear()
+        self.tokens = {
+            user.pk: CustomTokenObtainPairSerializer.get_token(user).access_token for user in (self.first, self.second)
+        }
+    
+    def get(self, user, url, async_views=False):
+        headers = {'Authorization': f'Bearer {self.tokens[user.pk]}'}
+        if async_views:
+            with self.settings(ROOT_URLCONF=student_urlconf(async_views)):
+                return async_to_sync(AsyncClient().get)(url, headers=headers)
+        return APIClient().get(url, headers=headers)
+    
+    def class_ids(self, user, async_views=False):
+        response = self.get(user, reverse('student_classes'), async_views)
+        self.assertEqual(response.status_code, 200)
+        return {class_obj['id'] for class_obj in response.json()}
+    
+    def questions_status(self, user, class_obj, async_views=False):
+        return self.get(user, f"{reverse('student_questions')}?class_id={class_obj.id}", async_views).status_code
+    
+    def test_student_of_several_classes_reaches_each(self):
+        for views in (None, async_views):
+            with self.subTest(async_views=views is not None):
+                self.assertEqual(self.class_ids(self.first, views), {self.classes[0].id, self.classes[1].id})
+                self.assertEqual(self.questions_status(self.first, self.classes[0], views), 200)
+                self.assertEqual(self.questions_status(self.first, self.classes[1], views), 200)
+                self.assertEqual(self.questions_status(self.first, self.classes[2], views), 404)
+    
+    def test_relinked_record_is_not_reached_through_the_old_claim(self):
+        # Warm the cached listing while the record is still the first student's
+        self.assertEqual(self.class_ids(self.first), {self.classes[0].id, self.classes[1].id})
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            record = Student.objects.get(pk=self.records[1].pk)
+            record.user = self.second
+            record.save()
+        
+        for views in (None, async_views):
+            with self.subTest(async_views=views is not None):
+                # Both tokens still carry their old claims
+                self.assertEqual(self.class_ids(self.first, views), {self.classes[0].id})
+                self.assertEqual(self.questions_status(self.first, self.classes[1], views), 404)
+                self.assertEqual(self.class_ids(self.second, views), {self.classes[1].id, self.classes[2].id})
+                self.assertEqual(self.questions_status(self.second, self.classes[1], views), 200)
+    
+    def test_new_enrollment_is_listed_without_a_new_token(self):
+        for views in (None, async_views):
+            self.assertEqual(self.class_ids(self.second, views), {self.classes[2].id})
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(name='Student 1', class_enrolled=self.classes[0], user=self.second)
+        
+        for views in (None, async_views):
+            with self.subTest(async_views=views is not None):
+                # The token's claim still names only the earlier record
+                self.assertEqual(self.class_ids(self.second, views), {self.classes[0].id, self.classes[2].id})
+                self.assertEqual(self.questions_status(self.second, self.classes[0], views), 200)
+    
+    def instructor_client(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {CustomTokenObtainPairSerializer.get_token(self.instructor).access_token}')
+        return client
+    
+    def test_accounts_are_linked_by_email_only(self):
+        client = self.instructor_client()
+        url = reverse('student-detail', args=[self.records[2].pk])
+        
+        response = client.patch(url, {'user': self.first.pk}, format='json')
+        self.assertEqual((response.status_code, response.data['user']), (200, self.second.pk))
+        response = client.patch(url, {'email': 'nobody@example.com'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        
+        response = client.post(reverse('student-list'), {
+            'name': 'Student 0', 'class_enrolled': self.classes[2].pk, 'email': 'STUDENT0@example.com',
+        }, format='json')
+        self.assertEqual((response.status_code, response.data['user']), (201, self.first.pk))
+        response = client.patch(url, {'email': ''}, format='json')
+        self.assertEqual((response.status_code, response.data['user']), (200, None))
+        
+        self.assertEqual(self.class_ids(self.first), {self.classes[0].id, self.classes[1].id, self.classes[2].id})
+    
+    def test_roster_import_links_accounts_by_email(self):
+        # Warm the cached listing before the import links another record
+        self.assertEqual(self.class_ids(self.second), {self.classes[2].id})
+        roster = 'roster_id,name,email\nR1,Student 1,student1@example.com\nR2,Nobody,nobody@example.com\nR3,Unlinked,\n'
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.instructor_client().post(
+                reverse('class-roster', args=[self.classes[0].id]),
+                {'file': SimpleUploadedFile('roster.csv', roster.encode(), content_type='text/csv')},
+                format='multipart'
+            )
+        
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['errors'], [{'line': 3, 'error': 'No account has this email'}])
+        self.assertEqual(
+            dict(Student.objects.filter(class_enrolled=self.classes[0], roster_id__isnull=False).values_list('roster_id', 'user')),
+            {'R1': self.second.pk, 'R3': None},
+        )
+        self.assertEqual(self.class_ids(self.second), {self.classes[0].id, self.classes[2].id})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE)
+class AsyncStudentViewTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = Dataset(3)
+        cls.token = cls.data.tokens[cls.data.student_user.pk].access_token
+    
+    def setUp(self):
+        cache.clear()
+        self.sync_client = APIClient()
+        self.sync_client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+    
+    async def async_request(self, method, url, data=None, authenticated=True):
+        headers = {'Authorization': f'Bearer {self.token}'} if authenticated else {}
+        with override_settings(ROOT_URLCONF=student_urlconf(async_views)):
+            return await getattr(AsyncClient(), method)(url, data, headers=headers)
+    
+    async def test_listings_match_the_sync_views(self):
+        class_id = self.data.class_obj.id
+        answers_url = f"{reverse('student_answers')}?class_id={class_id}"
+        for url in (
+            reverse('student_classes'),
+            f"{reverse('student_questions')}?class_id={class_id}",
+            answers_url,
+            f'{answers_url}&page_size=2',
+            f'{answers_url}&since=',
+        ):
+            with self.subTest(url=url):
+                expected = await sync_to_async(self.sync_client.get)(url)
+                response = await self.async_request('get', url)
+                
+                self.assertEqual(response.status_code, 200)
+                # A delta's cursor is the time of the poll
+                actual, expected = response.json(), expected.json()
+                if isinstance(actual, dict):
+                    actual.pop('cursor', None)
+                    expected.pop('cursor', None)
+                self.assertEqual(actual, expected)
+    
+    async def test_submit_answer_stores_the_image(self):
+        response = await self.async_request('post', reverse('student_submit_answer'), {
+            'question_id': self.data.question.id, 'image': image_upload(42),
+        })
+        
+        self.assertEqual(response.status_code, 202, response.content)
+        answer = await Answer.objects.aget(id=response.json()['id'])
+        self.assertEqual(answer.student_id, self.data.student.id)
+        # Stored as it came, for its image job to normalize
+        with answer.image.open('rb') as f:
+            self.assertEqual(f.read(), image_bytes(42))
+        self.assertEqual((answer.status, answer.image_width), (ImageStatus.PROCESSING, None))
+        self.assertEqual((await MediaBlob.objects.aget(name=answer.image.name)).ref_count, 1)
+    
+    async def test_rejections(self):
+        submit_url = reverse('student_submit_answer')
+        
+        anonymous = await self.async_request('get', reverse('student_classes'), authenticated=False)
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertEqual((await self.async_request('post', reverse('student_classes'))).status_code, 405)
+        not_enrolled = await self.async_request('get', f"{reverse('student_answers')}?class_id=0")
+        self.assertEqual(not_enrolled.status_code, 404)
+        self.assertEqual((await self.async_request('post', submit_url, {'question_id': 0})).status_code, 404)
+        invalid = await self.async_request('post', submit_url, {
+            'question_id': self.data.question.id, 'image': SimpleUploadedFile('answer.png', b'not an image'),
+        })
+        self.assertEqual(invalid.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_JOBS_ASYNC=True, CACHES=LOCMEM_CACHE)
+class ConcurrencyBenchmarkTests(TransactionTestCase):
+    # Requests run on other threads, so the dataset has to be committed
+    
+    def test_both_modes_serve_every_session(self):
+        # A single student, since SQLite test databases in memory fail
+        # concurrent writes instead of waiting for the lock
+        call_command(
+            'generate_dataset', instructors=1, classes=1, students=1, questions=2, answers=1, images=2,
+            prefix='burst', stdout=StringIO()
+        )
+        
+        results = run_concurrency(session_factory('burst'), threads=2)
+        
+        for mode in ('wsgi', 'asgi'):
+            self.assertEqual(results[mode]['requests'], 4)
+            self.assertEqual(results[mode]['errors'], {})
+            self.assertEqual(set(results[mode]['endpoints']), {
+                'student_classes', 'student_questions', 'student_submit_answer', 'student_answers',
+            })
+        self.assertEqual(Answer.objects.count(), 2 + 2)
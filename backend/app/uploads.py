@@ -0,0 +1,154 @@
+"""
+Storage of in-progress chunked uploads.
+
+Each UploadSession has a ``<id>.part`` file under ``CHUNKED_UPLOAD_DIR``.
+Chunks are streamed from the request body straight into it at their offset,
+so a request never holds more than one read buffer in memory, and the
+declared size is enforced as bytes arrive. The SHA-256 of the upload is
+computed as the chunks are written, so finalizing does not read the file
+again; the running digest is kept per session in the worker process, and
+a worker without it (another process, a restart) hashes the bytes already
+received before going on.
+
+A session that receives no chunk for UPLOAD_SESSION_EXPIRY seconds expires:
+the API no longer finds it, and prune_upload_sessions deletes it and its file.
+"""
+import hashlib
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
+
+from .models import UploadSession
+
+READ_SIZE = 64 * 1024
+
+# Running digests of in-progress uploads kept per process; the oldest are dropped past this many
+MAX_SESSION_DIGESTS = 1024
+
+# {session id: (bytes hashed, hashlib object)}
+_session_digests = {}
+_session_digests_lock = threading.Lock()
+
+
+class ChunkTooLarge(Exception):
+    """The chunk would extend the upload past its declared size."""
+
+
+def expiry_cutoff():
+    """Sessions last written before this have expired."""
+    return timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_EXPIRY)
+
+
+def active_sessions():
+    return UploadSession.objects.filter(updated_at__gte=expiry_cutoff())
+
+
+def session_path(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.id}.part')
+
+
+def create_session_file(session):
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(session_path(session), 'wb').close()
+
+
+def session_digest(session, f, offset):
+    """
+    A copy of the running digest of the session's first `offset` bytes,
+    hashing them from the open file `f` when this process has no digest
+    of exactly that length.
+    """
+    with _session_digests_lock:
+        hashed, digest = _session_digests.get(session.id, (None, None))
+    if hashed == offset:
+        return digest.copy()
+    
+    digest = hashlib.sha256()
+    f.seek(0)
+    remaining = offset
+    while remaining:
+        block = f.read(min(READ_SIZE, remaining))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    return digest
+
+
+def remember_digest(session, hashed, digest):
+    with _session_digests_lock:
+        _session_digests.pop(session.id, None)
+        _session_digests[session.id] = (hashed, digest)
+        while len(_session_digests) > MAX_SESSION_DIGESTS:
+            del _session_digests[next(iter(_session_digests))]
+
+
+def forget_digest(session):
+    with _session_digests_lock:
+        _session_digests.pop(session.id, None)
+
+
+def write_chunk(session, offset, stream):
+    """
+    Stream a chunk from `stream` into the session file at `offset`,
+    updating the session's running SHA-256 with it. Returns the number of
+    bytes written; raises ChunkTooLarge as soon as the data would pass the
+    session's declared size.
+    """
+    written = 0
+    with open(session_path(session), 'r+b') as f:
+        digest = session_digest(session, f, offset)
+        f.seek(offset)
+        while True:
+            data = stream.read(READ_SIZE) if stream is not None else b''
+            if not data:
+                break
+            if offset + written + len(data) > session.size:
+                raise ChunkTooLarge()
+            f.write(data)
+            digest.update(data)
+            written += len(data)
+    # Only a complete chunk moves the digest, as only it moves the session's offset
+    remember_digest(session, offset + written, digest)
+    return written
+
+
+def file_sha256(path):
+    """SHA-256 of a file, computed incrementally."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def session_sha256(session):
+    """
+    SHA-256 of a completed upload: the digest kept by write_chunk, or the
+    file's own when this process did not write the last chunk.
+    """
+    with _session_digests_lock:
+        hashed, digest = _session_digests.get(session.id, (None, None))
+    if hashed == session.size:
+        return digest.hexdigest()
+    return file_sha256(session_path(session))
+
+
+def open_session_upload(session):
+    """Open the completed upload as an UploadedFile for the serializers."""
+    path = session_path(session)
+    # Drop any bytes past the declared size left by a rejected chunk
+    os.truncate(path, session.size)
+    return UploadedFile(file=open(path, 'rb'), name=session.filename, size=session.size)
+
+
+def delete_session_file(session):
+    forget_digest(session)
+    try:
+        os.remove(session_path(session))
+    except FileNotFoundError:
+        pass
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
-from . import views
+from . import async_views, views
 
 # Create router for ViewSets
 router = DefaultRouter()
@@ -10,14 +11,29 @@ router.register(r'students', views.StudentViewSet)
 router.register(r'questions', views.QuestionViewSet, basename='question')
 router.register(r'answers', views.AnswerViewSet, basename='answer')
 
+
+def student_urlpatterns(student_views):
+    """The student API routes, served by `student_views` (views, or async_views under ASGI)."""
+    return [
+        path('student/classes/', student_views.student_classes, name='student_classes'),
+        path('student/questions/', student_views.student_questions, name='student_questions'),
+        path('student/answers/', student_views.student_answers, name='student_answers'),
+        path('student/submit-answer/', student_views.student_submit_answer, name='student_submit_answer'),
+    ]
+
+
 urlpatterns = [
     path('health/', views.health_check, name='health_check'),
     path('auth/login/', views.CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('student/classes/', views.student_classes, name='student_classes'),
-    path('student/questions/', views.student_questions, name='student_questions'),
-    path('student/answers/', views.student_answers, name='student_answers'),
-    path('student/submit-answer/', views.student_submit_answer, name='student_submit_answer'),
+    *student_urlpatterns(async_views if settings.ASYNC_STUDENT_VIEWS else views),
+    path('student/events/', views.student_answer_events, name='student_answer_events'),
+    path('events/answers/', views.answer_events, name='answer_events'),
+    path('signed-urls/', views.signed_urls, name='signed_urls'),
+    path('uploads/', views.upload_sessions, name='upload_sessions'),
+    path('uploads/<uuid:session_id>/', views.upload_session_detail, name='upload_session_detail'),
+    path('uploads/<uuid:session_id>/finalize/', views.finalize_upload_session, name='finalize_upload_session'),
     path('instructor/class-answers/', views.instructor_class_answers, name='instructor_class_answers'),
+    path('instructor/export-answers/', views.export_answers, name='export_answers'),
     path('', include(router.urls)),
 ]
@@ -1,13 +1,59 @@
-from rest_framework.decorators import api_view, permission_classes
+import hashlib
+import io
+import mimetypes
+import os
+from datetime import timedelta
+from stat import S_ISREG
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.http import parse_etags
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import viewsets
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import Class, Student, Question, Answer, Instructor
-from .serializers import ClassSerializer, StudentSerializer, QuestionSerializer, AnswerSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.utils import timezone
+from .authentication import ClaimsJWTAuthentication, SignedURLAuthentication, is_user_active, remember_user
+from .models import Class, Student, Question, Answer, AnswerTombstone, Instructor, ImageStatus, UploadSession, ImageJob
+from .serializers import ClassSerializer, StudentSerializer, QuestionSerializer, AnswerSerializer, UploadSessionSerializer
+from .cursors import encode_cursor, decode_cursor
+from .pagination import KeysetPagination
+from .projections import (
+    AnswerProjection, ClassProjection, ProjectedListMixin, QuestionProjection, StudentProjection,
+)
+from .caching import (
+    CachedListMixin, cached_response, class_version, fields_variant, request_variant, student_dependencies,
+)
+from .images import derivative_source
+from .media import release_blobs
+from .signals import answers_recorded_in_bulk
+from .stats import class_stats, move_counters, row_change
+from .signed_urls import sign_request_path, signed_request_user_id, valid_media_signature
+from .storage import is_hashed_name, media_storage
+from .exports import answer_export
+from .mosaics import MAX_COLUMNS, MAX_TILE_SIZE, MIN_TILE_SIZE, MosaicLayout, question_mosaic
+from .ranges import parse_range
+from .imports import InvalidSlides, archive_slides, import_deck, import_roster, parse_manifest
+from .events import publish_answer_event, event_stream, question_channel, student_channel
+from .uploads import (
+    ChunkTooLarge, active_sessions, create_session_file, write_chunk, session_sha256,
+    open_session_upload, delete_session_file,
+)
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -23,12 +69,109 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['user_id'] = user.id
         token['username'] = user.username
         token['name'] = user.name
+        token['student_ids'] = list(user.student_records.values_list('id', flat=True))
         
+        # The user was just loaded, so their requests can skip the activity check for a while
+        remember_user(user)
         return token
+    
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        # Record the login at most once per LAST_LOGIN_UPDATE_INTERVAL instead of writing on every one
+        last_login = self.user.last_login
+        if last_login is None or (timezone.now() - last_login).total_seconds() > settings.LAST_LOGIN_UPDATE_INTERVAL:
+            update_last_login(None, self.user)
+        return data
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
+
+def answer_delta_response(request, answers, tombstones):
+    """
+    Build a delta response for answer listings polled with ?since=<cursor>.
+    
+    Returns answers created or updated (e.g. re-liked) after the cursor, the
+    ids of answers deleted after it, and a new cursor to send on the next poll.
+    An empty cursor returns the full list so clients can bootstrap. Answers
+    are serialized like the other listings, narrowed to the ?fields= asked
+    for (see AnswerProjection).
+    
+    The cursor is the time of the poll. Timestamps are taken before their
+    transaction commits, so a row can become visible after a poll that is
+    already past it; every poll therefore reads ANSWER_DELTA_OVERLAP seconds
+    below the cursor again, and clients apply results and deletions by id
+    (a change is repeated for that long). A cursor older than
+    ANSWER_TOMBSTONE_RETENTION, whose deletions may have been pruned, gets
+    the full list with "reset": true, to replace the client's copy.
+    """
+    try:
+        since = decode_cursor(request.query_params.get('since'))
+    except ValidationError:
+        return Response({"error": "Invalid cursor"}, status=400)
+    try:
+        projection = AnswerProjection(request)
+    except ValidationError as e:
+        return Response({"error": str(e.detail[0])}, status=400)
+    
+    now = timezone.now()
+    reset = since is not None and since < now - timedelta(seconds=settings.ANSWER_TOMBSTONE_RETENTION)
+    if since is not None and not reset:
+        window = since - timedelta(seconds=settings.ANSWER_DELTA_OVERLAP)
+        answers = answers.filter(updated_at__gt=window)
+        deleted = list(tombstones.filter(deleted_at__gt=window).values_list('answer_id', flat=True))
+    else:
+        deleted = []
+    
+    return Response({
+        "results": projection.data(answers),
+        "deleted": deleted,
+        "cursor": encode_cursor(now),
+        "reset": reset,
+    })
+
+def student_ids_for(request, refresh=False):
+    """
+    Ids of the current user's Student records (one per enrolled class).
+    
+    Read from the token's student_ids claim so the hot path needs no query.
+    The claim is only a hint: it can outlive a record that was since deleted
+    or linked to another user, so access to a class goes through
+    enrolled_student, and refresh=True reads the records from the database.
+    That is also done when the token predates the claim, or when the claim
+    is empty. Raises Student.DoesNotExist if the user has no student records.
+    """
+    claim = None if refresh or request.auth is None else request.auth.get('student_ids')
+    student_ids = claim or list(request.user.student_records.values_list('id', flat=True))
+    if not student_ids:
+        raise Student.DoesNotExist
+    return student_ids
+
+def enrolled_student(request, class_id):
+    """
+    The current user's Student record in a class, or None if not enrolled.
+    Looked up by user rather than from the token's claim, which may be stale.
+    """
+    return Student.objects.select_related('class_enrolled').filter(class_enrolled_id=class_id, user=request.user).first()
+
+def paginated_answer_response(request, answers):
+    """
+    Serialize an answer listing, one keyset page at a time when ?page_size=
+    is given (see KeysetPagination), or in full otherwise, narrowed to the
+    ?fields= asked for.
+    """
+    paginator = KeysetPagination()
+    try:
+        projection = AnswerProjection(request)
+        rows = projection.queryset(answers)
+        page = paginator.paginate_queryset(rows, request)
+    except ValidationError as e:
+        return Response({"error": str(e.detail[0])}, status=400)
+    
+    if page is None:
+        return Response(projection.serialize(rows))
+    return paginator.get_paginated_response(projection.serialize(page))
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def health_check(request):
@@ -44,15 +187,20 @@ def student_classes(request):
     Get classes that the current student is enrolled in.
     """
     try:
-        # Find the student record for the current user
-        student = Student.objects.get(name=request.user.name)
-        classes = Class.objects.filter(students=student)
+        # Make sure the current user has student records
+        student_ids_for(request)
+        projection = ClassProjection(request)
         
-        # Serialize the classes
-        from .serializers import ClassSerializer
-        serializer = ClassSerializer(classes, many=True, context={'request': request})
+        def build():
+            classes = Class.objects.filter(students__user=request.user).distinct()
+            return projection.data(classes)
         
-        return Response(serializer.data)
+        # Keyed by the user, whose version moves when a record is linked to or unlinked from them
+        return cached_response(
+            'student_classes', f'{request.user.id}:{fields_variant(request)}', student_dependencies(request.user), build
+        )
+    except ValidationError as e:
+        return Response({"error": str(e.detail[0])}, status=400)
     except Student.DoesNotExist:
         return Response({"error": "Student record not found"}, status=404)
     except Exception as e:
@@ -65,8 +213,8 @@ def student_questions(request):
     Get questions for classes that the current student is enrolled in.
     """
     try:
-        # Find the student record for the current user
-        student = Student.objects.get(name=request.user.name)
+        # Make sure the current user has student records
+        student_ids_for(request)
         
         # Get the class_id parameter
         class_id = request.query_params.get('class_id')
@@ -74,19 +222,22 @@ def student_questions(request):
             return Response({"error": "class_id parameter is required"}, status=400)
         
         # Verify the student is enrolled in this class
-        try:
-            class_obj = Class.objects.get(id=class_id, students=student)
-        except Class.DoesNotExist:
+        student = enrolled_student(request, class_id)
+        if student is None:
             return Response({"error": "Class not found or you are not enrolled in this class"}, status=404)
+        class_obj = student.class_enrolled
         
-        # Get questions for this class
-        questions = Question.objects.filter(class_related=class_obj)
+        # Questions are the same for every student in the class, so share one cache entry
+        projection = QuestionProjection(request)
         
-        # Serialize the questions
-        from .serializers import QuestionSerializer
-        serializer = QuestionSerializer(questions, many=True, context={'request': request})
+        def build():
+            return projection.data(Question.objects.filter(class_related=class_obj))
         
-        return Response(serializer.data)
+        return cached_response(
+            'class_questions', f'{class_obj.id}:{request_variant(request)}', [class_version(class_obj.id)], build
+        )
+    except ValidationError as e:
+        return Response({"error": str(e.detail[0])}, status=400)
     except Student.DoesNotExist:
         return Response({"error": "Student record not found"}, status=404)
     except Exception as e:
@@ -99,8 +250,8 @@ def student_answers(request):
     Get answers submitted by the current student for a specific class.
     """
     try:
-        # Find the student record for the current user
-        student = Student.objects.get(name=request.user.name)
+        # Make sure the current user has student records
+        student_ids_for(request)
         
         # Get the class_id parameter
         class_id = request.query_params.get('class_id')
@@ -108,27 +259,66 @@ def student_answers(request):
             return Response({"error": "class_id parameter is required"}, status=400)
         
         # Verify the student is enrolled in this class
-        try:
-            class_obj = Class.objects.get(id=class_id, students=student)
-        except Class.DoesNotExist:
+        student = enrolled_student(request, class_id)
+        if student is None:
             return Response({"error": "Class not found or you are not enrolled in this class"}, status=404)
+        class_obj = student.class_enrolled
         
         # Get answers submitted by this student for questions in this class
         answers = Answer.objects.filter(
             student=student,
             question__class_related=class_obj
-        ).select_related('question')
+        ).select_related('student', 'question')
         
-        # Serialize the answers
-        from .serializers import AnswerSerializer
-        serializer = AnswerSerializer(answers, many=True, context={'request': request})
+        # Delta mode: only return changes since the client's cursor
+        if 'since' in request.query_params:
+            tombstones = AnswerTombstone.objects.filter(student_id=student.id, class_id=class_obj.id)
+            return answer_delta_response(request, answers, tombstones)
         
-        return Response(serializer.data)
+        # Serialize the answers (optionally one keyset page at a time)
+        return paginated_answer_response(request, answers)
     except Student.DoesNotExist:
         return Response({"error": "Student record not found"}, status=404)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
+def submit_answer(request, data):
+    """
+    Validate and create an answer by the current student from `data`
+    (question_id and image). Shared by the multipart submit endpoint and
+    chunked upload finalize. Raises Student.DoesNotExist for non-students.
+    """
+    # Make sure the current user has student records
+    student_ids_for(request)
+    
+    # Get the question_id from the request
+    question_id = data.get('question_id')
+    if not question_id:
+        return Response({"error": "question_id is required"}, status=400)
+    
+    # Verify the question exists and the student is enrolled in the class
+    try:
+        question = Question.objects.select_related('class_related').get(id=question_id)
+    except Question.DoesNotExist:
+        return Response({"error": "Question not found"}, status=404)
+    
+    student = enrolled_student(request, question.class_related_id)
+    if student is None:
+        return Response({"error": "You are not enrolled in this class"}, status=403)
+    
+    # Create the answer
+    serializer = AnswerSerializer(data=data, context={'request': request})
+    
+    if serializer.is_valid():
+        # Set the student and question
+        serializer.save(student=student, question=question)
+        publish_answer_event('answer.created', serializer.instance, serializer.data)
+        # 202 while the image is still being processed in the background
+        status_code = 202 if serializer.instance.status == ImageStatus.PROCESSING else 201
+        return Response(serializer.data, status=status_code)
+    else:
+        return Response(serializer.errors, status=400)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def student_submit_answer(request):
@@ -136,34 +326,7 @@ def student_submit_answer(request):
     Submit an answer for a question by a student.
     """
     try:
-        # Find the student record for the current user
-        student = Student.objects.get(name=request.user.name)
-        
-        # Get the question_id from the request
-        question_id = request.data.get('question_id')
-        if not question_id:
-            return Response({"error": "question_id is required"}, status=400)
-        
-        # Verify the question exists and the student is enrolled in the class
-        try:
-            question = Question.objects.select_related('class_related').get(id=question_id)
-            # Check if student is enrolled in the class
-            if not question.class_related.students.filter(id=student.id).exists():
-                return Response({"error": "You are not enrolled in this class"}, status=403)
-        except Question.DoesNotExist:
-            return Response({"error": "Question not found"}, status=404)
-        
-        # Create the answer
-        from .serializers import AnswerSerializer
-        serializer = AnswerSerializer(data=request.data, context={'request': request})
-        
-        if serializer.is_valid():
-            # Set the student and question
-            serializer.save(student=student, question=question)
-            return Response(serializer.data, status=201)
-        else:
-            return Response(serializer.errors, status=400)
-            
+        return submit_answer(request, request.data)
     except Student.DoesNotExist:
         return Response({"error": "Student record not found"}, status=404)
     except Exception as e:
@@ -192,40 +355,520 @@ def instructor_class_answers(request):
             question__class_related=class_obj
         ).select_related('student', 'question')
         
-        # Serialize the answers
-        from .serializers import AnswerSerializer
-        serializer = AnswerSerializer(answers, many=True, context={'request': request})
+        # Delta mode: only return changes since the client's cursor
+        if 'since' in request.query_params:
+            tombstones = AnswerTombstone.objects.filter(class_id=class_obj.id)
+            return answer_delta_response(request, answers, tombstones)
         
-        return Response(serializer.data)
+        # Serialize the answers (optionally one keyset page at a time)
+        return paginated_answer_response(request, answers)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
 
-class ClassViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication, SignedURLAuthentication])
+@permission_classes([IsAuthenticated])
+def export_answers(request):
+    """
+    Download every answer image of a class (class_id) or question
+    (question_id) as a ZIP with a manifest.csv, organised by question and
+    student. The archive is streamed as it is built; Range and If-Range
+    requests resume an interrupted download. Accepts signed URLs, so the
+    browser can download it straight to disk.
+    """
+    class_id = request.query_params.get('class_id', '')
+    question_id = request.query_params.get('question_id', '')
+    answers = Answer.objects.filter(
+        question__class_related__instructor=request.user
+    ).select_related('student', 'question').order_by('question_id', 'student__name', 'id')
+    
+    if question_id.isdigit():
+        if not Question.objects.filter(id=question_id, class_related__instructor=request.user).exists():
+            return Response({"error": "Question not found or you don't have permission to view it"}, status=404)
+        answers = answers.filter(question_id=question_id)
+        filename = f'question-{question_id}-answers.zip'
+    elif class_id.isdigit():
+        if not Class.objects.filter(id=class_id, instructor=request.user).exists():
+            return Response({"error": "Class not found or you don't have permission to view it"}, status=404)
+        answers = answers.filter(question__class_related_id=class_id)
+        filename = f'class-{class_id}-answers.zip'
+    else:
+        return Response({"error": "class_id or question_id parameter is required"}, status=400)
+    
+    archive = answer_export(answers.iterator(chunk_size=2000))
+    try:
+        byte_range = parse_range(request.headers.get('Range'), archive.size)
+    except ValueError:
+        return Response({"error": "Requested range not satisfiable"}, status=416,
+                        headers={'Content-Range': f'bytes */{archive.size}'})
+    # Resume only if the archive has not changed since the first part was sent
+    if byte_range and request.headers.get('If-Range', archive.etag) != archive.etag:
+        byte_range = None
+    start, end = byte_range or (0, archive.size - 1)
+    
+    response = StreamingHttpResponse(
+        archive.iter_range(start, end), content_type='application/zip', status=206 if byte_range else 200
+    )
+    response['Content-Length'] = end - start + 1
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = archive.etag
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{archive.size}'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_sessions(request):
+    """
+    Start a resumable chunked image upload. Takes filename, size and an
+    optional sha256 of the whole file; returns the session id and offset.
+    """
+    serializer = UploadSessionSerializer(data=request.data)
+    if serializer.is_valid():
+        session = serializer.save(owner=request.user)
+        create_session_file(session)
+        return Response(serializer.data, status=201)
+    return Response(serializer.errors, status=400)
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_session_detail(request, session_id):
+    """
+    GET the current offset of an upload (to resume), PUT the next chunk as
+    the raw request body with ?offset=<current offset>, or DELETE to abort.
+    """
+    try:
+        session = active_sessions().get(id=session_id, owner=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({"error": "Upload session not found"}, status=404)
+    
+    if request.method == 'GET':
+        return Response(UploadSessionSerializer(session).data)
+    
+    if request.method == 'DELETE':
+        delete_session_file(session)
+        session.delete()
+        return Response(status=204)
+    
+    # Chunks must be sent in order; a mismatched offset tells the client where to resume
+    offset = request.query_params.get('offset', '')
+    if not offset.isdigit():
+        return Response({"error": "offset parameter is required"}, status=400)
+    offset = int(offset)
+    if offset != session.received:
+        return Response({"error": "Offset does not match the uploaded size", "offset": session.received}, status=409)
+    
+    # Reject oversized chunks from Content-Length before reading the body
+    content_length = request.META.get('CONTENT_LENGTH')
+    if content_length and content_length.isdigit() and offset + int(content_length) > session.size:
+        return Response({"error": "Chunk exceeds the declared upload size", "offset": session.received}, status=413)
+    
+    try:
+        written = write_chunk(session, offset, request.stream)
+    except ChunkTooLarge:
+        return Response({"error": "Chunk exceeds the declared upload size", "offset": session.received}, status=413)
+    
+    # Only advance if no concurrent request moved the offset meanwhile
+    updated = UploadSession.objects.filter(id=session.id, received=offset).update(
+        received=offset + written,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        received = UploadSession.objects.filter(id=session.id).values_list('received', flat=True).first()
+        if received is None:
+            return Response({"error": "Upload session not found"}, status=404)
+        return Response({"error": "Offset does not match the uploaded size", "offset": received}, status=409)
+    
+    return Response({"id": str(session.id), "offset": offset + written, "size": session.size})
+
+def create_question_from_upload(request, upload):
+    """Create a question in one of the instructor's classes with an uploaded image."""
+    class_id = request.data.get('class_id')
+    if not class_id:
+        return Response({"error": "class_id is required"}, status=400)
+    
+    try:
+        class_obj = Class.objects.get(id=class_id, instructor=request.user)
+    except Class.DoesNotExist:
+        return Response({"error": "You can only create questions for your own classes"}, status=403)
+    
+    data = {'question_text': request.data.get('question_text'), 'image': upload}
+    serializer = QuestionSerializer(data=data, context={'request': request})
+    if serializer.is_valid():
+        serializer.save(class_related=class_obj)
+        status_code = 202 if serializer.instance.status == ImageStatus.PROCESSING else 201
+        return Response(serializer.data, status=status_code)
+    return Response(serializer.errors, status=400)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalize_upload_session(request, session_id):
+    """
+    Verify a completed chunked upload and attach it to a new answer
+    (target=answer, question_id; for students) or question
+    (target=question, class_id, question_text; for instructors).
+    """
+    try:
+        try:
+            session = active_sessions().get(id=session_id, owner=request.user)
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload session not found"}, status=404)
+        
+        if session.received != session.size:
+            return Response({"error": "Upload is incomplete", "offset": session.received}, status=400)
+        
+        if session.sha256 and session_sha256(session) != session.sha256:
+            delete_session_file(session)
+            session.delete()
+            return Response({"error": "Uploaded file does not match the expected sha256"}, status=400)
+        
+        target = request.data.get('target', 'answer')
+        if target not in ('answer', 'question'):
+            return Response({"error": "target must be 'answer' or 'question'"}, status=400)
+        
+        upload = open_session_upload(session)
+        try:
+            if target == 'answer':
+                try:
+                    response = submit_answer(request, {'question_id': request.data.get('question_id'), 'image': upload})
+                except Student.DoesNotExist:
+                    return Response({"error": "Student record not found"}, status=404)
+            else:
+                response = create_question_from_upload(request, upload)
+        finally:
+            upload.close()
+        
+        # Keep the session on failure so the client can correct the request and retry
+        if response.status_code < 300:
+            delete_session_file(session)
+            session.delete()
+        return response
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+
+def validated_request_token(request):
+    """
+    The validated access token of a request, from the Authorization header,
+    or None. Requests that cannot send the header (EventSource, <img>) use
+    signed URLs instead (see signed_urls.py).
+    """
+    authenticator = ClaimsJWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    
+    try:
+        return authenticator.get_validated_token(raw_token)
+    except InvalidToken:
+        return None
+
+
+def can_view_media(user_id, name):
+    """
+    Whether a user may see a stored image (or one of its derivatives): an
+    instructor sees the images of their classes, a student their own
+    answers and the questions of their classes. One query on the indexed
+    image column.
+    """
+    name = derivative_source(name) or name
+    if name.startswith(Answer._meta.get_field('image').upload_to):
+        images = Answer.objects.filter(image=name).filter(
+            Q(question__class_related__instructor_id=user_id) | Q(student__user_id=user_id)
+        )
+    elif name.startswith(Question._meta.get_field('image').upload_to):
+        images = Question.objects.filter(image=name).filter(
+            Q(class_related__instructor_id=user_id) | Q(class_related__students__user_id=user_id)
+        )
+    else:
+        return False
+    return images.exists()
+
+
+def media_etag(name, stat):
+    """
+    Strong ETag and Cache-Control of a media file. Content-addressed files
+    (and their derivatives) never change, so browsers may keep them for good.
+    """
+    source = derivative_source(name) or name
+    if is_hashed_name(source):
+        digest = hashlib.sha256(name.encode()).hexdigest()[:32]
+        return f'"{digest}"', 'private, max-age=31536000, immutable'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', 'private, no-cache'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header lists `etag` (weakly compared, as the
+    header requires) or is '*'.
+    """
+    etags = parse_etags(if_none_match or '')
+    return etags == ['*'] or any(tag.removeprefix('W/') == etag for tag in etags)
+
+
+def serve_media(request, name):
+    """
+    Serve an uploaded image to the holder of its signed URL (see
+    signed_urls.py), or to an active user allowed to see it (see can_view_media)
+    authenticated by the Authorization header. Sending the bytes is handed to the web server when MEDIA_SENDFILE is set
+    ('x-accel-redirect' for nginx, 'x-sendfile' for Apache); otherwise
+    they are streamed with FileResponse, honouring Range requests.
+    """
+    signed = valid_media_signature(name, request.GET.get('signature', ''))
+    token = None if signed else validated_request_token(request)
+    # Deactivated users are refused like a bad token, as by ClaimsJWTAuthentication
+    if not signed and (token is None or not is_user_active(token[jwt_settings.USER_ID_CLAIM])):
+        return JsonResponse({"error": "Authentication credentials were not provided or are invalid"}, status=401)
+    if request.method not in ('GET', 'HEAD'):
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    
+    storage = media_storage()
+    try:
+        path = storage.path(name)
+        stat = os.stat(path)
+    except (OSError, SuspiciousFileOperation):
+        stat = None
+    # Missing and forbidden files look the same, so neither reveals the other
+    if stat is None or not S_ISREG(stat.st_mode) or not (signed or can_view_media(token[jwt_settings.USER_ID_CLAIM], name)):
+        return JsonResponse({"error": "Not found"}, status=404)
+    
+    etag, cache_control = media_etag(name, stat)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+    elif settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+    elif settings.MEDIA_SENDFILE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if byte_range and request.headers.get('If-Range', etag) != etag:
+            byte_range = None
+        
+        f = open(path, 'rb')
+        if byte_range:
+            start, end = byte_range
+            f.seek(start)
+            if end == stat.st_size - 1:
+                # FileResponse sends from the current position, still via the server's file wrapper
+                response = FileResponse(f, content_type=content_type, status=206)
+            else:
+                response = StreamingHttpResponse(read_file_range(f, end - start + 1), content_type=content_type, status=206)
+                response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            response = FileResponse(f, content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def read_file_range(f, length, chunk_size=64 * 1024):
+    """Yield `length` bytes of an open file from its current position, then close it."""
+    with f:
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@sync_to_async
+def authenticate_async_request(request):
+    """
+    Authenticate a request to an async view, such as an event stream, by
+    its Authorization header (see validated_request_token) or a signed URL
+    (see signed_urls.py). Sets request.user and request.auth, and returns
+    the user (or None).
+    """
+    token = validated_request_token(request)
+    if token is None:
+        user_id = signed_request_user_id(request)
+        user = None if user_id is None else Instructor.objects.filter(pk=user_id, is_active=True).first()
+        request.auth, request.user = None, user
+        return user
+    
+    try:
+        request.auth = token
+        request.user = ClaimsJWTAuthentication().get_user(token)
+        return request.user
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+# Views that accept signed URLs, for clients that cannot send an Authorization header
+SIGNED_URL_VIEWS = ('answer_events', 'student_answer_events', 'export_answers')
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def signed_urls(request):
+    """
+    Sign `url` (a path and query string) for the current user, for clients
+    that cannot send an Authorization header, such as EventSource or a
+    download started by the browser. Only the
+    views in SIGNED_URL_VIEWS accept the result, for SIGNED_URL_MAX_AGE
+    seconds.
+    """
+    url = request.data.get('url')
+    if not isinstance(url, str):
+        return Response({"error": "url is required"}, status=400)
+    parts = urlsplit(url)
+    try:
+        view_name = resolve(parts.path).url_name
+    except Resolver404:
+        view_name = None
+    if view_name not in SIGNED_URL_VIEWS:
+        return Response({"error": "This URL cannot be signed"}, status=400)
+    
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != 'signature']
+    query.append(('signature', sign_request_path(request.user.pk, parts.path)))
+    return Response({
+        'url': request.build_absolute_uri(f'{parts.path}?{urlencode(query)}'),
+        'expires_in': getattr(settings, 'SIGNED_URL_MAX_AGE', 60),
+    })
+
+
+def event_streams_unavailable(request):
+    """
+    A 501 for an event stream requested from a WSGI server, which would
+    never send its first byte: clients fall back to polling.
+    """
+    if isinstance(request, ASGIRequest):
+        return None
+    return JsonResponse({"error": "Event streams need an ASGI server; poll the answer listings instead"}, status=501)
+
+
+def event_stream_response(channels):
+    response = StreamingHttpResponse(event_stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def answer_events(request):
+    """
+    Stream new, liked and deleted answers for a question as Server-Sent Events
+    (for the instructor presenting it). Requires an ASGI server.
+    """
+    unavailable = event_streams_unavailable(request)
+    if unavailable is not None:
+        return unavailable
+    
+    user = await authenticate_async_request(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided or are invalid"}, status=401)
+    
+    question_id = request.GET.get('question_id')
+    if not question_id or not question_id.isdigit():
+        return JsonResponse({"error": "question_id parameter is required"}, status=400)
+    
+    # Verify the question belongs to a class owned by the instructor
+    if not await Question.objects.filter(id=question_id, class_related__instructor=user).aexists():
+        return JsonResponse({"error": "Question not found or you don't have permission to view it"}, status=404)
+    
+    return event_stream_response([question_channel(question_id)])
+
+
+async def student_answer_events(request):
+    """
+    Stream events for the current student's own answers (e.g. being liked)
+    as Server-Sent Events. Requires an ASGI server.
+    """
+    unavailable = event_streams_unavailable(request)
+    if unavailable is not None:
+        return unavailable
+    
+    user = await authenticate_async_request(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided or are invalid"}, status=401)
+    
+    try:
+        # From the database: a stale claim could name a record now linked to another user
+        student_ids = await sync_to_async(student_ids_for)(request, refresh=True)
+    except Student.DoesNotExist:
+        return JsonResponse({"error": "Student record not found"}, status=404)
+    
+    return event_stream_response([student_channel(student_id) for student_id in student_ids])
+
+
+class ClassViewSet(CachedListMixin, ProjectedListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing classes. Instructors can only see their own classes.
     """
     queryset = Class.objects.all()
     serializer_class = ClassSerializer
+    projection_class = ClassProjection
     permission_classes = [IsAuthenticated]
+    cache_name = 'classes'
     
     def get_queryset(self):
         """Return only classes owned by the current instructor."""
-        return Class.objects.filter(instructor=self.request.user)
+        return Class.objects.select_related('instructor').filter(instructor=self.request.user)
     
     def perform_create(self, serializer):
         """Automatically assign the current instructor to the class."""
         serializer.save(instructor=self.request.user)
+    
+    @action(detail=True, methods=['post'])
+    def roster(self, request, pk=None):
+        """
+        Create or update the class's students from an uploaded CSV `file`
+        with roster_id, name and optional phone and email columns. Rows are
+        matched on roster_id, and email links a student to the account with
+        that email; invalid rows are reported per line and skipped.
+        """
+        # Spool the upload to disk so it is read row by row, whatever its size
+        request._request.upload_handlers = [TemporaryFileUploadHandler(request._request)]
+        class_obj = self.get_object()
+        
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({"error": "file is required"}, status=400)
+        
+        try:
+            result = import_roster(class_obj, io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+        except ValidationError as e:
+            return Response({"error": str(e.detail[0])}, status=400)
+        finally:
+            upload.close()
+        return Response(result.as_dict())
+    
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Answer count, liked count, participation rate and last answer time
+        of the class and of each of its questions, read from counters kept
+        up to date with every answer.
+        """
+        return Response(class_stats(self.get_object()))
 
 
-class QuestionViewSet(viewsets.ModelViewSet):
+class QuestionViewSet(CachedListMixin, ProjectedListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing questions. Instructors can only see questions from their own classes.
     """
     queryset = Question.objects.all()
     serializer_class = QuestionSerializer
+    projection_class = QuestionProjection
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
+    cache_name = 'questions'
+    cache_by_class = True
+    cache_per_request_variant = True
     
     def get_queryset(self):
         """Return only questions from classes owned by the current instructor."""
@@ -239,6 +882,13 @@ class QuestionViewSet(viewsets.ModelViewSet):
         # Only return questions from classes owned by the current instructor
         return queryset.filter(class_related__instructor=self.request.user)
     
+    def create(self, request, *args, **kwargs):
+        """Respond 202 while the question image is processed in the background."""
+        response = super().create(request, *args, **kwargs)
+        if response.data.get('status') == ImageStatus.PROCESSING:
+            response.status_code = 202
+        return response
+    
     def perform_create(self, serializer):
         """Verify class ownership and assign the class to the question."""
         class_id = self.request.data.get('class_id')
@@ -251,16 +901,160 @@ class QuestionViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You can only create questions for your own classes")
         
         serializer.save(class_related=class_obj)
+    
+    @action(detail=True, methods=['get'])
+    def mosaic(self, request, pk=None):
+        """
+        One JPEG contact sheet of the question's answers (thumbnails with
+        student names, liked answers framed) for the live slide. Optional
+        layout parameters: columns, tile (pixels) and labels=0.
+        """
+        try:
+            columns = int(request.query_params.get('columns', MosaicLayout().columns))
+            tile = int(request.query_params.get('tile', MosaicLayout().tile))
+        except ValueError:
+            return Response({"error": "columns and tile must be numbers"}, status=400)
+        if not 1 <= columns <= MAX_COLUMNS:
+            return Response({"error": f"columns must be between 1 and {MAX_COLUMNS}"}, status=400)
+        if not MIN_TILE_SIZE <= tile <= MAX_TILE_SIZE:
+            return Response({"error": f"tile must be between {MIN_TILE_SIZE} and {MAX_TILE_SIZE}"}, status=400)
+        labels = request.query_params.get('labels', '1') not in ('0', 'false')
+        
+        question = self.get_object()
+        image, etag, drawn = question_mosaic(question.id, MosaicLayout(columns, tile, labels))
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(image, content_type='image/jpeg')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['X-Mosaic-Tiles-Drawn'] = drawn
+        return response
+    
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_deck(self, request):
+        """
+        Create one question per slide from a whole deck: a ZIP `archive` or
+        several `images` files, plus an optional JSON `manifest` of question
+        texts. Returns the created question ids in slide order.
+        """
+        # Spool every upload to disk so a large deck is never held in memory
+        request._request.upload_handlers = [TemporaryFileUploadHandler(request._request)]
+        
+        class_id = request.data.get('class_id')
+        if not class_id:
+            return Response({"error": "class_id is required"}, status=400)
+        try:
+            class_obj = Class.objects.get(id=class_id, instructor=request.user)
+        except Class.DoesNotExist:
+            return Response({"error": "You can only create questions for your own classes"}, status=403)
+        
+        slides = []
+        try:
+            if 'archive' in request.FILES:
+                slides, manifest = archive_slides(request.FILES['archive'])
+                manifest = request.data.get('manifest') or manifest
+            else:
+                slides = request.FILES.getlist('images')
+                manifest = request.data.get('manifest')
+            questions = import_deck(class_obj, slides, parse_manifest(manifest))
+        except InvalidSlides as e:
+            return Response({"error": str(e), "slides": e.slides}, status=400)
+        except ValidationError as e:
+            return Response({"error": str(e.detail[0])}, status=400)
+        finally:
+            for slide in slides:
+                slide.close()
+        
+        processing = any(question.status == ImageStatus.PROCESSING for question in questions)
+        return Response({"ids": [question.id for question in questions]}, status=202 if processing else 201)
 
 
-class AnswerViewSet(viewsets.ModelViewSet):
+BULK_ANSWER_ACTIONS = ('like', 'unlike', 'delete')
+MAX_BULK_ANSWER_IDS = 1000
+# Answers deleted (and tombstones inserted) per batch: one DELETE statement
+# of QuerySet.delete(), which deletes 100 rows per statement, and within
+# SQLite's 999 bound parameters, so deleting the same answers costs the same
+# number of queries on every backend
+BULK_DELETE_BATCH_SIZE = 100
+
+def bulk_answer_targets(request):
+    """
+    The answers a bulk request applies to, as dicts, fetched together with
+    the ownership check in one query and locked until the transaction ends,
+    so concurrent writes to them wait rather than act on stale rows. Targets
+    are either `ids` or a `question_id` with an optional `liked` filter, at
+    most MAX_BULK_ANSWER_IDS either way. Returns (rows, ids), where ids are
+    the requested ids (None when filtering by question). Call inside a
+    transaction.
+    """
+    data = request.data
+    answers = Answer.objects.filter(question__class_related__instructor=request.user)
+    ids = data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValidationError("ids must be a list of answer ids")
+        if len(ids) > MAX_BULK_ANSWER_IDS:
+            raise ValidationError(f"At most {MAX_BULK_ANSWER_IDS} ids can be given per request")
+        answers = answers.filter(id__in=ids)
+    elif data.get('question_id') is not None:
+        if not isinstance(data['question_id'], int) or isinstance(data['question_id'], bool):
+            raise ValidationError("question_id must be a question id")
+        answers = answers.filter(question_id=data['question_id'])
+        if 'liked' in data:
+            if not isinstance(data['liked'], bool):
+                raise ValidationError("liked must be true or false")
+            answers = answers.filter(liked=data['liked'])
+    else:
+        raise ValidationError("ids or question_id is required")
+    
+    # Locked in id order, as every bulk request locks them, so two cannot deadlock
+    rows = list(
+        answers.select_for_update(of=('self',)).order_by('id')
+        .values('id', 'question_id', 'student_id', 'question__class_related_id', 'image', 'liked')[:MAX_BULK_ANSWER_IDS + 1]
+    )
+    if len(rows) > MAX_BULK_ANSWER_IDS:
+        raise ValidationError(f"The question has more than {MAX_BULK_ANSWER_IDS} matching answers; give their ids in batches")
+    return rows, ids
+
+def bulk_delete_answers(rows):
+    """
+    Delete locked answer rows from bulk_answer_targets without per-row
+    queries: the per-row post_delete receivers are skipped (see
+    signals.answers_recorded_in_bulk) for a tombstone insert per batch of
+    BULK_DELETE_BATCH_SIZE rows, one batch of blob releases and one move of
+    the participation counters. Call inside the transaction that locked them.
+    """
+    for start in range(0, len(rows), BULK_DELETE_BATCH_SIZE):
+        batch = rows[start:start + BULK_DELETE_BATCH_SIZE]
+        # Their image jobs are deleted with them
+        with answers_recorded_in_bulk():
+            Answer.objects.filter(id__in=[row['id'] for row in batch]).delete()
+        AnswerTombstone.objects.bulk_create([
+            AnswerTombstone(
+                answer_id=row['id'],
+                question_id=row['question_id'],
+                student_id=row['student_id'],
+                class_id=row['question__class_related_id'],
+            )
+            for row in batch
+        ])
+    release_blobs(row['image'] for row in rows)
+    move_counters([row_change(row, -1, -int(row['liked'])) for row in rows])
+
+
+class AnswerViewSet(ProjectedListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing answers. Instructors can only see answers for questions in their classes.
     """
     queryset = Answer.objects.all()
     serializer_class = AnswerSerializer
+    projection_class = AnswerProjection
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
+    pagination_class = KeysetPagination
+    # Actions run in a transaction holding the answer's row lock (see get_queryset)
+    locking_actions = ('update', 'partial_update', 'destroy')
     
     def get_queryset(self):
         """Return only answers for questions in classes owned by the current instructor."""
@@ -282,9 +1076,13 @@ class AnswerViewSet(viewsets.ModelViewSet):
             return Answer.objects.select_related('student', 'question').filter(question=question)
         
         # For other actions (retrieve, update, destroy), filter by instructor's classes
-        return Answer.objects.select_related('student', 'question', 'question__class_related').filter(
+        queryset = Answer.objects.select_related('student', 'question', 'question__class_related').filter(
             question__class_related__instructor=self.request.user
         )
+        if self.action in self.locking_actions:
+            # Concurrent writes to the answer wait for this one instead of acting on a stale row
+            queryset = queryset.select_for_update(of=('self',))
+        return queryset
     
     def perform_create(self, serializer):
         """Verify question and student belong to the same class."""
@@ -312,42 +1110,121 @@ class AnswerViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Student must be enrolled in the same class as the question")
         
         serializer.save(question=question, student=student)
+        publish_answer_event('answer.created', serializer.instance, serializer.data)
     
-    def update(self, request, *args, **kwargs):
-        """Allow updating only the 'liked' field."""
-        instance = self.get_object()
-        
-        # Only allow updating the 'liked' field
-        if 'liked' not in request.data or len(request.data) > 1:
-            raise ValidationError("Only the 'liked' field can be updated")
-        
-        return super().update(request, *args, **kwargs)
+    def create(self, request, *args, **kwargs):
+        """Respond 202 while the answer image is processed in the background."""
+        response = super().create(request, *args, **kwargs)
+        if response.data.get('status') == ImageStatus.PROCESSING:
+            response.status_code = 202
+        return response
+    
+    def perform_update(self, serializer):
+        """Save the like toggle and notify live listeners."""
+        serializer.save()
+        publish_answer_event('answer.updated', serializer.instance, serializer.data)
     
     def destroy(self, request, *args, **kwargs):
-        """Delete the answer and its associated image file."""
-        instance = self.get_object()
+        """Delete the answer with its row locked, so a bulk delete cannot record its deletion twice."""
+        with transaction.atomic(savepoint=False):
+            return super().destroy(request, *args, **kwargs)
+    
+    def perform_destroy(self, instance):
+        """
+        Delete the answer and notify live listeners. The image file is removed
+        by the post_delete signal once no other row references the same content.
+        """
+        answer_id = instance.id
+        instance.delete()
+        publish_answer_event('answer.deleted', instance, {'id': answer_id})
+    
+    def list(self, request, *args, **kwargs):
+        """List answers for a question, or only the changes when ?since= is given."""
+        if 'since' not in request.query_params:
+            return super().list(request, *args, **kwargs)
         
-        # Delete the image file if it exists
-        if instance.image:
-            try:
-                instance.image.delete(save=False)
-            except:
-                pass  # Continue even if file deletion fails
+        answers = self.get_queryset()
+        tombstones = AnswerTombstone.objects.filter(question_id=request.query_params['question_id'])
+        return answer_delta_response(request, answers, tombstones)
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Like, unlike or delete many answers at once. Takes `action` and either
+        `ids` or `question_id` (optionally with `liked` to match) and reports
+        a status per answer: liked, unliked, unchanged, deleted or not_found.
+        """
+        action_name = request.data.get('action')
+        if action_name not in BULK_ANSWER_ACTIONS:
+            return Response({"error": f"action must be one of: {', '.join(BULK_ANSWER_ACTIONS)}"}, status=400)
+        try:
+            projection = AnswerProjection(request)
+            with transaction.atomic():
+                rows, ids = bulk_answer_targets(request)
+                statuses = self.apply_bulk_action(action_name, rows, projection)
+        except ValidationError as e:
+            return Response({"error": str(e.detail[0])}, status=400)
         
-        return super().destroy(request, *args, **kwargs)
+        if ids is not None:
+            statuses = {answer_id: statuses.get(answer_id, 'not_found') for answer_id in ids}
+        return Response({"results": [{"id": answer_id, "status": status} for answer_id, status in statuses.items()]})
+    
+    def apply_bulk_action(self, action_name, rows, projection):
+        """Apply a bulk action to locked rows from bulk_answer_targets; returns {id: status}."""
+        statuses = {}
+        if action_name == 'delete':
+            bulk_delete_answers(rows)
+            for row in rows:
+                statuses[row['id']] = 'deleted'
+                answer = Answer(id=row['id'], question_id=row['question_id'], student_id=row['student_id'])
+                publish_answer_event('answer.deleted', answer, {'id': row['id']})
+        else:
+            liked = action_name == 'like'
+            # Conditional as well, so the counters only move for rows this update changed
+            changed = {row['id'] for row in rows if row['liked'] != liked}
+            Answer.objects.filter(id__in=changed, liked=not liked).update(liked=liked, updated_at=timezone.now())
+            move_counters([row_change(row, 0, 1 if liked else -1) for row in rows if row['id'] in changed])
+            for row in rows:
+                statuses[row['id']] = ('liked' if liked else 'unliked') if row['id'] in changed else 'unchanged'
+            
+            # Live listeners get the same payload as for a single like toggle, read in one query
+            payloads = projection.data(Answer.objects.filter(id__in=changed).order_by('id'))
+            targets = [row for row in rows if row['id'] in changed]
+            for row, payload in zip(targets, payloads):
+                answer = Answer(id=row['id'], question_id=row['question_id'], student_id=row['student_id'])
+                publish_answer_event('answer.updated', answer, payload)
+        return statuses
+    
+    def update(self, request, *args, **kwargs):
+        """
+        Allow updating only the 'liked' field. The row stays locked until the
+        save, so the counters move from the answer's current value and two
+        identical toggles at once count once.
+        """
+        with transaction.atomic(savepoint=False):
+            instance = self.get_object()
+            
+            # Only allow updating the 'liked' field
+            if 'liked' not in request.data or len(request.data) > 1:
+                raise ValidationError("Only the 'liked' field can be updated")
+            
+            return super().update(request, *args, **kwargs)
 
 
-class StudentViewSet(viewsets.ModelViewSet):
+class StudentViewSet(CachedListMixin, ProjectedListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing students. Only shows students from classes owned by the current instructor.
     """
     queryset = Student.objects.all()
     serializer_class = StudentSerializer
+    projection_class = StudentProjection
     permission_classes = [IsAuthenticated]
+    cache_name = 'students'
+    cache_by_class = True
     
     def get_queryset(self):
         """Return only students from classes owned by the current instructor."""
-        queryset = Student.objects.filter(class_enrolled__instructor=self.request.user)
+        queryset = Student.objects.select_related('class_enrolled').filter(class_enrolled__instructor=self.request.user)
         
         # Filter by class_id if provided
         class_id = self.request.query_params.get('class_id', None)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Serve the student API with the async views (app/async_views.py)
+os.environ.setdefault('ASYNC_STUDENT_VIEWS', 'True')
 
 application = get_asgi_application()
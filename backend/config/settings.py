@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.middleware.QueryCountMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -83,7 +85,7 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-# Database configuration - PostgreSQL only
+# Database configuration - PostgreSQL, or SQLite with DB_ENGINE=sqlite3 for local benchmarks
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -95,6 +97,14 @@ DATABASES = {
     }
 }
 
+if os.getenv('DB_ENGINE') == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -137,6 +147,38 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Content-addressed media layout (app/storage.py): the leading hex digits of each file's hash,
+# MEDIA_SHARD_LEVELS directories deep with MEDIA_SHARD_WIDTH digits each (16 ** width entries per
+# directory). After changing it, move existing files with `manage.py reshard_media`.
+MEDIA_SHARD_LEVELS = int(os.getenv('MEDIA_SHARD_LEVELS', '2'))
+MEDIA_SHARD_WIDTH = int(os.getenv('MEDIA_SHARD_WIDTH', '2'))
+
+# After the access check, media files are sent by Django ('') or handed to the
+# web server: 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd)
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE', '')
+# nginx `internal` location aliasing MEDIA_ROOT, used with x-accel-redirect
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+# Signed URLs (app/signed_urls.py), in seconds. Media URLs stay valid for at least half of
+# SIGNED_MEDIA_URL_MAX_AGE after they are issued; other URLs (event streams) for SIGNED_URL_MAX_AGE.
+SIGNED_MEDIA_URL_MAX_AGE = int(os.getenv('SIGNED_MEDIA_URL_MAX_AGE', '7200'))
+SIGNED_URL_MAX_AGE = int(os.getenv('SIGNED_URL_MAX_AGE', '60'))
+
+# Temp files for in-progress chunked uploads
+CHUNKED_UPLOAD_DIR = os.getenv('CHUNKED_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'chunked_uploads'))
+# Upload sessions that received no chunk for this long (seconds) expire; prune_upload_sessions deletes them.
+UPLOAD_SESSION_EXPIRY = int(os.getenv('UPLOAD_SESSION_EXPIRY', str(24 * 3600)))
+
+# Cache for class, question and roster listings (see app/caching.py).
+# The file backend lets every worker process share entries and hit/miss counts.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'powerpoint_addin_cache')),
+    }
+}
+READ_CACHE_TIMEOUT = int(os.getenv('READ_CACHE_TIMEOUT', '3600'))  # Seconds; entries are also invalidated on change
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -145,7 +187,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'app.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -160,6 +202,16 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Range and If-Range let the add-in resume answer exports
+from corsheaders.defaults import default_headers
+CORS_ALLOW_HEADERS = (*default_headers, 'range', 'if-range')
+
+# Let the add-in read the query-count headers (see QUERY_COUNT_HEADER) and resume downloads
+CORS_EXPOSE_HEADERS = [
+    'X-DB-Query-Count', 'X-DB-Query-Time-Ms', 'Server-Timing',
+    'Content-Disposition', 'Content-Range', 'Accept-Ranges', 'ETag',
+]
+
 # JWT Settings
 from datetime import timedelta
 
@@ -168,7 +220,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
-    'UPDATE_LAST_LOGIN': True,
+    # Logins record last_login themselves, at most once per LAST_LOGIN_UPDATE_INTERVAL
+    'UPDATE_LAST_LOGIN': False,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'VERIFYING_KEY': None,
@@ -189,5 +242,44 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Requests are authenticated from the token's claims (app/authentication.py).
+# Whether an account is still active is cached per process for this many
+# seconds, so deactivating a user takes effect within AUTH_USER_STATE_TTL.
+AUTH_USER_STATE_TTL = int(os.getenv('AUTH_USER_STATE_TTL', '60'))
+AUTH_USER_STATE_CACHE_SIZE = 10000
+LAST_LOGIN_UPDATE_INTERVAL = int(os.getenv('LAST_LOGIN_UPDATE_INTERVAL', '3600'))  # Seconds
+
 # Custom User Model
 AUTH_USER_MODEL = 'app.Instructor'
+
+# Report per-request query count and DB time in response headers (see app.middleware)
+QUERY_COUNT_HEADER = os.getenv('QUERY_COUNT_HEADER', 'False').lower() == 'true'
+
+# Live answer events (Server-Sent Events)
+# Leave ANSWER_EVENTS_REDIS_URL empty to fan out in-process (single worker);
+# point it at Redis or a Redis-compatible server when running several workers.
+ANSWER_EVENTS_REDIS_URL = os.getenv('ANSWER_EVENTS_REDIS_URL', '')
+ANSWER_EVENTS_HEARTBEAT = int(os.getenv('ANSWER_EVENTS_HEARTBEAT', '15'))
+
+# Answer delta polling (?since=<cursor>)
+# Each poll reads this many seconds below its cursor again, for rows whose transaction committed late.
+ANSWER_DELTA_OVERLAP = int(os.getenv('ANSWER_DELTA_OVERLAP', '30'))
+# Tombstones of deleted answers are kept this long (seconds); older cursors get a full resync.
+ANSWER_TOMBSTONE_RETENTION = int(os.getenv('ANSWER_TOMBSTONE_RETENTION', str(7 * 24 * 3600)))
+
+# Async student views (app/async_views.py)
+# config/asgi.py turns these on; WSGI servers keep the sync DRF views.
+ASYNC_STUDENT_VIEWS = os.getenv('ASYNC_STUDENT_VIEWS', 'False').lower() == 'true'
+
+# Background image processing
+# When enabled, uploads return 202 and are processed by `manage.py run_image_workers`,
+# which has to be running; off, images are processed on the request.
+IMAGE_JOBS_ASYNC = os.getenv('IMAGE_JOBS_ASYNC', 'False').lower() == 'true'
+IMAGE_JOBS_LEASE = 300  # Seconds before a job held by a dead worker is reclaimed
+IMAGE_JOBS_MAX_ATTEMPTS = 3
+
+# Upload normalization (app/ingest.py)
+# Uploads are turned upright, stripped of metadata and downscaled to fit IMAGE_MAX_DIMENSION.
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', '1920'))
+IMAGE_MAX_PIXELS = 40_000_000  # Larger uploads are refused before they are decoded
+IMAGE_INGEST_QUALITY = 85